@@ -1,11 +1,17 @@
+import math
+import multiprocessing
 import os
 
 import random
+import time
 from abc import ABC, abstractmethod
 
 import chess
 import chess.polyglot
 
+import batch_eval
+import position_codec
+
 os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = "hide"
 
 
@@ -60,6 +66,363 @@ class BetterRandom(Agent):
             return random.choice([move for move in legal_moves])
 
 
+class MCTSConfig:
+    PLAYOUTS = 2000  # Leaf evaluations per move, shared between the workers
+    TIME_LIMIT = math.inf  # Seconds per move; the search stops on whichever budget runs out first
+    WORKERS = 1  # Trees searched in parallel processes and summed at the root; 1 searches in this process
+    BATCH_SIZE = 32  # Leaves selected under virtual loss before they are evaluated together
+    EXPLORATION = 1.4  # UCT exploration constant
+    VIRTUAL_LOSS = 1  # Visits counted as losses along a path while its leaf waits to be evaluated
+    ROLLOUT_PLIES = 0  # BetterRandom-style moves played out from each leaf before evaluating; 0 evaluates the leaf
+    EVAL_SCALE = 400  # Eval advantage at which a side is counted ten times as likely to win as to lose
+    REUSE_TREE = True  # Keep the subtree under the moves played since the last search
+    HISTORY = 100  # Moves of game history sent to workers, so their trees see repetitions
+
+
+class MCTSNode:
+    """
+    A position in the tree, reached by playing move from parent. value_sum adds up the playout results through it for
+    the side that played move, each from 0 for a loss to 1 for a win
+    """
+
+    __slots__ = ["move", "parent", "children", "untried", "visits", "value_sum", "terminal"]
+
+    def __init__(self, move, parent):
+        self.move = move
+        self.parent = parent
+        self.children = []
+        self.untried = None  # Legal moves not yet expanded, generated the first time the node is reached
+        self.visits = 0
+        self.value_sum = 0.0
+        self.terminal = None  # Result for the side that played move, once the game is known to be over here
+
+
+class MCTSTree:
+    """One UCT search tree and the board at its root"""
+
+    def __init__(self):
+        self.rng = random.Random()
+        self.root = None
+        self.board = None
+        self.reused = 0
+
+        # Of the last search
+        self.evals = 0
+        self.max_depth = 0
+
+    def set_root(self, board: chess.Board):
+        """Roots the tree at board, keeping the subtree under it if board was reached from the old root"""
+        root = self.find_descendant(board) if MCTSConfig.REUSE_TREE and self.root is not None else None
+        if root is None:
+            root = MCTSNode(None, None)
+        # Cut the rest of the old tree loose, so it can be freed
+        root.parent = None
+        if root.terminal is not None:
+            # Scored as a draw below the old root, but a draw that can be claimed is still played on from the root
+            root.terminal = None
+            root.untried = None
+        self.reused = root.visits
+        self.root = root
+        self.board = board.copy()
+
+    def find_descendant(self, board: chess.Board):
+        # The agent's own move and the reply to it are usually all that has been played since the last search.
+        # Positions are matched by hash rather than by move history, which decoded boards may not have
+        target = chess.polyglot.zobrist_hash(board)
+        played = self.board.copy(stack=False)
+        if chess.polyglot.zobrist_hash(played) == target:
+            return self.root
+        for child in self.root.children:
+            played.push(child.move)
+            if chess.polyglot.zobrist_hash(played) == target:
+                return child
+            for grandchild in child.children:
+                played.push(grandchild.move)
+                found = chess.polyglot.zobrist_hash(played) == target
+                played.pop()
+                if found:
+                    return grandchild
+            played.pop()
+        return None
+
+    def search(self, playouts: int, deadline: float) -> int:
+        """Runs playouts from the root until either budget is spent, returning how many were run"""
+        self.evals = 0
+        self.max_depth = 0
+        done = 0
+        while done < playouts and (done == 0 or time.perf_counter() < deadline):
+            done += self.run_batch(min(MCTSConfig.BATCH_SIZE, playouts - done))
+        return done
+
+    def run_batch(self, size: int) -> int:
+        pending = []  # (path, colour that played the leaf's move, board to evaluate)
+        for i in range(size):
+            path = self.select()
+            leaf = path[-1]
+            self.max_depth = max(self.max_depth, len(path) - 1)
+            if leaf.terminal is not None:
+                self.backup(path, leaf.terminal, 0)
+            else:
+                # Virtual loss makes the rest of the batch prefer other paths to this one
+                for node in path:
+                    node.visits += MCTSConfig.VIRTUAL_LOSS
+                mover = not self.board.turn
+                board = self.board.copy(stack=False)
+                result = self.rollout(board)
+                if result is not None:
+                    self.backup(path, result if mover == chess.WHITE else 1 - result, MCTSConfig.VIRTUAL_LOSS)
+                else:
+                    pending.append((path, mover, board))
+
+            for j in range(len(path) - 1):
+                self.board.pop()
+
+        if pending:
+            self.evals += len(pending)
+            white_results = self.evaluate([board for path, mover, board in pending])
+            for (path, mover, board), result in zip(pending, white_results):
+                self.backup(path, result if mover == chess.WHITE else 1 - result, MCTSConfig.VIRTUAL_LOSS)
+        return size
+
+    def select(self) -> [MCTSNode]:
+        """Path from the root to a newly expanded leaf, or to a finished game, with its moves pushed onto board"""
+        node = self.root
+        path = [node]
+        while True:
+            if node.untried is None:
+                self.expand(node)
+            if node.terminal is not None:
+                return path
+
+            if node.untried:
+                child = MCTSNode(node.untried.pop(), node)
+                node.children.append(child)
+                self.board.push(child.move)
+                self.expand(child)
+                path.append(child)
+                return path
+
+            node = self.best_child(node)
+            self.board.push(node.move)
+            path.append(node)
+
+    def expand(self, node: MCTSNode):
+        # The position of node is the one on board. Draws that could be claimed end the game below the root, but
+        # the root itself is only searched when the game has gone on, so it always gets its moves
+        node.untried = list(self.board.legal_moves)
+        self.rng.shuffle(node.untried)
+        if not node.untried:
+            node.terminal = 1.0 if self.board.is_check() else 0.5
+        elif node is not self.root and (self.board.is_insufficient_material() or self.board.halfmove_clock >= 100 or
+                                        self.board.is_repetition(3)):
+            node.terminal = 0.5
+
+    @staticmethod
+    def best_child(node: MCTSNode) -> MCTSNode:
+        log_visits = math.log(max(node.visits, 1))
+
+        def uct(child: MCTSNode) -> float:
+            if child.visits == 0:
+                return math.inf
+            return child.value_sum / child.visits + MCTSConfig.EXPLORATION * math.sqrt(log_visits / child.visits)
+
+        return max(node.children, key=uct)
+
+    @staticmethod
+    def backup(path: [MCTSNode], result: float, virtual_loss: int):
+        """Adds result, for the side that played the leaf's move, to every node on path, taking back virtual loss"""
+        for node in reversed(path):
+            node.visits += 1 - virtual_loss
+            node.value_sum += result
+            result = 1 - result
+
+    def rollout(self, board: chess.Board):
+        """
+        Plays up to ROLLOUT_PLIES BetterRandom-style moves on board: mate if possible, else a random check or
+        capture, else any random move. White's result if the game ends, otherwise None, leaving board to evaluate
+        """
+        for i in range(MCTSConfig.ROLLOUT_PLIES):
+            moves = list(board.legal_moves)
+            if not moves:
+                if board.is_check():
+                    return 0.0 if board.turn == chess.WHITE else 1.0
+                return 0.5
+            if board.is_insufficient_material():
+                return 0.5
+
+            forcing = []
+            mate = None
+            for move in moves:
+                if board.gives_check(move):
+                    board.push(move)
+                    if board.is_checkmate():
+                        mate = move
+                    board.pop()
+                    forcing.append(move)
+                elif board.is_capture(move):
+                    forcing.append(move)
+                if mate is not None:
+                    break
+            board.push(mate if mate is not None else self.rng.choice(forcing or moves))
+        return None
+
+    @staticmethod
+    def evaluate(boards: [chess.Board]):
+        """White's chances in each of boards, from a single vectorised piece-square evaluation of them all"""
+        scores = batch_eval.evaluate_pst_batch(batch_eval.PositionBatch(boards, legal_moves=False).planes)
+        return (1 / (1 + 10 ** (-scores / MCTSConfig.EVAL_SCALE))).tolist()
+
+    def root_stats(self) -> dict:
+        """Visits and value sum of each root move, by UCI"""
+        return {child.move.uci(): (child.visits, child.value_sum) for child in self.root.children}
+
+    def principal_variation(self) -> [str]:
+        """UCI moves of the most visited line from the root"""
+        pv = []
+        node = self.root
+        while node.children:
+            node = max(node.children, key=lambda child: child.visits)
+            pv.append(node.move.uci())
+        return pv
+
+
+class MCTSStats:
+    """The counters of search_stats.SearchStats that bench.py reads, for one MCTSAgent search"""
+
+    tt_hit_rate = None  # There is no transposition table
+
+    def __init__(self, playouts: int, evals: int, reused: int, elapsed: float):
+        self.playouts = playouts
+        self.evals = evals  # Leaves scored by the batch evaluator, so not finished games
+        self.reused = reused
+        self.elapsed = elapsed
+
+    def to_dict(self) -> dict:
+        return {"playouts": self.playouts, "evals": self.evals, "reused": self.reused, "time": self.elapsed,
+                "tt_hit_rate": self.tt_hit_rate}
+
+
+def mcts_worker(connection):
+    # Each worker keeps one tree for as long as the agent lives, so it can be reused from move to move
+    tree = MCTSTree()
+    while True:
+        job = connection.recv()
+        if job is None:
+            break
+        encoded, playouts, time_limit = job
+        tree.set_root(position_codec.decode(encoded))
+        done = tree.search(playouts, time.perf_counter() + time_limit)
+        connection.send((done, tree.reused, tree.root_stats(), tree.evals, tree.max_depth))
+    connection.close()
+
+
+class MCTSAgent(Agent):
+    """
+    Monte Carlo tree search with UCT. Leaves are selected a batch at a time, virtual loss spreading each batch over
+    the tree, and evaluated together by batch_eval, optionally after a short random playout. With more than one
+    worker, each worker process grows its own tree from the position and the visits of their root moves are summed
+    (root parallelism). Trees are kept between moves, and the subtree under the moves since played is reused.
+    time_limit is wall time, so with several workers the CPU time spent is workers times it. playouts may be
+    math.inf to search by time alone.
+
+    Searches are recorded as the minimax agents record theirs, as far as they apply: a single entry in iterations,
+    with the chosen move's value as an eval, max_depth for the deepest line reached and stats for bench.py
+    """
+
+    def __init__(self, board: chess.Board, playouts: int = None, time_limit: float = None, workers: int = None):
+        super().__init__(board)
+        self.playouts = MCTSConfig.PLAYOUTS if playouts is None else playouts
+        self.time_limit = MCTSConfig.TIME_LIMIT if time_limit is None else time_limit
+        self.workers = MCTSConfig.WORKERS if workers is None else workers
+        self.eval_description = "MCTS, {} playouts over {} trees, piece-square eval{}".format(
+            self.playouts, self.workers,
+            " after {} ply rollouts".format(MCTSConfig.ROLLOUT_PLIES) if MCTSConfig.ROLLOUT_PLIES else "")
+
+        self.nodes = 0  # Playouts over every search, comparable to the nodes of the minimax agents
+        self.reused = 0  # Visits kept from the previous search at the root of the last one
+        self.root_stats = {}
+        self.iterations = []
+        self.max_depth = 0
+        self.stats: MCTSStats = None
+        self.eval_cache = None
+        self.pawn_cache = None
+        self.tree = MCTSTree()
+        self.connections = []
+        self.processes = []
+
+    def find_move(self) -> chess.Move:
+        start = time.perf_counter()
+        if self.workers > 1:
+            done, self.reused, self.root_stats, evals, self.max_depth = self.search_workers()
+            pv = []
+        else:
+            self.tree.set_root(self.board)
+            done = self.tree.search(self.playouts, start + self.time_limit)
+            self.reused = self.tree.reused
+            self.root_stats = self.tree.root_stats()
+            evals = self.tree.evals
+            self.max_depth = self.tree.max_depth
+            pv = self.tree.principal_variation()
+        elapsed = time.perf_counter() - start
+        self.nodes += done
+
+        best = max(self.root_stats, key=lambda uci: self.root_stats[uci][0])
+        visits, value_sum = self.root_stats[best]
+        move_eval = self.value_eval(value_sum / visits)
+        if not pv or pv[0] != best:
+            pv = [best]
+        self.stats = MCTSStats(done, evals, self.reused, elapsed)
+        self.iterations = [{"depth": self.max_depth, "move": best, "eval": move_eval, "nodes": done, "time": elapsed,
+                            "pvs": [{"move": best, "eval": move_eval, "pv": pv}]}]
+        return chess.Move.from_uci(best)
+
+    @staticmethod
+    def value_eval(value: float) -> float:
+        """A win chance for the side to move back in evaluation units, the inverse of MCTSTree.evaluate"""
+        value = min(max(value, 1e-6), 1 - 1e-6)
+        return MCTSConfig.EVAL_SCALE * math.log10(value / (1 - value))
+
+    def search_workers(self):
+        if not self.processes:
+            for i in range(self.workers):
+                parent, child = multiprocessing.Pipe()
+                process = multiprocessing.Process(target=mcts_worker, args=(child,), daemon=True)
+                process.start()
+                self.connections.append(parent)
+                self.processes.append(process)
+
+        encoded = position_codec.encode(self.board, MCTSConfig.HISTORY)
+        for i, connection in enumerate(self.connections):
+            if math.isinf(self.playouts):
+                share = self.playouts
+            else:
+                share = max(self.playouts // self.workers + (1 if i < self.playouts % self.workers else 0), 1)
+            connection.send((encoded, share, self.time_limit))
+
+        done = reused = evals = max_depth = 0
+        stats = {}
+        for connection in self.connections:
+            worker_done, worker_reused, worker_stats, worker_evals, worker_depth = connection.recv()
+            done += worker_done
+            reused += worker_reused
+            evals += worker_evals
+            max_depth = max(max_depth, worker_depth)
+            for uci, (visits, value_sum) in worker_stats.items():
+                total_visits, total_value = stats.get(uci, (0, 0.0))
+                stats[uci] = (total_visits + visits, total_value + value_sum)
+        return done, reused, stats, evals, max_depth
+
+    def close(self):
+        """Stops the worker processes, if any were started"""
+        for connection in self.connections:
+            connection.send(None)
+            connection.close()
+        for process in self.processes:
+            process.join()
+        self.connections = []
+        self.processes = []
+
+
 def make_opening_move(board: chess.Board):
     moves = []
     fen = board.fen()
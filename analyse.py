@@ -0,0 +1,170 @@
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import sys
+import threading
+import time
+
+import chess
+
+import main
+import minimax
+
+
+class AnalyseConfig:
+    AGENT = "MiniMaxComplex"
+    DEPTH = 4
+    MAX_DEPTH = 64  # Depth searched to when only a node or time limit is given
+    WORKERS = os.cpu_count() or 1
+    MULTI_PV = 1
+
+    # Positions read ahead of the one being written, per worker; this bounds memory however long the input is
+    WINDOW = 8
+
+
+def parse_position(line: str):
+    """(board, EPD operations) from a FEN or EPD line"""
+    try:
+        return chess.Board(line), {}
+    except ValueError:
+        return chess.Board.from_epd(line)
+
+
+def read_positions(io, window: threading.Semaphore, stopped: threading.Event):
+    """Yields (line number, text) of every position line, waiting for room in window before reading each one"""
+    for line_number, line in enumerate(io, 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        window.acquire()
+        if stopped.is_set():
+            return
+        yield line_number, line
+
+
+def init_worker():
+    # Analysis searches every position itself, and workers must not print or write index files
+    main.Config.OPENING_BOOK = False
+    main.Config.INDEX_MODE = False
+    main.Config.DEBUG = False
+    main.Config.INFO = False
+    main.Config.SEARCH_STATS = False
+    main.Config.TRACE = False
+
+
+def analyse_position(job) -> dict:
+    (line_number, line), agent_name, depth, node_limit, time_limit, multi_pv = job
+    result = {"line": line_number}
+    try:
+        board, operations = parse_position(line)
+    except ValueError as ex:
+        result["error"] = str(ex)
+        return result
+
+    result["fen"] = board.fen()
+    if "id" in operations:
+        result["id"] = operations["id"]
+    if board.is_game_over():
+        result["error"] = "game over"
+        return result
+
+    start = time.perf_counter()
+    agent = getattr(minimax, agent_name)(board, depth)
+    agent.time_limit = math.inf if time_limit is None else time_limit
+    agent.node_limit = node_limit
+    agent.hard_time_limit = agent.time_limit
+    agent.hard_node_limit = node_limit
+    agent.multi_pv = multi_pv
+    move = agent.find_move()
+    last = agent.iterations[-1]
+
+    result.update({"move": move.uci(), "san": board.san(move), "score": last["eval"], "depth": last["depth"],
+                   "nodes": agent.nodes, "time": time.perf_counter() - start,
+                   "pv": last["pvs"][0]["pv"] if last["pvs"] else [move.uci()]})
+    if multi_pv > 1:
+        result["pvs"] = last["pvs"]
+
+    # EPD test suites give best moves to find or moves to avoid
+    if "bm" in operations:
+        result["solved"] = move in operations["bm"]
+    elif "am" in operations:
+        result["solved"] = move not in operations["am"]
+    return result
+
+
+def json_line(result: dict) -> str:
+    # Mate scores are infinite, which JSON can't represent
+    score = result.get("score")
+    if score is not None and math.isinf(score):
+        result["score"] = math.copysign(1e9, score)
+    for pv in result.get("pvs", []):
+        if math.isinf(pv["eval"]):
+            pv["eval"] = math.copysign(1e9, pv["eval"])
+    return json.dumps(result) + "\n"
+
+
+def analyse(input_io, output_io, agent_name: str, depth: int, node_limit: int, time_limit: float, workers: int,
+            ordered: bool, multi_pv: int):
+    """
+    Analyses every FEN or EPD line of input_io, writing a JSON line per position as soon as it is done, or in input
+    order if ordered. Only a window of positions per worker is read ahead of the output
+    """
+    window = threading.Semaphore(max(1, workers) * AnalyseConfig.WINDOW)
+    stopped = threading.Event()
+    jobs = ((position, agent_name, depth, node_limit, time_limit, multi_pv)
+            for position in read_positions(input_io, window, stopped))
+
+    analysed = 0
+    start = time.perf_counter()
+    with multiprocessing.Pool(workers, initializer=init_worker) as pool:
+        try:
+            results = pool.imap(analyse_position, jobs) if ordered else pool.imap_unordered(analyse_position, jobs)
+            for result in results:
+                output_io.write(json_line(result))
+                output_io.flush()
+                window.release()
+                analysed += 1
+        finally:
+            # The pool's feeder thread may be waiting on the window, and has to finish for the pool to close
+            stopped.set()
+            window.release()
+
+    elapsed = time.perf_counter() - start
+    print("Analysed {} positions in {:.1f}s ({:.1f}/s)".format(analysed, elapsed, analysed / elapsed if elapsed else 0),
+          file=sys.stderr)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Analyse FEN or EPD positions, writing one JSON line each")
+    parser.add_argument("input", nargs="?", default="-", help="file of FEN or EPD lines, or - for stdin")
+    parser.add_argument("--output", default="-", help="JSON lines file, or - for stdout")
+    parser.add_argument("--agent", default=AnalyseConfig.AGENT)
+    parser.add_argument("--depth", type=int, help="search depth (default {}, or {} with --nodes or --time)".format(
+        AnalyseConfig.DEPTH, AnalyseConfig.MAX_DEPTH))
+    parser.add_argument("--nodes", type=int, help="stop searching once this many nodes have been searched, keeping the "
+                                                  "last completed depth (within 1024 nodes)")
+    parser.add_argument("--time", type=float, help="stop searching after this many seconds, keeping the last "
+                                                   "completed depth")
+    parser.add_argument("--multipv", type=int, default=AnalyseConfig.MULTI_PV)
+    parser.add_argument("--workers", type=int, default=AnalyseConfig.WORKERS)
+    parser.add_argument("--ordered", action="store_true", help="write results in input order")
+    args = parser.parse_args()
+
+    if not hasattr(minimax, args.agent):
+        parser.error("unknown agent {}".format(args.agent))
+    search_depth = args.depth
+    if search_depth is None:
+        search_depth = AnalyseConfig.DEPTH if args.nodes is None and args.time is None else AnalyseConfig.MAX_DEPTH
+
+    input_file = sys.stdin if args.input == "-" else open(args.input, "r")
+    output_file = sys.stdout if args.output == "-" else open(args.output, "w")
+    try:
+        analyse(input_file, output_file, args.agent, search_depth, args.nodes, args.time, args.workers, args.ordered,
+                args.multipv)
+    finally:
+        if input_file is not sys.stdin:
+            input_file.close()
+        if output_file is not sys.stdout:
+            output_file.close()
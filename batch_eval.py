@@ -0,0 +1,147 @@
+import math
+
+import chess
+import numpy as np
+
+import evaluate
+import pst
+
+# Plane order of encoded positions: white pawn..king, then black pawn..king
+PLANES = [(color, piece_type) for color in (chess.WHITE, chess.BLACK) for piece_type in chess.PIECE_TYPES]
+
+
+def encode_bitboards(boards: [chess.Board]) -> np.ndarray:
+    """Packs N boards into an (N, 12) array of uint64 piece bitboards"""
+    bitboards = np.empty((len(boards), len(PLANES)), dtype="<u8")
+    for i, board in enumerate(boards):
+        bitboards[i] = [board.pieces_mask(piece_type, color) for color, piece_type in PLANES]
+    return bitboards
+
+
+def unpack_planes(bitboards: np.ndarray) -> np.ndarray:
+    """Expands (N, 12) uint64 bitboards to (N, 12, 64) uint8 planes indexed by square"""
+    as_bytes = bitboards.astype("<u8", copy=False).view(np.uint8).reshape(len(bitboards), len(PLANES), 8)
+    return np.unpackbits(as_bytes, axis=2, bitorder="little")
+
+
+def encode_boards(boards: [chess.Board]) -> np.ndarray:
+    return unpack_planes(encode_bitboards(boards))
+
+
+class PositionBatch:
+    """
+    N positions encoded once for the batch evaluators. Piece placement is held as (N, 12, 64) planes; the legal
+    move count and checkmate/stalemate score need move generation, so they are only filled in when legal_moves is
+    set, and evaluators that use them require it.
+    """
+
+    def __init__(self, boards: [chess.Board], legal_moves: bool = True):
+        self.bitboards = encode_bitboards(boards)
+        self.planes = unpack_planes(self.bitboards)
+        self.turn = np.array([board.turn for board in boards], dtype=bool)
+
+        self.legal_move_counts = None
+        self.terminal = None
+        if legal_moves:
+            self.legal_move_counts = np.empty(len(boards), dtype=np.int32)
+            self.terminal = np.full(len(boards), np.nan)
+            for i, board in enumerate(boards):
+                count = board.legal_moves.count()
+                self.legal_move_counts[i] = count
+                if count == 0:
+                    self.terminal[i] = (-1e9 if board.turn else 1e9) if board.is_check() else 0
+
+    def __len__(self):
+        return len(self.planes)
+
+    def piece_counts(self) -> np.ndarray:
+        return self.planes.sum(axis=2, dtype=np.int32)
+
+    def with_terminal(self, scores: np.ndarray, inverted_mates: bool = False) -> np.ndarray:
+        """
+        scores with checkmates and stalemates scored as evaluate.terminal_score does, or with the mated side
+        winning, as the original evaluators have it, if inverted_mates is set
+        """
+        if self.terminal is None:
+            raise ValueError("PositionBatch was encoded without legal_moves")
+        terminal = -self.terminal if inverted_mates else self.terminal
+        return np.where(np.isnan(terminal), scores, terminal)
+
+
+def iter_batches(boards, size: int = 1 << 16, legal_moves: bool = True):
+    """Encodes any iterable of boards in fixed size batches, so memory stays bounded however many there are"""
+    chunk = []
+    for board in boards:
+        chunk.append(board)
+        if len(chunk) >= size:
+            yield PositionBatch(chunk, legal_moves)
+            chunk = []
+    if chunk:
+        yield PositionBatch(chunk, legal_moves)
+
+
+def plane_table(flat_tables) -> np.ndarray:
+    """Rearranges per-colour tables indexed by piece_type * 64 + square into a (12, 64) array matching PLANES"""
+    table = np.zeros((len(PLANES), 64), dtype=np.int32)
+    for plane, (color, piece_type) in enumerate(PLANES):
+        table[plane] = flat_tables[color][piece_type * 64:(piece_type + 1) * 64]
+    return table
+
+
+PST_MIDDLEGAME = plane_table(pst.MIDDLEGAME)
+PST_ENDGAME = plane_table(pst.ENDGAME)
+# Float, since tuned weights need not be whole numbers
+PIECE_VALUES = np.array([evaluate.get_piece_value(chess.Piece(piece_type, color)) for color, piece_type in PLANES],
+                        dtype=np.float64)
+
+
+def square_weights(squares: [chess.Square]) -> np.ndarray:
+    # Counts rather than a mask, so a square listed twice is counted twice as it is by the scalar loops
+    return np.bincount(np.array(squares, dtype=np.int64), minlength=64).astype(np.int64)
+
+
+def complex_square_table() -> np.ndarray:
+    """(12, 64) knight edge punishments and pawn/knight centre bonuses of evaluate_complex"""
+    table = np.zeros((len(PLANES), 64), dtype=np.float64)
+    edge = square_weights(evaluate.edge_squares)
+    centre = square_weights(evaluate.centre_squares)
+    for plane, (color, piece_type) in enumerate(PLANES):
+        if piece_type == chess.KNIGHT:
+            penalty = evaluate.EvalWeights.KNIGHT_EDGE_PENALTY
+            table[plane] += edge * (-penalty if color == chess.WHITE else penalty)
+        if piece_type in [chess.PAWN, chess.KNIGHT]:
+            value = evaluate.get_piece_value(chess.Piece(piece_type, color))
+            table[plane] += centre * math.floor(value * evaluate.EvalWeights.CENTRE_FRACTION)
+    return table
+
+
+COMPLEX_SQUARES = complex_square_table()
+
+PHASE_WEIGHTS = np.array([pst.PHASE_WEIGHTS[piece_type] for color, piece_type in PLANES], dtype=np.int32)
+
+
+def evaluate_pst_batch(planes: np.ndarray) -> np.ndarray:
+    """pst.evaluate_pst for every position in (N, 12, 64) planes"""
+    flat = planes.reshape(len(planes), -1).astype(np.int32)
+    middlegame = flat @ PST_MIDDLEGAME.reshape(-1)
+    endgame = flat @ PST_ENDGAME.reshape(-1)
+    phase = np.minimum(planes.sum(axis=2, dtype=np.int32) @ PHASE_WEIGHTS, pst.MAX_PHASE)
+    return (middlegame * phase + endgame * (pst.MAX_PHASE - phase)) / pst.MAX_PHASE
+
+
+def evaluate_material_batch(batch: PositionBatch) -> np.ndarray:
+    """evaluate.evaluate_material for every position in batch"""
+    return batch.with_terminal(batch.piece_counts() @ PIECE_VALUES, inverted_mates=True)
+
+
+def evaluate_complex_batch(batch: PositionBatch) -> np.ndarray:
+    """evaluate.evaluate_complex for every position in batch"""
+    material = 2 * (batch.piece_counts() @ PIECE_VALUES)
+    squares = batch.planes.reshape(len(batch), -1).astype(np.float64) @ COMPLEX_SQUARES.reshape(-1)
+    return batch.with_terminal(batch.legal_move_counts * evaluate.EvalWeights.MOBILITY + material + squares,
+                               inverted_mates=True)
+
+
+def evaluate_position_batch(batch: PositionBatch) -> np.ndarray:
+    """MiniMaxPosition.evaluate_board for every position in batch"""
+    return batch.with_terminal(evaluate_pst_batch(batch.planes))
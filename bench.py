@@ -0,0 +1,241 @@
+import argparse
+import json
+import math
+import os
+import platform
+import sys
+import time
+
+import chess
+
+import main
+import minimax
+from agent import MCTSAgent
+
+
+class BenchConfig:
+    DEPTH = 3  # Fixed iterative deepening depth for every agent
+    NODE_LIMIT = None  # Stop deepening once this many nodes have been searched (None = depth only)
+
+    PUZZLES = 0  # Bench the first N puzzles from the puzzle CSV instead of the built-in positions
+
+    # MCTSAgent is benched against negamax at equal CPU time: on each position it gets the time MCTS_REFERENCE took,
+    # split between its workers. The reference shares its piece-square evaluation
+    MCTS = False
+    MCTS_REFERENCE = "MiniMaxPosition"
+    MCTS_WORKERS = 1
+
+    OUTPUT = "bench_output.json"
+    BASELINE = "bench_baseline.json"
+
+    NODES_THRESHOLD = 0.05  # Allowed relative change in node counts before failing
+    NPS_THRESHOLD = 0.15  # Allowed relative drop in nodes/sec before failing
+
+
+# Fixed, hand-picked positions: opening, middlegames, tactics and endgames
+BENCH_FENS = [
+    "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 1",
+    "r1bqkb1r/pppp1ppp/2n2n2/4p3/2B1P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 4 4",
+    "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 10",
+    "r4rk1/pp3ppp/2n1b3/q1pp2B1/8/P1Q2NP1/1PP1PP1P/2KR3R w - - 0 15",
+    "2r3k1/p4p2/3Rp2p/1p2P1pK/8/1P4P1/P3Q2P/1q6 b - - 0 28",
+    "6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - 0 30",
+    "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 40",
+    "8/8/4k3/8/2K5/3P4/8/8 w - - 0 50",
+]
+
+BENCH_AGENTS = [minimax.MiniMaxMaterial, minimax.MiniMaxMobility, minimax.MiniMaxPosition, minimax.MiniMaxComplex]
+
+
+def load_positions(puzzle_count: int):
+    if puzzle_count <= 0:
+        return list(BENCH_FENS)
+
+    import puzzle
+
+    puzzle.PuzConfig.LOAD_TESTS = puzzle_count
+    fens = []
+    for puz in puzzle.load_puzzles():
+        # Puzzles start before the opponent's move; bench the position the solver actually sees
+        board = chess.Board(puz.fen)
+        board.push(puz.move(0))
+        fens.append(board.fen())
+    return fens
+
+
+def bench_position(agent_cls, fen: str, depth: int, node_limit):
+    agent = agent_cls(chess.Board(fen), depth)
+    agent.time_limit = float("inf")
+    agent.node_limit = node_limit
+    return bench_agent(agent, fen)
+
+
+def bench_mcts(fen: str, cpu_time: float, workers: int):
+    """MCTSAgent on fen, searching until it has had cpu_time seconds over all of its workers"""
+    agent = MCTSAgent(chess.Board(fen), playouts=math.inf, time_limit=cpu_time / workers, workers=workers)
+    try:
+        result = bench_agent(agent, fen)
+    finally:
+        agent.close()
+    result["cpu_time"] = result["time"] * workers
+    return result
+
+
+def bench_agent(agent, fen: str):
+    start = time.perf_counter()
+    move = agent.find_move()
+    elapsed = time.perf_counter() - start
+
+    iterations = agent.iterations
+    branching = None
+    if len(iterations) >= 2 and iterations[-2]["nodes"] > 0:
+        branching = iterations[-1]["nodes"] / iterations[-2]["nodes"]
+
+    return {
+        "fen": fen,
+        "move": None if move is None else move.uci(),
+        "depth": agent.max_depth,
+        "nodes": agent.nodes,
+        "evals": agent.stats.evals,
+        "time": elapsed,
+        "nps": agent.nodes / elapsed if elapsed > 0 else 0,
+        "tt_hit_rate": agent.stats.tt_hit_rate,
+        "eval_cache_hit_rate": agent.eval_cache.hit_rate if agent.eval_cache is not None else None,
+        "pawn_cache_hit_rate": agent.pawn_cache.hit_rate if agent.pawn_cache is not None else None,
+        "branching_factor": branching,
+        "time_to_depth": [it["time"] for it in iterations],
+        "stats": agent.stats.to_dict(),
+    }
+
+
+def summarise(runs) -> dict:
+    nodes = sum(r["nodes"] for r in runs)
+    elapsed = sum(r["time"] for r in runs)
+    return {
+        "positions": runs,
+        "nodes": nodes,
+        "time": elapsed,
+        "nps": nodes / elapsed if elapsed > 0 else 0,
+    }
+
+
+def run_bench(positions, depth: int, node_limit, mcts_workers: int = None):
+    """Benches every BENCH_AGENTS agent on positions, and MCTSAgent with mcts_workers workers if given"""
+    results = {}
+    for agent_cls in BENCH_AGENTS:
+        runs = [bench_position(agent_cls, fen, depth, node_limit) for fen in positions]
+        results[agent_cls.__name__] = summarise(runs)
+
+    if mcts_workers is not None:
+        reference = results[BenchConfig.MCTS_REFERENCE]["positions"]
+        runs = [bench_mcts(fen, run["time"], mcts_workers) for fen, run in zip(positions, reference)]
+        results[MCTSAgent.__name__] = dict(summarise(runs), timed=True, workers=mcts_workers,
+                                           reference=BenchConfig.MCTS_REFERENCE,
+                                           cpu_time=sum(r["cpu_time"] for r in runs))
+
+    return {
+        "depth": depth,
+        "node_limit": node_limit,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "agents": results,
+    }
+
+
+def compare(run: dict, baseline: dict, nodes_threshold: float, nps_threshold: float):
+    """Returns a list of human readable regressions of run against baseline"""
+    regressions = []
+
+    if run["depth"] != baseline["depth"] or run["node_limit"] != baseline["node_limit"]:
+        return ["Baseline was recorded with different limits (depth {}, nodes {})".format(baseline["depth"],
+                                                                                          baseline["node_limit"])]
+
+    for name, result in run["agents"].items():
+        if name not in baseline["agents"]:
+            continue
+        base = baseline["agents"][name]
+
+        base_fens = [p["fen"] for p in base["positions"]]
+        if base_fens != [p["fen"] for p in result["positions"]]:
+            regressions.append("{}: baseline was recorded over different positions".format(name))
+            continue
+
+        # Timed searches run however many nodes fit in the time, so only their speed is compared
+        if base["nodes"] > 0 and not result.get("timed"):
+            change = (result["nodes"] - base["nodes"]) / base["nodes"]
+            if abs(change) > nodes_threshold:
+                regressions.append("{}: nodes {} -> {} ({:+.1%})".format(name, base["nodes"], result["nodes"], change))
+
+        if base["nps"] > 0:
+            change = (result["nps"] - base["nps"]) / base["nps"]
+            if change < -nps_threshold:
+                regressions.append("{}: nps {:.0f} -> {:.0f} ({:+.1%})".format(name, base["nps"], result["nps"],
+                                                                               change))
+
+        for base_pos, pos in zip(base["positions"], result["positions"]):
+            if base_pos["move"] != pos["move"]:
+                main.info("{}: best move changed {} -> {} for {}".format(name, base_pos["move"], pos["move"],
+                                                                         pos["fen"]))
+
+    return regressions
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Fixed-depth search benchmark for the MiniMax agents")
+    parser.add_argument("--depth", type=int, default=BenchConfig.DEPTH)
+    parser.add_argument("--nodes", type=int, default=BenchConfig.NODE_LIMIT, help="node limit per position")
+    parser.add_argument("--puzzles", type=int, default=BenchConfig.PUZZLES,
+                        help="bench the first N puzzles instead of the built-in positions")
+    parser.add_argument("--output", default=BenchConfig.OUTPUT)
+    parser.add_argument("--baseline", default=BenchConfig.BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the new baseline")
+    parser.add_argument("--mcts", action="store_true", default=BenchConfig.MCTS,
+                        help="also bench MCTSAgent, given the CPU time {} took on each position".format(
+                            BenchConfig.MCTS_REFERENCE))
+    parser.add_argument("--mcts-workers", type=int, default=BenchConfig.MCTS_WORKERS)
+    parser.add_argument("--nodes-threshold", type=float, default=BenchConfig.NODES_THRESHOLD)
+    parser.add_argument("--nps-threshold", type=float, default=BenchConfig.NPS_THRESHOLD)
+    return parser.parse_args(argv)
+
+
+def bench(argv=None) -> int:
+    args = parse_args(argv)
+
+    # Reproducible search: no opening book, no persisted index, no per-node output
+    main.Config.OPENING_BOOK = False
+    main.Config.INDEX_MODE = False
+    main.Config.DEBUG = False
+    main.Config.INFO = False
+    main.Config.SEARCH_STATS = True
+
+    run = run_bench(load_positions(args.puzzles), args.depth, args.nodes, args.mcts_workers if args.mcts else None)
+
+    with open(args.output, "w") as io:
+        json.dump(run, io, indent=2)
+
+    main.Config.INFO = True
+    for name, result in run["agents"].items():
+        main.info("{}\t{} nodes in {:.2f}s ({:.0f} nps)".format(name, result["nodes"], result["time"], result["nps"]))
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as io:
+            json.dump(run, io, indent=2)
+        main.info("Saved baseline to " + args.baseline)
+        return 0
+
+    if not os.path.exists(args.baseline):
+        main.info("No baseline at {}; run with --save-baseline to create one".format(args.baseline))
+        return 0
+
+    with open(args.baseline, "r") as io:
+        baseline = json.load(io)
+
+    regressions = compare(run, baseline, args.nodes_threshold, args.nps_threshold)
+    for regression in regressions:
+        print("REGRESSION " + regression)
+
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(bench())
@@ -0,0 +1,242 @@
+import argparse
+import mmap
+import os
+import time
+
+import chess
+import numpy as np
+
+
+class BitbaseConfig:
+    DIRECTORY = "bitbases"
+    # Generated in this order, since pawn promotions are looked up in the queen and rook tables
+    TABLES = ["KQK", "KRK", "KPK"]
+
+    WIN_SCORE = 20000  # Less the plies to mate; below the 100000 find_move treats as a found mate
+
+
+TABLE_PIECES = {"KQK": chess.QUEEN, "KRK": chess.ROOK, "KPK": chess.PAWN}
+MAX_PIECES = 3
+
+# One bit per (side to move, strong king, weak king, piece) with the strong side as white; the strong side can only
+# win or draw, so a set bit means it wins and a clear one means a draw. Each table also has a byte per position of
+# plies to mate, which lets the search make progress towards the win instead of shuffling between won positions
+POSITIONS = 2 * 64 * 64 * 64
+UNKNOWN = 255  # Distance of draws and illegal positions
+
+
+def index(strong_to_move: bool, strong_king: chess.Square, weak_king: chess.Square, piece: chess.Square) -> int:
+    return (((0 if strong_to_move else 1) * 64 + strong_king) * 64 + weak_king) * 64 + piece
+
+
+def generate(piece_type: chess.PieceType, promotions: dict) -> np.ndarray:
+    """
+    Retrograde analysis of king and piece against king, returning the plies to mate of every position (UNKNOWN for
+    draws and illegal positions). Every legal position's successors are listed once, then distances are relaxed from
+    the checkmates until nothing changes: the strong side takes its quickest mate and the weak side its slowest, and
+    a weak side position with any drawing move is a draw. Captures of the piece are draws, and promotions are looked
+    up in the already generated distance tables in promotions
+    """
+    # Successors may also be a fixed distance, for promotions and captures: node POSITIONS + d is always d plies
+    fixed_node = POSITIONS
+
+    board = chess.Board(None)
+    legal = np.zeros(POSITIONS, dtype=bool)
+    mated = np.zeros(POSITIONS, dtype=bool)
+    successors = [[] for i in range(POSITIONS)]
+
+    for strong_to_move in (True, False):
+        for strong_king in chess.SQUARES:
+            for weak_king in chess.SQUARES:
+                for piece in chess.SQUARES:
+                    if len({strong_king, weak_king, piece}) < 3:
+                        continue
+                    board.clear_board()
+                    board.set_piece_at(strong_king, chess.Piece(chess.KING, chess.WHITE))
+                    board.set_piece_at(weak_king, chess.Piece(chess.KING, chess.BLACK))
+                    board.set_piece_at(piece, chess.Piece(piece_type, chess.WHITE))
+                    board.turn = chess.WHITE if strong_to_move else chess.BLACK
+                    if not board.is_valid():
+                        continue
+
+                    position = index(strong_to_move, strong_king, weak_king, piece)
+                    legal[position] = True
+                    moves = successors[position]
+                    for move in board.generate_legal_moves():
+                        if not strong_to_move:
+                            moves.append(fixed_node + UNKNOWN if move.to_square == piece else
+                                         index(True, strong_king, move.to_square, piece))
+                        elif move.from_square == strong_king:
+                            moves.append(index(False, move.to_square, weak_king, piece))
+                        elif move.promotion is None:
+                            moves.append(index(False, strong_king, weak_king, move.to_square))
+                        elif move.promotion in promotions:
+                            distance = promotions[move.promotion][index(False, strong_king, weak_king, move.to_square)]
+                            moves.append(fixed_node + int(distance))
+                        else:
+                            moves.append(fixed_node + UNKNOWN)  # A lone bishop or knight can't mate
+                    if not moves and board.is_check():
+                        mated[position] = True
+
+    # Successor lists in compressed rows, split by side to move; positions without moves never change
+    def rows(positions):
+        counts = np.array([len(successors[position]) for position in positions], dtype=np.int64)
+        indices = np.fromiter((node for position in positions for node in successors[position]), dtype=np.int64,
+                              count=int(counts.sum()))
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        return np.array(positions, dtype=np.int64), indices, starts
+
+    half = POSITIONS // 2
+    strong_rows = rows([p for p in range(half) if legal[p] and successors[p]])
+    weak_rows = rows([p for p in range(half, POSITIONS) if legal[p] and successors[p]])
+    del successors
+
+    # Distances only ever shrink from UNKNOWN, so this settles once the longest mate has been reached
+    distances = np.full(POSITIONS + UNKNOWN + 1, UNKNOWN, dtype=np.int32)
+    distances[fixed_node:] = np.arange(UNKNOWN + 1)
+    distances[:POSITIONS][mated] = 0
+    while True:
+        before = distances[:POSITIONS].copy()
+        positions, indices, starts = strong_rows
+        distances[positions] = np.minimum(np.minimum.reduceat(distances[indices], starts) + 1, UNKNOWN)
+        positions, indices, starts = weak_rows
+        slowest = np.maximum.reduceat(distances[indices], starts)
+        distances[positions] = np.where(slowest >= UNKNOWN, UNKNOWN, slowest + 1)
+        if np.array_equal(distances[:POSITIONS], before):
+            break
+
+    return distances[:POSITIONS].astype(np.uint8)
+
+
+def write_table(path: str, distances: np.ndarray):
+    """Writes the bit-packed win/draw table to path and the distances beside it"""
+    with open(path, "wb") as io:
+        io.write(np.packbits(distances != UNKNOWN, bitorder="little").tobytes())
+    with open(distance_path(path), "wb") as io:
+        io.write(distances.tobytes())
+
+
+def read_distances(path: str) -> np.ndarray:
+    with open(distance_path(path), "rb") as io:
+        return np.frombuffer(io.read(), dtype=np.uint8)
+
+
+def distance_path(path: str) -> str:
+    return os.path.splitext(path)[0] + ".dtm"
+
+
+class Bitbases:
+    """Memory-mapped win/draw tables and their distances, probed for positions of two kings and one other piece"""
+
+    def __init__(self, directory: str = BitbaseConfig.DIRECTORY):
+        self.tables = {}
+        self.distances = {}
+        self.files = []
+        for name, piece_type in TABLE_PIECES.items():
+            path = os.path.join(directory, name + ".bb")
+            if not os.path.exists(path) or not os.path.exists(distance_path(path)):
+                continue
+            self.tables[piece_type] = self.map(path)
+            self.distances[piece_type] = self.map(distance_path(path))
+
+    def map(self, path: str) -> mmap.mmap:
+        io = open(path, "rb")
+        self.files.append(io)
+        return mmap.mmap(io.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return len(self.tables)
+
+    def close(self):
+        for table in list(self.tables.values()) + list(self.distances.values()):
+            table.close()
+        for io in self.files:
+            io.close()
+        self.tables = {}
+        self.distances = {}
+        self.files = []
+
+    def locate(self, board: chess.Board):
+        """(piece type, table index, whether the strong side is to move) of board, or None if no table covers it"""
+        if chess.popcount(board.occupied) != MAX_PIECES:
+            return None
+
+        others = board.occupied & ~board.kings
+        piece = chess.lsb(others)
+        piece_type = board.piece_type_at(piece)
+        if piece_type not in self.tables:
+            return None
+
+        # Tables have the strong side as white; mirroring ranks and swapping colours turns black into white
+        strong = bool(board.occupied_co[chess.WHITE] & others)
+        strong_king = board.king(strong)
+        weak_king = board.king(not strong)
+        if not strong:
+            strong_king = chess.square_mirror(strong_king)
+            weak_king = chess.square_mirror(weak_king)
+            piece = chess.square_mirror(piece)
+
+        strong_to_move = board.turn == strong
+        return piece_type, index(strong_to_move, strong_king, weak_king, piece), strong_to_move
+
+    def probe(self, board: chess.Board):
+        """1 if the side to move wins, -1 if it loses, 0 for a draw, or None if no table covers board"""
+        located = self.locate(board)
+        if located is None:
+            return None
+
+        piece_type, position, strong_to_move = located
+        if not (self.tables[piece_type][position >> 3] >> (position & 7)) & 1:
+            return 0
+        return 1 if strong_to_move else -1
+
+    def score(self, board: chess.Board):
+        """Search score from the side to move, or None if no table covers board. Quicker wins score higher"""
+        located = self.locate(board)
+        if located is None:
+            return None
+
+        piece_type, position, strong_to_move = located
+        distance = self.distances[piece_type][position]
+        if distance == UNKNOWN:
+            return 0
+        return (BitbaseConfig.WIN_SCORE - distance) * (1 if strong_to_move else -1)
+
+
+_bitbases = {}
+
+
+def load_bitbases(directory: str = BitbaseConfig.DIRECTORY) -> Bitbases:
+    """Bitbases in directory, mapped once per process however many agents use them"""
+    if directory not in _bitbases:
+        _bitbases[directory] = Bitbases(directory)
+    return _bitbases[directory]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate win/draw bitbases by retrograde analysis")
+    parser.add_argument("--output", default=BitbaseConfig.DIRECTORY)
+    parser.add_argument("--tables", nargs="+", default=BitbaseConfig.TABLES, choices=BitbaseConfig.TABLES)
+    args = parser.parse_args()
+
+    os.makedirs(args.output, exist_ok=True)
+    generated = {}
+    for table_name in BitbaseConfig.TABLES:
+        table_path = os.path.join(args.output, table_name + ".bb")
+        promotion_tables = {piece: generated[name] for name, piece in [("KQK", chess.QUEEN), ("KRK", chess.ROOK)]
+                            if name in generated}
+
+        if table_name not in args.tables:
+            if os.path.exists(distance_path(table_path)):
+                generated[table_name] = read_distances(table_path)
+            continue
+
+        if table_name == "KPK" and len(promotion_tables) < 2:
+            raise SystemExit("KPK needs the KQK and KRK tables for promotions")
+
+        start = time.perf_counter()
+        generated[table_name] = generate(TABLE_PIECES[table_name], promotion_tables)
+        write_table(table_path, generated[table_name])
+        won = generated[table_name] != UNKNOWN
+        print("{}: {} won positions, longest mate {} plies, in {:.1f}s".format(
+            table_name, int(won.sum()), int(generated[table_name][won].max()), time.perf_counter() - start))
@@ -0,0 +1,50 @@
+import chess
+
+
+class EvalCache:
+    """
+    Fixed size, direct-mapped cache of evaluations. Each key maps to a single slot and a newer entry always
+    replaces the old one, so lookups never search and memory never grows.
+    """
+
+    def __init__(self, size: int = 1 << 16):
+        # Round up to a power of two so the slot is a mask of the key's hash
+        self.size = 1 << max(0, (size - 1).bit_length())
+        self.mask = self.size - 1
+        self.keys = [None] * self.size
+        self.values = [0] * self.size
+
+        self.probes = 0
+        self.hits = 0
+
+    def get(self, key: int):
+        self.probes += 1
+        index = hash(key) & self.mask
+        if self.keys[index] == key:
+            self.hits += 1
+            return self.values[index]
+        return None
+
+    def put(self, key: int, value):
+        index = hash(key) & self.mask
+        self.keys[index] = key
+        self.values[index] = value
+
+    def clear(self):
+        self.keys = [None] * self.size
+        self.probes = 0
+        self.hits = 0
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.probes if self.probes else 0
+
+    @property
+    def fill(self) -> float:
+        return sum(1 for key in self.keys if key is not None) / self.size
+
+
+def pawn_key(chessboard: chess.Board) -> int:
+    """Exact key of the pawn structure: white pawn bitboard in the low 64 bits, black in the high 64"""
+    pawns = chessboard.pawns
+    return (pawns & chessboard.occupied_co[chess.WHITE]) | ((pawns & chessboard.occupied_co[chess.BLACK]) << 64)
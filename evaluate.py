@@ -1,27 +1,50 @@
+import json
 import math
+import os
 
 import chess
 
+import eval_cache
+
+
+class EvalWeights:
+    # Hand-picked defaults; tune.py writes tuned values to WEIGHTS_FILE, which is loaded on import
+    WEIGHTS_FILE = "eval_weights.json"
+
+    PIECE_VALUES = [0, 9, 30, 35, 50, 90, 900]  # Indexed by piece type
+    MOBILITY = 0.5  # Per legal move in evaluate_complex
+    KNIGHT_EDGE_PENALTY = 10
+    CENTRE_FRACTION = 0.25  # Share of a centre pawn or knight's value counted again
+
+
+def load_weights(path: str = EvalWeights.WEIGHTS_FILE):
+    if not os.path.exists(path):
+        return False
+
+    with open(path, "r") as io:
+        weights = json.load(io)
+
+    EvalWeights.PIECE_VALUES = weights.get("piece_values", EvalWeights.PIECE_VALUES)
+    EvalWeights.MOBILITY = weights.get("mobility", EvalWeights.MOBILITY)
+    EvalWeights.KNIGHT_EDGE_PENALTY = weights.get("knight_edge_penalty", EvalWeights.KNIGHT_EDGE_PENALTY)
+    EvalWeights.CENTRE_FRACTION = weights.get("centre_fraction", EvalWeights.CENTRE_FRACTION)
+    return True
+
+
+def save_weights(path: str = EvalWeights.WEIGHTS_FILE):
+    weights = {"piece_values": EvalWeights.PIECE_VALUES, "mobility": EvalWeights.MOBILITY,
+               "knight_edge_penalty": EvalWeights.KNIGHT_EDGE_PENALTY,
+               "centre_fraction": EvalWeights.CENTRE_FRACTION}
+    with open(path, "w") as io:
+        json.dump(weights, io, indent=2)
+
 
 def evaluate_moves(chessboard: chess.Board):
     return chessboard.legal_moves.count()
 
 
 def get_piece_value(piece: chess.Piece):
-    piece_value = 0
-    piece_type = piece.piece_type
-    if piece_type == chess.PAWN:
-        piece_value = 9
-    elif piece_type == chess.KNIGHT:
-        piece_value = 30
-    elif piece_type == chess.BISHOP:
-        piece_value = 35
-    elif piece_type == chess.ROOK:
-        piece_value = 50
-    elif piece_type == chess.QUEEN:
-        piece_value = 90
-    elif piece_type == chess.KING:
-        piece_value = 900
+    piece_value = EvalWeights.PIECE_VALUES[piece.piece_type]
 
     if piece.color == chess.WHITE:
         return piece_value
@@ -43,6 +66,84 @@ def evaluate_material(chessboard: chess.Board):
     return total
 
 
+def evaluate_mobility_reference(chessboard: chess.Board):
+    # Original per-piece mobility evaluation, kept to check evaluate_mobility against
+    if chessboard.is_checkmate():
+        return 1e9 if chessboard.turn else -1e9
+    if chessboard.is_stalemate():
+        return 0
+
+    total = 0
+    piece_map = chessboard.piece_map()
+
+    for piece_index in piece_map.keys():
+        piece = piece_map[piece_index]
+
+        attack_squares = chessboard.attacks(piece_index)
+        attack_squares_count = len(attack_squares)
+
+        if piece.color == chess.WHITE:
+            total += attack_squares_count
+        else:
+            total -= attack_squares_count
+
+    return total
+
+
+# Pawns attack one square diagonally each way, except off the board edge or from the last rank
+PAWN_LEFT_ATTACKERS = [chess.BB_ALL & ~chess.BB_FILE_A & ~chess.BB_RANK_1,
+                       chess.BB_ALL & ~chess.BB_FILE_A & ~chess.BB_RANK_8]
+PAWN_RIGHT_ATTACKERS = [chess.BB_ALL & ~chess.BB_FILE_H & ~chess.BB_RANK_1,
+                        chess.BB_ALL & ~chess.BB_FILE_H & ~chess.BB_RANK_8]
+
+KNIGHT_ATTACK_COUNTS = [chess.popcount(bb) for bb in chess.BB_KNIGHT_ATTACKS]
+KING_ATTACK_COUNTS = [chess.popcount(bb) for bb in chess.BB_KING_ATTACKS]
+
+
+def count_attacks(chessboard: chess.Board, color: chess.Color) -> int:
+    """Sum over color's pieces of the number of squares each attacks, the same as len(board.attacks(square))"""
+    own = chessboard.occupied_co[color]
+    occupied = chessboard.occupied
+
+    pawns = chessboard.pawns & own
+    total = chess.popcount(pawns & PAWN_LEFT_ATTACKERS[color]) + chess.popcount(pawns & PAWN_RIGHT_ATTACKERS[color])
+
+    for square in chess.scan_forward(chessboard.knights & own):
+        total += KNIGHT_ATTACK_COUNTS[square]
+    for square in chess.scan_forward(chessboard.kings & own):
+        total += KING_ATTACK_COUNTS[square]
+
+    queens = chessboard.queens
+    for square in chess.scan_forward((chessboard.bishops | queens) & own):
+        total += chess.popcount(chess.BB_DIAG_ATTACKS[square][chess.BB_DIAG_MASKS[square] & occupied])
+    for square in chess.scan_forward((chessboard.rooks | queens) & own):
+        total += chess.popcount(chess.BB_RANK_ATTACKS[square][chess.BB_RANK_MASKS[square] & occupied])
+        total += chess.popcount(chess.BB_FILE_ATTACKS[square][chess.BB_FILE_MASKS[square] & occupied])
+
+    return total
+
+
+def terminal_score(chessboard: chess.Board):
+    """
+    Score of a checkmate or stalemate from white's point of view, or None if there are legal moves. Equivalent to
+    checking is_checkmate and is_stalemate, with one legal move generation instead of two
+    """
+    if any(chessboard.generate_legal_moves()):
+        return None
+    if chessboard.is_check():
+        return -1e9 if chessboard.turn else 1e9
+    return 0
+
+
+def evaluate_mobility(chessboard: chess.Board):
+    score = terminal_score(chessboard)
+    if score is not None:
+        # The original evaluators score the mated side as winning, and this one still matches them
+        return -score
+
+    return count_attacks(chessboard, chess.WHITE) - count_attacks(chessboard, chess.BLACK)
+
+
 edge_squares = centre_squares = []
 for e in ['a1', 'a2', 'a3', 'a4', 'a5', 'a6', 'a7', 'a8',
           'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'h7', 'h8',
@@ -57,8 +158,22 @@ for e in ['c3', 'd3', 'e3', 'f3',
     centre_squares.append(chess.parse_square(e))
 
 
+def evaluate_pawns(chessboard: chess.Board):
+    # Pawn-only terms of evaluate_complex, which can be cached by pawn structure
+    total = 0
+    for color in chess.COLORS:
+        pawn = chess.Piece(chess.PAWN, color)
+        for square in chessboard.pieces(chess.PAWN, color):
+            total += 2 * get_piece_value(pawn)
+
+            if square in centre_squares:
+                total += math.floor(get_piece_value(pawn) * EvalWeights.CENTRE_FRACTION)  # Count again
+
+    return total
+
+
 # Press the green button in the gutter to run the script.
-def evaluate_complex(chessboard: chess.Board):
+def evaluate_complex(chessboard: chess.Board, pawn_cache=None):
     total = 0
 
     if chessboard.is_checkmate():
@@ -66,13 +181,24 @@ def evaluate_complex(chessboard: chess.Board):
     if chessboard.is_stalemate():
         return 0
 
-    total += (chessboard.legal_moves.count() / 2)
+    total += chessboard.legal_moves.count() * EvalWeights.MOBILITY
+
+    if pawn_cache is None:
+        total += evaluate_pawns(chessboard)
+    else:
+        key = eval_cache.pawn_key(chessboard)
+        pawn_eval = pawn_cache.get(key)
+        if pawn_eval is None:
+            pawn_eval = evaluate_pawns(chessboard)
+            pawn_cache.put(key, pawn_eval)
+        total += pawn_eval
 
     piece_map = chessboard.piece_map()
     for piece_index in piece_map.keys():
         piece = piece_map[piece_index]
 
-        total += 2 * get_piece_value(piece)
+        if piece.piece_type != chess.PAWN:
+            total += 2 * get_piece_value(piece)
 
     for square in edge_squares:
         piece = chessboard.piece_at(square)
@@ -83,21 +209,23 @@ def evaluate_complex(chessboard: chess.Board):
 
         if piece_type == chess.KNIGHT:
             if piece.color == chess.WHITE:
-                punishment = -10
+                punishment = -EvalWeights.KNIGHT_EDGE_PENALTY
             else:
-                punishment = +10
+                punishment = +EvalWeights.KNIGHT_EDGE_PENALTY
 
             total += punishment
 
     for square in centre_squares:
         piece = chessboard.piece_at(square)
 
-        if piece is not None and piece.piece_type in [chess.PAWN, chess.KNIGHT]:
-            total += math.floor(get_piece_value(piece) / 4)  # Count again
+        if piece is not None and piece.piece_type == chess.KNIGHT:
+            total += math.floor(get_piece_value(piece) * EvalWeights.CENTRE_FRACTION)  # Count again
 
     return total
 
 
+load_weights()
+
 files = []
 files.append(chess.SquareSet.ray(chess.A1, chess.A8))
 
@@ -1,23 +1,134 @@
+import argparse
+import time
+
 import PySimpleGUI as sg
 
-sg.theme('DarkAmber') #set the coloring theme
+import main
+import search_events
+
+
+class DashboardConfig:
+    REFRESH = 0.5  # Seconds between redraws; events are still read in between
+    HISTORY = 120.0  # Seconds of history in the plots
+    PLOT_SIZE = (520, 130)
+    EVAL_CLAMP = 2000  # Evals are plotted within this, so mate scores don't flatten everything else
+    COLORS = ["#f5c542", "#42b0f5", "#f55442", "#5cf542", "#c842f5", "#f5f5f5"]
+
+
+class Plot:
+    """One metric of a SearchMonitor over its history, a line per searching agent, drawn on a PySimpleGUI Graph"""
+
+    def __init__(self, key: str, metric: str, title: str, value_format: str):
+        self.key = key
+        self.metric = metric
+        self.title = title
+        self.value_format = value_format
+
+    def draw(self, graph: sg.Graph, monitor: search_events.SearchMonitor, now: float, colors: dict):
+        width, height = DashboardConfig.PLOT_SIZE
+        start = now - monitor.history
+        series = monitor.series[self.metric]
+
+        graph.erase()
+        values = [value for points in series.values() for at, value in points]
+        if not values:
+            graph.draw_text(self.title, (5, height - 5), color="white", text_location=sg.TEXT_LOCATION_TOP_LEFT)
+            return
+
+        low = min(values)
+        high = max(values)
+        if high == low:
+            high = low + 1
+        for agent, points in series.items():
+            previous = None
+            for at, value in points:
+                point = ((at - start) / monitor.history * width,
+                         10 + (value - low) / (high - low) * (height - 35))
+                if previous is not None:
+                    graph.draw_line(previous, point, color=colors[agent], width=2)
+                previous = point
+
+        label = "{}  {} - {}".format(self.title, self.value_format.format(low), self.value_format.format(high))
+        graph.draw_text(label, (5, height - 5), color="white", text_location=sg.TEXT_LOCATION_TOP_LEFT)
+
 
-#stuff inside the window, series of rows
-layout = [ 
-    [sg.Text('Row 1 text'), sg.Input(key='-IN1-')], 
-    [sg.Text('Input for row 2'), sg.Input(key='-IN2-')],
-    [sg.Text('Combined Output'), sg.Text('Temporary Text', key=('-OUT-'))], 
-    [sg.Button('Ok'), sg.Button('Cancel'), sg.Button('Exit')] 
+class Dashboard:
+    """
+    Live view of every search publishing events (main.Config.EVENTS), whether one agent or a whole tournament:
+    nodes/sec, depth reached, transposition table use and evals over time, and each agent's latest principal
+    variation. Events are read as they arrive into a search_events.SearchMonitor, and only drawn every REFRESH
+    seconds
+    """
+
+    def __init__(self, subscriber: search_events.EventSubscriber):
+        self.subscriber = subscriber
+        self.monitor = search_events.SearchMonitor(DashboardConfig.HISTORY, DashboardConfig.EVAL_CLAMP)
+        self.plots = [
+            Plot("-NPS-", "nps", "nodes/sec", "{:.0f}"),
+            Plot("-DEPTH-", "depth", "depth reached", "{:.0f}"),
+            Plot("-TT-", "tt_hit_rate", "TT hit rate", "{:.1%}"),
+            Plot("-EVAL-", "eval", "eval", "{:.0f}"),
+        ]
+
+        sg.theme('DarkAmber')
+        layout = [
+            [sg.Text("Waiting for search events on {}:{}".format(*subscriber.socket.getsockname()), key="-STATUS-",
+                     size=(80, 1))],
+            [sg.Text("", key="-AGENTS-", size=(80, 6), font=("Courier", 10))],
         ]
+        for plot in self.plots:
+            layout.append([sg.Graph(DashboardConfig.PLOT_SIZE, (0, 0), DashboardConfig.PLOT_SIZE, key=plot.key,
+                                    background_color="black")])
+        layout.append([sg.Button('Exit')])
+        self.window = sg.Window('Search dashboard', layout, finalize=True)
+
+    def receive(self):
+        for event in self.subscriber.poll():
+            self.monitor.add(event)
+
+    def redraw(self, now: float):
+        monitor = self.monitor
+        monitor.prune(now)
+        colors = {agent: DashboardConfig.COLORS[i % len(DashboardConfig.COLORS)]
+                  for i, agent in enumerate(monitor.agents)}
+        self.window["-STATUS-"].update("{} events from {} agents".format(monitor.received, len(monitor.agents)))
+
+        lines = []
+        for agent, event in monitor.latest.items():
+            hit_rate = "-" if event["tt_hit_rate"] is None else "{:.1%}".format(event["tt_hit_rate"])
+            lines.append("{:<28} depth {:>2} {:>10} nodes {:>8.0f} nps  TT {} entries, {} hits\n    {}".format(
+                agent, event["depth"], event["nodes"], event["nps"], event["tt_entries"], hit_rate,
+                monitor.pvs.get(agent, "")))
+        self.window["-AGENTS-"].update("\n".join(lines))
+
+        for plot in self.plots:
+            plot.draw(self.window[plot.key], monitor, now, colors)
+
+    def run(self):
+        last_drawn = 0.0
+        while True:
+            event, values = self.window.read(timeout=int(DashboardConfig.REFRESH * 1000))
+            if event == sg.WIN_CLOSED or event == 'Exit':
+                break
+
+            self.receive()
+            now = time.time()
+            if now - last_drawn >= DashboardConfig.REFRESH:
+                self.redraw(now)
+                last_drawn = now
+
+        self.window.close()
+        self.subscriber.close()
 
-#create the window
-window = sg.Window('This is the title of the window', layout)
 
-#create event loop for processing events and geting values of inputs
-while True:
-    event, values = window.read()
-    if event == sg.WIN_CLOSED or event == 'Exit': #if window is closed or clicks cancel
-        break
-    window['-OUT-'].update(values['-IN1-'] + ' ' + values['-IN2-'])
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Watch live search events; run searches with main.Config.EVENTS")
+    parser.add_argument("--host", default=main.Config.EVENTS_HOST)
+    parser.add_argument("--port", type=int, default=main.Config.EVENTS_PORT)
+    parser.add_argument("--refresh", type=float, default=DashboardConfig.REFRESH)
+    parser.add_argument("--history", type=float, default=DashboardConfig.HISTORY)
+    args = parser.parse_args()
 
-window.close()
\ No newline at end of file
+    DashboardConfig.REFRESH = args.refresh
+    DashboardConfig.HISTORY = args.history
+    Dashboard(search_events.EventSubscriber(args.host, args.port)).run()
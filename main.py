@@ -6,13 +6,14 @@ import math
 import random
 from abc import ABC, abstractmethod
 
-from chessboard import display
 import time
 
 import chess
 import chess.pgn
 import chess.polyglot
 
+import render
+
 
 # CONFIGURATION
 
@@ -23,7 +24,34 @@ class Config:
     START_FEN = chess.STARTING_BOARD_FEN
     # START_FEN = "rnb1kbnr/ppp2ppp/3p4/4p1q1/4P1Q1/3P4/PPP2PPP/RNB1KBNR w KQkq - 0 4"
     DEBUG = True
+    INFO = True
     INDEX_MODE = True
+    CACHE_EVALS = True
+    NULL_PRUNE = True
+    SORT_MOVES = True
+    OPENING_BOOK = True
+    SEARCH_STATS = True
+    EVAL_CACHE = True  # Direct-mapped leaf evaluation and pawn structure caches
+    EVAL_CACHE_SIZE = 1 << 16
+    PAWN_CACHE_SIZE = 1 << 14
+    TRACE = False  # Write a binary search trace to ./trace, see search_trace.py
+    TRACE_CAPACITY = 1 << 20  # Records kept in the trace ring buffer
+    NNUE_FILE = "nnue.npz"  # Network weights for MiniMaxNNUE, see nnue.py
+    MATE_PROBE = 0  # Look for a checks-only mate in this many moves before every search (0 = off)
+    BITBASES = True  # Probe the endgame bitbases written by bitbase.py, if there are any
+    BITBASE_DIR = "bitbases"
+    # Timed searches stop deepening once the best move has held for STABLE_DEPTHS iterations with its eval within
+    # STABLE_MARGIN pawns, or at once with only one legal move, and get TIME_EXTENSION more of their time limit when
+    # the eval drops by SCORE_DROP pawns or more
+    MANAGE_TIME = True
+    STABLE_DEPTHS = 3
+    STABLE_MARGIN = 0.3
+    SCORE_DROP = 1.0
+    TIME_EXTENSION = 0.5
+    EVENTS = False  # Publish live search events for the dashboard in gui.py
+    EVENTS_HOST = "127.0.0.1"
+    EVENTS_PORT = 8766
+    EVENTS_INTERVAL = 0.25  # Seconds between progress events from inside a search
 
 
 def debug(obj):
@@ -31,6 +59,11 @@ def debug(obj):
         print(str(obj))
 
 
+def info(obj):
+    if Config.INFO:
+        print(str(obj))
+
+
 class Agent(ABC):
     i_board: chess.Board = None
 
@@ -390,26 +423,36 @@ class MiniMaxMobility(MiniMaxAbstract):
         return total
 
 
+# When the position on screen was shown; each stays up for MOVE_SLEEP, including the time spent on the next search
+last_shown = 0.0
+
+
+def show_board(show: chess.Board):
+    global last_shown
+    render.shared_display().show(show.board_fen())
+    last_shown = time.perf_counter()
+
+
 # Press the green button in the gutter to run the script.
 def tick(tick_board):
-    if Config.GUI:
-        display.start(tick_board.board_fen())
-
     if tick_board.turn:
         agent_move = white.find_move()
     else:
         agent_move = black.find_move()
 
+    if Config.GUI:
+        remaining = Config.MOVE_SLEEP - (time.perf_counter() - last_shown)
+        if remaining > 0:
+            time.sleep(remaining)
+
     tick_board.push(agent_move)
     if Config.GUI:
-        display.start(tick_board.board_fen())
+        show_board(tick_board)
 
     if tick_board.is_game_over():
         time.sleep(2)
         return False
     else:
-        if Config.GUI:
-            time.sleep(Config.MOVE_SLEEP)
         return True
 
 
@@ -429,6 +472,9 @@ if __name__ == '__main__':
         black = white
         # black = MiniMaxMobility(i_board, 3)
 
+        if Config.GUI:
+            show_board(i_board)
+
         while tick(i_board):
             debug(i_board.fen())
             pass
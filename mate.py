@@ -0,0 +1,114 @@
+import time
+
+import chess
+import chess.polyglot
+
+
+class MateSearch:
+    """
+    Mate-in-N search for the side to move. Only the attacker's moves are chosen; every defence has to be refuted,
+    so positions are proven or disproven rather than scored. Attacking moves are tried checks first, and the last
+    attacking move of a line is always a check. Results are kept in the search's own table, keyed by zobrist hash,
+    as the mate distance a position is proven within or the distance it is known to hold out past.
+
+    With checks_only, every attacking move must give check, which is far cheaper and finds most puzzle mates.
+    """
+
+    def __init__(self, board: chess.Board, checks_only: bool = False, node_limit: int = None):
+        self.board = board
+        self.checks_only = checks_only
+        self.node_limit = node_limit
+        self.nodes = 0
+        self.table = {}  # Zobrist hash to (proven, moves)
+
+    def out_of_nodes(self) -> bool:
+        return self.node_limit is not None and self.nodes >= self.node_limit
+
+    def attacking_moves(self, moves_left: int) -> [chess.Move]:
+        board = self.board
+        checks = []
+        captures = []
+        quiet = []
+        for move in board.legal_moves:
+            if board.gives_check(move):
+                checks.append(move)
+            elif moves_left > 1 and not self.checks_only:
+                if board.is_capture(move):
+                    captures.append(move)
+                else:
+                    quiet.append(move)
+        return checks + captures + quiet
+
+    def attack(self, moves_left: int) -> bool:
+        """Whether the side to move mates within moves_left of its own moves"""
+        if self.out_of_nodes():
+            return False
+        self.nodes += 1
+
+        key = chess.polyglot.zobrist_hash(self.board)
+        entry = self.table.get(key)
+        if entry is not None:
+            proven, moves = entry
+            if proven and moves <= moves_left:
+                return True
+            if not proven and moves >= moves_left:
+                return False
+
+        for move in self.attacking_moves(moves_left):
+            self.board.push(move)
+            mated = self.defend(moves_left)
+            self.board.pop()
+            if mated:
+                self.table[key] = (True, moves_left)
+                return True
+
+        self.table[key] = (False, moves_left)
+        return False
+
+    def defend(self, moves_left: int) -> bool:
+        """Whether the side to move, just attacked, is mated before the attacker runs out of moves"""
+        if self.out_of_nodes():
+            return False
+        self.nodes += 1
+        board = self.board
+
+        replies = list(board.legal_moves)
+        if not replies:
+            return board.is_check()
+        if moves_left <= 1 or board.is_insufficient_material():
+            return False
+
+        # Captures and king moves are the likeliest to hold, so try them first to fail fast
+        replies.sort(key=lambda reply: not (board.is_capture(reply) or board.piece_type_at(reply.from_square)
+                                            == chess.KING))
+        for reply in replies:
+            board.push(reply)
+            mated = self.attack(moves_left - 1)
+            board.pop()
+            if not mated:
+                return False
+        return True
+
+    def find(self, max_moves: int):
+        """(move, moves to mate) of the quickest mate within max_moves, or None"""
+        for moves_left in range(1, max_moves + 1):
+            for move in self.attacking_moves(moves_left):
+                self.board.push(move)
+                mated = self.defend(moves_left)
+                self.board.pop()
+                if mated:
+                    return move, moves_left
+                if self.out_of_nodes():
+                    return None
+        return None
+
+
+def find_mate(board: chess.Board, max_moves: int, checks_only: bool = False, node_limit: int = None):
+    """(move, moves to mate, nodes, seconds) of the quickest mate for the side to move, with move None if none"""
+    start = time.perf_counter()
+    search = MateSearch(board, checks_only, node_limit)
+    found = search.find(max_moves)
+    elapsed = time.perf_counter() - start
+    if found is None:
+        return None, None, search.nodes, elapsed
+    return found[0], found[1], search.nodes, elapsed
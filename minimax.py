@@ -1,21 +1,35 @@
 import abc
-import collections
 import math
 import os
 import pickle
 import time
 
 import chess
-import chess.pgn
 import chess.polyglot
 
+import bitbase
 import evaluate
 import main
+import mate
+import nnue
+import pst
+import search_events
+import search_trace
 
 from agent import Agent, make_opening_move
+from eval_cache import EvalCache
+from search_stats import SearchStats
+from search_trace import SearchTrace
+
+
+class SearchAborted(Exception):
+    """Raised inside negamax when a hard search limit is reached, unwinding to find_move"""
 
 
 class MiniMaxAbstract(Agent):
+    # A pawn in this agent's evaluation units, for the time management margins in main.Config
+    pawn_eval = evaluate.EvalWeights.PIECE_VALUES[chess.PAWN]
+
     def __init__(self, board: chess.Board, depth, *args, **kwargs):
         super().__init__(board)
         self.depth = depth
@@ -41,16 +55,62 @@ class MiniMaxAbstract(Agent):
         self.hashes = {}
         self.capturing_moves = {}
         self.legal_moves = {}
-        self.bench_evaluate = 0
-
-        # Benchmarks
-        self.bench_sort = 0
-        self.bench_index = 0
-        self.bench_total = 0
-        self.bench_evals = 0
         self.max_depth = 0
 
-    def sort_moves(self, moves: chess.LegalMoveGenerator, board_hash, depth) -> collections.Iterator[chess.Move]:
+        # Search limits; bench.py disables the time limit for reproducible runs
+        self.time_limit = 8.0
+        self.node_limit = None
+        self.manage_time = main.Config.MANAGE_TIME
+
+        # time_limit and node_limit are only checked between iterations; these are checked inside the search too,
+        # which abandons the iteration in progress and keeps the last completed one. Depth 1 is always completed
+        self.hard_time_limit = math.inf
+        self.hard_node_limit = None
+        self.search_deadline = math.inf
+
+        # A mate expected within this many moves is looked for with the mate solver before searching (0 = none)
+        self.mate_depth = 0
+
+        # Principal variations reported per iteration; each one after the first searches the root again without
+        # the moves already reported, sharing the transposition and move ordering tables with the first
+        self.multi_pv = 1
+        self.excluded_moves = set()
+
+        # Benchmarks; stats are None unless main.Config.SEARCH_STATS is set
+        self.nodes = 0
+        self.root_depth = depth
+        self.stats: SearchStats = None
+        self.iterations = []
+
+        # Leaf evaluations by zobrist hash, and pawn-structure terms by pawn hash for evaluators that have them
+        self.eval_cache: EvalCache = None
+        self.pawn_cache: EvalCache = None
+        if main.Config.EVAL_CACHE:
+            self.eval_cache = EvalCache(main.Config.EVAL_CACHE_SIZE)
+            self.pawn_cache = EvalCache(main.Config.PAWN_CACHE_SIZE)
+
+        # Win/draw tables for positions with few enough pieces, probed below the root
+        self.bitbases: bitbase.Bitbases = None
+        if main.Config.BITBASES:
+            self.bitbases = bitbase.load_bitbases(main.Config.BITBASE_DIR)
+            if len(self.bitbases) == 0:
+                self.bitbases = None
+
+        # Binary search trace, read back with search_trace.py
+        self.trace: SearchTrace = None
+        if main.Config.TRACE:
+            trace_file = os.path.join("trace", type(self).__name__ + "_" + str(depth) + ".trc")
+            self.trace = SearchTrace(main.Config.TRACE_CAPACITY, trace_file)
+
+        # Live progress for the dashboard in gui.py
+        self.events: search_events.EventPublisher = None
+        if main.Config.EVENTS:
+            self.events = search_events.load_publisher(main.Config.EVENTS_HOST, main.Config.EVENTS_PORT,
+                                                       main.Config.EVENTS_INTERVAL)
+        self.search_start = 0.0
+        self.search_start_nodes = 0
+
+    def sort_moves(self, moves: chess.LegalMoveGenerator, board_hash, depth) -> [chess.Move]:
         # Faster to add/remove at the end with O(1), then reverse with O(n)
         # Compare this to add/remove at the start with O(n) each time
 
@@ -73,28 +133,64 @@ class MiniMaxAbstract(Agent):
                 sorted_moves.remove(zobrist_move)
                 sorted_moves.append(zobrist_move)
 
-        return reversed(sorted_moves)
+        # Sorted moves are cached per position, so return a list rather than a one-shot iterator
+        sorted_moves.reverse()
+        return sorted_moves
 
 
     @abc.abstractmethod
     def evaluate_board(self) -> int:
         pass
 
+    def begin_search(self):
+        # Called by find_move before searching, for evaluators that keep incremental state about self.board
+        pass
+
+    def push_move(self, move: chess.Move):
+        self.board.push(move)
+
+    def pop_move(self):
+        self.board.pop()
+
+    def trace_node(self, depth, alpha, beta, score, flag):
+        move = self.board.move_stack[-1] if self.board.move_stack else chess.Move.null()
+        self.trace.record(self.root_depth - depth, move, alpha, beta, score, flag)
+
     def negamax(self, depth, color, alpha, beta, allow_null_move):
         original_alpha = alpha
 
-        nega_start = time.time()
+        stats = self.stats
+        trace = self.trace
+        self.nodes += 1
+        if stats is not None:
+            stats.node(self.root_depth - depth)
+        if not self.nodes & 0x3FF:
+            if self.events is not None and self.events.progress_due():
+                self.publish("progress")
+            if self.root_depth > 1 and (time.perf_counter() >= self.search_deadline or (
+                    self.hard_node_limit is not None and self.nodes - self.search_start_nodes >= self.hard_node_limit)):
+                raise SearchAborted()
 
         zobrist_hash = chess.polyglot.zobrist_hash(self.board)
 
-        if main.Config.CACHE_EVALS and zobrist_hash in self.hashes:
-            hash_eval = self.hashes[zobrist_hash]
-            if hash_eval["d"] >= depth:
+        # A root searched with moves excluded has a different value from the position's, so it skips the table
+        excluding = bool(self.excluded_moves) and depth == self.root_depth
+
+        if main.Config.CACHE_EVALS and not excluding:
+            hash_eval = self.hashes.get(zobrist_hash)
+            if stats is not None:
+                stats.tt_probe(hash_eval is not None)
+
+            if hash_eval is not None and hash_eval["d"] >= depth:
                 zobrist_move = chess.Move.from_uci(hash_eval["b"])
 
                 hash_value = hash_eval["v"]
                 flag = hash_eval["f"]
                 if flag == "e":
+                    if stats is not None:
+                        stats.tt_cutoff(flag)
+                    if trace is not None:
+                        self.trace_node(depth, alpha, beta, hash_value, search_trace.TT_CUTOFF)
                     return zobrist_move, hash_value
                 elif flag == "l":
                     alpha = max(alpha, hash_value)
@@ -102,26 +198,52 @@ class MiniMaxAbstract(Agent):
                     beta = min(beta, hash_value)
 
                 if alpha >= beta:
+                    if stats is not None:
+                        stats.tt_cutoff(flag)
+                    if trace is not None:
+                        self.trace_node(depth, alpha, beta, hash_value, search_trace.TT_CUTOFF)
                     return zobrist_move, hash_value
 
-        self.bench_index += (time.time() - nega_start)
-        nega_start = time.time()
+        if self.bitbases is not None and depth < self.root_depth \
+                and chess.popcount(self.board.occupied) <= bitbase.MAX_PIECES:
+            bitbase_eval = self.bitbases.score(self.board)
+            if bitbase_eval is not None:
+                if stats is not None:
+                    stats.bitbase_hits += 1
+                if trace is not None:
+                    self.trace_node(depth, alpha, beta, bitbase_eval, search_trace.LEAF)
+                return None, bitbase_eval
 
         if depth == 0:
-            self.bench_evals += 1
+            board_eval = None
+            if self.eval_cache is not None:
+                board_eval = self.eval_cache.get(zobrist_hash)
+
+            if board_eval is None:
+                if stats is not None:
+                    board_eval = stats.evaluate(self.evaluate_board)
+                else:
+                    board_eval = self.evaluate_board()
 
-            eval_start = time.time()
-            board_eval = self.evaluate_board() * color
-            self.bench_evaluate += (time.time() - eval_start)
+                if self.eval_cache is not None:
+                    self.eval_cache.put(zobrist_hash, board_eval)
 
+            board_eval *= color
+
+            if trace is not None:
+                self.trace_node(depth, alpha, beta, board_eval, search_trace.LEAF)
             return None, board_eval
 
         if main.Config.NULL_PRUNE and allow_null_move and (depth - 3) >= 0 and not (self.board.is_check()):
-            self.board.push(chess.Move.null())
+            self.push_move(chess.Move.null())
             null_eval = -self.negamax(depth - 1, -color, -beta, -beta + 1, False)[1]
-            self.board.pop()
+            self.pop_move()
 
+            if stats is not None:
+                stats.null_move(null_eval >= beta)
             if null_eval >= beta:
+                if trace is not None:
+                    self.trace_node(depth, alpha, beta, null_eval, search_trace.NULL_CUTOFF)
                 return None, null_eval
 
         move_list: [chess.Move]
@@ -133,41 +255,16 @@ class MiniMaxAbstract(Agent):
                 self.legal_moves[zobrist_hash] = move_list
         else:
             move_list = self.board.legal_moves
-
-        self.bench_sort += (time.time() - nega_start)
+        if excluding:
+            move_list = [m for m in move_list if m not in self.excluded_moves]
 
         best_eval = -math.inf
         best_move = None
 
-        for m in move_list:
-            self.board.push(m)
+        for move_index, m in enumerate(move_list):
+            self.push_move(m)
             m_eval = -self.negamax(depth - 1, -color, -beta, -alpha, True)[1]
-
-            if main.Config.DEBUG and depth > 1:
-                move_history = []
-                max_history = self.depth - depth + 2
-
-                for z in range(1, max_history):
-                    prev_move = self.board.move_stack[-z]
-                    move_history.append(prev_move)
-
-                g = chess.pgn.Game()
-                g.add_line(self.board.move_stack)
-
-                s = ""
-                for h in reversed(move_history):
-                    s = s + h.uci() + ", "
-
-                tabs = ""
-                for i in range(0, self.depth - depth - 1):
-                    tabs += "\t"
-
-                c = "White" if self.board.turn else "Black"
-
-                main.debug(tabs + c + "(d " + str(depth) + ") " + str(m_eval) + ": " + s + "\t" + str(
-                    zobrist_hash) + "\t\t" + self.board.fen())
-
-            self.board.pop()
+            self.pop_move()
 
             if m_eval > best_eval:
                 best_eval = m_eval
@@ -176,69 +273,219 @@ class MiniMaxAbstract(Agent):
             alpha = max(alpha, best_eval)
 
             if beta <= alpha:
+                if stats is not None:
+                    stats.beta_cutoff(move_index)
                 break
 
-        # Transposition table saving
-        if main.Config.CACHE_EVALS and best_move is not None:
-            nega_start = time.time()
-
-            new_hash = {"v": best_eval, "d": depth, "b": best_move.uci()}
+        if best_eval <= original_alpha:
+            flag = "u"
+        elif best_eval >= beta:
+            flag = "l"
+        else:
+            flag = "e"
 
-            if best_eval <= original_alpha:
-                new_hash["f"] = "u"
-            elif best_eval >= beta:
-                new_hash["f"] = "l"
-            else:
-                new_hash["f"] = "e"
+        # Transposition table saving
+        if main.Config.CACHE_EVALS and best_move is not None and not excluding:
+            self.hashes[zobrist_hash] = {"v": best_eval, "d": depth, "b": best_move.uci(), "f": flag}
 
-            self.hashes[zobrist_hash] = new_hash
-            self.bench_index += (time.time() - nega_start)
+        if trace is not None:
+            self.trace_node(depth, original_alpha, beta, best_eval, search_trace.TT_FLAGS[flag])
 
         # print(str(best_move), end=" ")
         return best_move, best_eval
 
+    def publish(self, kind: str, **fields):
+        elapsed = time.perf_counter() - self.search_start
+        nodes = self.nodes - self.search_start_nodes
+        event = {"depth": self.root_depth, "nodes": nodes, "nps": nodes / elapsed if elapsed > 0 else 0.0,
+                 "tt_entries": len(self.hashes), "tt_hit_rate": None if self.stats is None else self.stats.tt_hit_rate,
+                 "eval_cache_hit_rate": None if self.eval_cache is None else self.eval_cache.hit_rate}
+        event.update(fields)
+        self.events.publish(kind, type(self).__name__, event)
+
+    def principal_variation(self, first_move: chess.Move, max_length: int) -> [chess.Move]:
+        """first_move followed by the best moves stored in the transposition table, as far as they go"""
+        pv = [first_move]
+        self.board.push(first_move)
+        while len(pv) < max_length:
+            hash_eval = self.hashes.get(chess.polyglot.zobrist_hash(self.board))
+            if hash_eval is None:
+                break
+            move = chess.Move.from_uci(hash_eval["b"])
+            if not self.board.is_legal(move):
+                break
+            pv.append(move)
+            self.board.push(move)
+        for i in range(len(pv)):
+            self.board.pop()
+        return pv
+
+    def search_root(self, depth: int, color: int):
+        """
+        Best move and eval at depth, then the next multi_pv - 1 best root moves each searched with the ones before
+        excluded. Returns the best move, its eval and every (move, eval, principal variation) found
+        """
+        deep_move, deep_eval = self.negamax(depth, color, -math.inf, math.inf, False)
+        pvs = []
+        if deep_move is None:
+            return deep_move, deep_eval, pvs
+
+        pvs.append((deep_move, deep_eval, self.principal_variation(deep_move, depth)))
+        try:
+            while len(pvs) < self.multi_pv:
+                self.excluded_moves.add(pvs[-1][0])
+                pv_move, pv_eval = self.negamax(depth, color, -math.inf, math.inf, False)
+                if pv_move is None:
+                    break
+                pvs.append((pv_move, pv_eval, self.principal_variation(pv_move, depth)))
+        finally:
+            self.excluded_moves.clear()
+        return deep_move, deep_eval, pvs
+
+    def moves_by_depth(self, depths: [int]) -> {int: chess.Move}:
+        """
+        The move find_move would have returned with each of depths as self.depth, from the iterations of the last
+        search. Iterative deepening searches every shallower depth on the way, so one search answers for all of them
+        """
+        iteration_moves = [None if it["move"] is None else chess.Move.from_uci(it["move"]) for it in self.iterations]
+        return {depth: iteration_moves[min(depth, len(iteration_moves)) - 1] for depth in depths}
+
+    def solve_mate(self, max_moves: int, checks_only: bool) -> chess.Move:
+        """Quickest mate within max_moves, recorded as the only iteration of this search, or None"""
+        node_limit = None
+        if self.node_limit is not None:
+            node_limit = max(self.node_limit - (self.nodes - self.search_start_nodes), 0)
+        move, moves_to_mate, nodes, elapsed = mate.find_mate(self.board, max_moves, checks_only, node_limit)
+        self.nodes += nodes
+        if self.stats is not None:
+            self.stats.mate_nodes += nodes
+        if move is None:
+            return None
+
+        main.info("Mate in {} found searching {} in {:.2f}s".format(moves_to_mate, nodes, elapsed))
+        if self.stats is not None:
+            self.stats.finish()
+        self.max_depth = 2 * moves_to_mate - 1
+        self.iterations = [{"depth": self.max_depth, "move": move.uci(), "eval": 1e9, "nodes": nodes,
+                            "time": elapsed, "pvs": [{"move": move.uci(), "eval": 1e9, "pv": [move.uci()]}]}]
+        return move
+
     def find_move(self) -> chess.Move:
         find_start = time.time()
-        if self.board.fullmove_number < 10:
+        if main.Config.OPENING_BOOK and self.board.fullmove_number < 10:
             opening = make_opening_move(self.board)
             if opening is not None:
                 return opening
 
+        self.stats = SearchStats() if main.Config.SEARCH_STATS else None
+        # self.nodes counts over every search, node limits apply to the nodes of this one
+        self.search_start = time.perf_counter()
+        self.search_start_nodes = self.nodes
+        self.search_deadline = self.search_start + self.hard_time_limit
+        mate_moves = self.mate_depth or main.Config.MATE_PROBE
+        if mate_moves:
+            mate_move = self.solve_mate(mate_moves, checks_only=not self.mate_depth)
+            if mate_move is not None:
+                return mate_move
+
         # Color for negamax; just makes evaluation function of black negative
         color = 1 if self.board.turn else -1
 
+        self.begin_search()
+        root_ply = len(self.board.move_stack)
+
         best_moves = []
+        self.iterations = []
         iterative_depth = 1
         iteration_search_time = 0
+
+        # Time management only applies to timed searches, fixed depth and node counts are searched in full
+        manage_time = self.manage_time and self.time_limit != math.inf
+        single_move = self.board.legal_moves.count() == 1
+        time_budget = self.time_limit
+        stable_iterations = 0
         for iterative_depth in range(1, self.depth + 1):
-            start_time = time.time()
-            start_nodes = self.bench_evals
+            start_time = time.perf_counter()
+            start_nodes = self.nodes
+            self.root_depth = iterative_depth
 
-            deep_move, deep_eval = self.negamax(iterative_depth, color, -math.inf, math.inf, False)
+            try:
+                deep_move, deep_eval, pvs = self.search_root(iterative_depth, color)
+            except SearchAborted:
+                while len(self.board.move_stack) > root_ply:
+                    self.pop_move()
+                main.info("Search limit reached during depth {}, keeping depth {}".format(iterative_depth,
+                                                                                         iterative_depth - 1))
+                iterative_depth -= 1
+                break
             best_moves.append([deep_move, deep_eval])
 
-            elapsed_time = time.time() - start_time
-            searched_nodes = (self.bench_evals - start_nodes)
+            elapsed_time = time.perf_counter() - start_time
+            searched_nodes = (self.nodes - start_nodes)
 
             main.info("Depth " + str(iterative_depth) + " searched " + str(searched_nodes) + " in {:.2f}s\t".format(
                 elapsed_time))
             iteration_search_time += elapsed_time
 
-            if iteration_search_time >= 8.0 or deep_eval >= 100000:
+            self.iterations.append({"depth": iterative_depth,
+                                    "move": None if deep_move is None else deep_move.uci(),
+                                    "eval": deep_eval,
+                                    "nodes": searched_nodes,
+                                    "time": elapsed_time,
+                                    "pvs": [{"move": move.uci(), "eval": move_eval, "pv": [m.uci() for m in pv]}
+                                            for move, move_eval, pv in pvs]})
+            if self.events is not None:
+                self.publish("iteration", fen=self.board.fen(), eval=deep_eval, move=self.iterations[-1]["move"],
+                             pvs=self.iterations[-1]["pvs"], iteration_nodes=searched_nodes, iteration_time=elapsed_time)
+            if len(pvs) > 1:
+                main.info("\t" + "\t".join("{} {}".format(self.board.variation_san(pv), move_eval)
+                                             for move, move_eval, pv in pvs))
+
+            # Iterations the best move has held for with an eval within STABLE_MARGIN of the one before
+            if len(best_moves) >= 2 and deep_move == best_moves[-2][0] \
+                    and abs(deep_eval - best_moves[-2][1]) <= main.Config.STABLE_MARGIN * self.pawn_eval:
+                stable_iterations += 1
+            else:
+                stable_iterations = 1
+
+            # A sharp drop means the previous best move has been refuted, so allow more time to find another
+            if manage_time and time_budget == self.time_limit and len(best_moves) >= 2 \
+                    and best_moves[-2][1] - deep_eval >= main.Config.SCORE_DROP * self.pawn_eval:
+                time_budget = self.time_limit * (1 + main.Config.TIME_EXTENSION)
+                main.info("Eval dropped from {} to {}, time limit extended to {:.1f}s".format(best_moves[-2][1],
+                                                                                           deep_eval, time_budget))
+
+            if iteration_search_time >= time_budget or deep_eval >= 100000:
+                break
+            if self.node_limit is not None and self.nodes - self.search_start_nodes >= self.node_limit:
                 break
+            if manage_time and iterative_depth < self.depth:
+                if single_move:
+                    main.info("Only one legal move, stopping at depth {}".format(iterative_depth))
+                    break
+                if stable_iterations >= main.Config.STABLE_DEPTHS:
+                    main.info("Best move stable for {} iterations, stopping at depth {}".format(stable_iterations,
+                                                                                                 iterative_depth))
+                    break
 
         main.info("Best moves: " + str(best_moves))
 
         self.max_depth = iterative_depth
-        if self.max_depth >= 2:
-            deep_eval = (best_moves[-1][1] + best_moves[-2][1]) / 2
-            if len(best_moves) % 2 == 0:
-                deep_move = best_moves[-1][0]
-            else:
-                deep_move = best_moves[-2][0]
-
-        main.info("Benchmark ({} evals): index {}\tsort {}\tevals {}".format(self.bench_evals, self.bench_index,
-                                                                             self.bench_sort, self.bench_evaluate))
+        # The principal variation's move of the last completed iteration
+        deep_move = best_moves[-1][0]
+        if self.events is not None:
+            self.publish("move", fen=self.board.fen(), move=None if deep_move is None else deep_move.uci(),
+                         eval=best_moves[-1][1])
+
+        if self.stats is not None:
+            self.stats.finish()
+            main.info("Benchmark: " + str(self.stats))
+        if self.eval_cache is not None:
+            main.info("Eval cache hits {:.1%}, pawn cache hits {:.1%}".format(self.eval_cache.hit_rate,
+                                                                             self.pawn_cache.hit_rate))
+
+        if self.trace is not None:
+            self.trace.flush()
 
         if main.Config.INDEX_MODE:
             io = None
@@ -295,125 +542,33 @@ class MiniMaxMobility(MiniMaxAbstract):
         self.eval_description = "Pure mobility (number of legal moves)"
 
     def evaluate_board(self):
-        if self.board.is_checkmate():
-            return 1e9 if self.board.turn else -1e9
-        if self.board.is_stalemate():
-            return 0
+        return evaluate.evaluate_mobility(self.board)
 
-        total = 0
-        piece_map = self.board.piece_map()
 
-        for piece_index in piece_map.keys():
-            piece = piece_map[piece_index]
+class MiniMaxPosition(MiniMaxAbstract):
+    def __init__(self, board: chess.Board, depth: int, *args, **kwargs):
+        super().__init__(board, depth, *args, **kwargs)
+        self.eval_description = "Tapered piece-square tables with material"
+        self.pawn_eval = pst.material[chess.PAWN]
+        self.pst: pst.PSTAccumulator = None
 
-            attack_squares = self.board.attacks(piece_index)
-            attack_squares_count = len(attack_squares)
+    def begin_search(self):
+        self.pst = pst.PSTAccumulator(self.board)
 
-            if piece.color == chess.WHITE:
-                total += attack_squares_count
-            else:
-                total -= attack_squares_count
-
-        return total
-
-
-# class MiniMaxPosition(MiniMaxAbstract):
-#     def __init__(self, board: chess.Board, depth=3):
-#         super().__init__(board, depth)
-#         self.eval_description = "Pure positional values"
-#
-#     pos_pawn = [0, 0, 0, 0, 0, 0, 0, 0,
-#                 50, 50, 50, 50, 50, 50, 50, 50,
-#                 10, 10, 20, 30, 30, 20, 10, 10,
-#                 5, 5, 10, 25, 25, 10, 5, 5,
-#                 0, 0, 0, 20, 20, 0, 0, 0,
-#                 5, -5, -10, 0, 0, -10, -5, 5,
-#                 5, 10, 10, -20, -20, 10, 10, 5,
-#                 0, 0, 0, 0, 0, 0, 0, 0]
-#     pos_knight = [-50, -40, -30, -30, -30, -30, -40, -50,
-#                   -40, -20, 0, 0, 0, 0, -20, -40,
-#                   -30, 0, 10, 15, 15, 10, 0, -30,
-#                   -30, 5, 15, 20, 20, 15, 5, -30,
-#                   -30, 0, 15, 20, 20, 15, 0, -30,
-#                   -30, 5, 10, 15, 15, 10, 5, -30,
-#                   -40, -20, 0, 5, 5, 0, -20, -40,
-#                   -50, -40, -30, -30, -30, -30, -40, -50]
-#
-#     pos_bishop = [-20, -10, -10, -10, -10, -10, -10, -20,
-#                   -10, 0, 0, 0, 0, 0, 0, -10,
-#                   -10, 0, 5, 10, 10, 5, 0, -10,
-#                   -10, 5, 5, 10, 10, 5, 5, -10,
-#                   -10, 0, 10, 10, 10, 10, 0, -10,
-#                   -10, 10, 10, 10, 10, 10, 10, -10,
-#                   -10, 5, 0, 0, 0, 0, 5, -10,
-#                   -20, -10, -10, -10, -10, -10, -10, -20]
-#
-#     pos_rook = [0, 0, 0, 0, 0, 0, 0, 0,
-#                 5, 10, 10, 10, 10, 10, 10, 5,
-#                 -5, 0, 0, 0, 0, 0, 0, -5,
-#                 -5, 0, 0, 0, 0, 0, 0, -5,
-#                 -5, 0, 0, 0, 0, 0, 0, -5,
-#                 -5, 0, 0, 0, 0, 0, 0, -5,
-#                 -5, 0, 0, 0, 0, 0, 0, -5,
-#                 0, 0, 0, 5, 5, 0, 0, 0]
-#
-#     pos_queen = [-20, -10, -10, -5, -5, -10, -10, -20,
-#                  -10, 0, 0, 0, 0, 0, 0, -10,
-#                  -10, 0, 5, 5, 5, 5, 0, -10,
-#                  -5, 0, 5, 5, 5, 5, 0, -5,
-#                  0, 0, 5, 5, 5, 5, 0, -5,
-#                  -10, 5, 5, 5, 5, 5, 0, -10,
-#                  -10, 0, 5, 0, 0, 0, 0, -10,
-#                  -20, -10, -10, -5, -5, -10, -10, -20]
-#
-#     pos_king = [-30, -40, -40, -50, -50, -40, -40, -30,
-#                 -30, -40, -40, -50, -50, -40, -40, -30,
-#                 -30, -40, -40, -50, -50, -40, -40, -30,
-#                 -30, -40, -40, -50, -50, -40, -40, -30,
-#                 -20, -30, -30, -40, -40, -30, -30, -20,
-#                 -10, -20, -20, -20, -20, -20, -20, -10,
-#                 20, 20, 0, 0, 0, 0, 20, 20,
-#                 20, 30, 10, 0, 0, 10, 30, 20]
-#
-#     def get_pos_value(self, piece: chess.Piece, pos: int):
-#         piece_type = piece.piece_type
-#         if piece_type == chess.BLACK:
-#             pos = 63 - pos
-#
-#         if piece_type == chess.PAWN:
-#             return self.pos_pawn[pos]
-#         elif piece_type == chess.KNIGHT:
-#             return self.pos_knight[pos]
-#         elif piece_type == chess.BISHOP:
-#             return self.pos_bishop[pos]
-#         elif piece_type == chess.ROOK:
-#             return self.pos_rook[pos]
-#         elif piece_type == chess.QUEEN:
-#             return self.pos_queen[pos]
-#         elif piece_type == chess.KING:
-#             return self.pos_king[pos]
-#
-#         raise Exception("Invalid piece " + str(piece))
-#
-#     def evaluate_board(self):
-#         if self.board.is_checkmate():
-#             return 1e9 if self.board.turn else -1e9
-#         if self.board.is_stalemate():
-#             return 0
-#
-#         total = 0
-#
-#         piece_map = self.board.piece_map()
-#
-#         for piece_index in piece_map.keys():
-#             piece = piece_map[piece_index]
-#             value = self.get_pos_value(piece, piece_index)
-#             if piece.color == chess.BLACK:
-#                 total -= value
-#             else:
-#                 total += value
-#
-#         return total
+    def push_move(self, move: chess.Move):
+        self.pst.push(self.board, move)
+        self.board.push(move)
+
+    def pop_move(self):
+        self.pst.pop()
+        self.board.pop()
+
+    def evaluate_board(self):
+        score = evaluate.terminal_score(self.board)
+        if score is not None:
+            return score
+
+        return self.pst.score()
 
 
 class MiniMaxComplex(MiniMaxAbstract):
@@ -422,6 +577,33 @@ class MiniMaxComplex(MiniMaxAbstract):
         self.eval_description = "Mixed position/material values"
 
     def evaluate_board(self):
-        return evaluate.evaluate_complex(self.board)
+        return evaluate.evaluate_complex(self.board, self.pawn_cache)
+
 
+class MiniMaxNNUE(MiniMaxAbstract):
+    def __init__(self, board: chess.Board, depth: int, *args, **kwargs):
+        super().__init__(board, depth, *args, **kwargs)
+        self.eval_description = "Quantized NNUE network"
+        self.pawn_eval = pst.material[chess.PAWN]
+        self.network = nnue.load_network(main.Config.NNUE_FILE)
+        self.accumulator: nnue.Accumulator = None
+
+    def begin_search(self):
+        self.accumulator = nnue.Accumulator(self.network, self.board)
+
+    def push_move(self, move: chess.Move):
+        self.accumulator.push(self.board, move)
+        self.board.push(move)
+
+    def pop_move(self):
+        self.accumulator.pop()
+        self.board.pop()
+
+    def evaluate_board(self):
+        score = evaluate.terminal_score(self.board)
+        if score is not None:
+            return score
 
+        # The network scores for the side to move
+        score = self.accumulator.evaluate(self.board)
+        return score if self.board.turn == chess.WHITE else -score
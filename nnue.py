@@ -0,0 +1,211 @@
+import argparse
+import os
+
+import chess
+import numpy as np
+
+# HalfKP: for each perspective, (own king square, non-king piece, square) with squares flipped for black
+PIECE_INDICES = 10
+FEATURES = 64 * PIECE_INDICES * 64
+
+FT_SIZE = 64  # Accumulator width per perspective
+L1_SIZE = 32
+L2_SIZE = 32
+
+# Quantization: activations are 0..QA, hidden layer weights are scaled by QB and shifted back after each layer
+QA = 127
+QB = 64
+QB_SHIFT = 6
+OUTPUT_SCALE = 600  # Network output 1.0 in evaluation units
+
+
+def feature_index(perspective: chess.Color, king_square: chess.Square, color: chess.Color,
+                  piece_type: chess.PieceType, square: chess.Square) -> int:
+    if perspective == chess.BLACK:
+        king_square = chess.square_mirror(king_square)
+        square = chess.square_mirror(square)
+    piece_index = (piece_type - 1) + (0 if color == perspective else 5)
+    return (king_square * PIECE_INDICES + piece_index) * 64 + square
+
+
+def active_features(chessboard: chess.Board, perspective: chess.Color) -> [int]:
+    king_square = chessboard.king(perspective)
+    features = []
+    for color in chess.COLORS:
+        for piece_type in [chess.PAWN, chess.KNIGHT, chess.BISHOP, chess.ROOK, chess.QUEEN]:
+            for square in chess.scan_forward(chessboard.pieces_mask(piece_type, color)):
+                features.append(feature_index(perspective, king_square, color, piece_type, square))
+    return features
+
+
+def move_changes(chessboard: chess.Board, move: chess.Move):
+    """Pieces (color, piece_type, square) removed and added by move, and whether the mover's king moved"""
+    if not move:
+        return [], [], False
+
+    color = chessboard.turn
+    piece_type = chessboard.piece_type_at(move.from_square)
+    to_square = move.to_square
+    removed = [(color, piece_type, move.from_square)]
+    added = []
+
+    if chessboard.is_castling(move):
+        rank = chess.square_rank(move.from_square)
+        kingside = chessboard.is_kingside_castling(move)
+        rook_from = chess.square(7 if kingside else 0, rank)
+        if chessboard.piece_type_at(to_square) == chess.ROOK:
+            rook_from = to_square  # Chess960 style king-takes-rook encoding
+        removed.append((color, chess.ROOK, rook_from))
+        added.append((color, chess.ROOK, chess.square(5 if kingside else 3, rank)))
+        to_square = chess.square(6 if kingside else 2, rank)
+    else:
+        captured_square = to_square
+        if chessboard.is_en_passant(move):
+            captured_square = chess.square(chess.square_file(to_square), chess.square_rank(move.from_square))
+        captured_type = chessboard.piece_type_at(captured_square)
+        if captured_type is not None:
+            removed.append((not color, captured_type, captured_square))
+
+    added.append((color, move.promotion or piece_type, to_square))
+    return removed, added, piece_type == chess.KING
+
+
+class Network:
+    """Quantized network weights, loaded from an .npz file written by random_network or a trainer"""
+
+    def __init__(self, path: str):
+        data = np.load(path)
+        self.ft_weight = data["ft_weight"].astype(np.int16)  # (FEATURES, FT_SIZE), scaled by QA
+        self.ft_bias = data["ft_bias"].astype(np.int16)
+        self.l1_weight = data["l1_weight"].astype(np.int8)  # (L1_SIZE, 2 * FT_SIZE), scaled by QB
+        self.l1_bias = data["l1_bias"].astype(np.int32)  # scaled by QA * QB
+        self.l2_weight = data["l2_weight"].astype(np.int8)
+        self.l2_bias = data["l2_bias"].astype(np.int32)
+        self.out_weight = data["out_weight"].astype(np.int8)  # (1, L2_SIZE)
+        self.out_bias = data["out_bias"].astype(np.int32)
+
+        # Wider copies for the matvecs, so products never overflow
+        self.l1_weight32 = self.l1_weight.astype(np.int32)
+        self.l2_weight32 = self.l2_weight.astype(np.int32)
+        self.out_weight32 = self.out_weight.astype(np.int32)
+
+    def refresh(self, chessboard: chess.Board, perspective: chess.Color) -> np.ndarray:
+        features = active_features(chessboard, perspective)
+        return self.ft_bias.astype(np.int32) + self.ft_weight[features].sum(axis=0, dtype=np.int32)
+
+    def forward(self, own: np.ndarray, other: np.ndarray) -> float:
+        """Quantized evaluation from the two accumulators, side to move first"""
+        # Clipped ReLU; np.clip has several times the call overhead of maximum and minimum on arrays this small
+        x = np.minimum(np.maximum(np.concatenate((own, other)), 0), QA)
+        x = np.minimum(np.maximum((self.l1_weight32 @ x + self.l1_bias) >> QB_SHIFT, 0), QA)
+        x = np.minimum(np.maximum((self.l2_weight32 @ x + self.l2_bias) >> QB_SHIFT, 0), QA)
+        out = int((self.out_weight32 @ x + self.out_bias)[0])
+        return out * OUTPUT_SCALE / (QA * QB)
+
+    def evaluate(self, chessboard: chess.Board) -> float:
+        """Quantized evaluation refreshed from scratch, for the side to move"""
+        turn = chessboard.turn
+        return self.forward(self.refresh(chessboard, turn), self.refresh(chessboard, not turn))
+
+    def evaluate_reference(self, chessboard: chess.Board) -> float:
+        """Float implementation of the same network, for the side to move"""
+        def accumulate(perspective):
+            features = active_features(chessboard, perspective)
+            return (self.ft_bias + self.ft_weight[features].sum(axis=0, dtype=np.float64)) / QA
+
+        turn = chessboard.turn
+        x = np.clip(np.concatenate((accumulate(turn), accumulate(not turn))), 0, 1)
+        x = np.clip(self.l1_weight / QB @ x + self.l1_bias / (QA * QB), 0, 1)
+        x = np.clip(self.l2_weight / QB @ x + self.l2_bias / (QA * QB), 0, 1)
+        return float((self.out_weight / QB @ x + self.out_bias / (QA * QB))[0]) * OUTPUT_SCALE
+
+
+_networks = {}
+
+
+def load_network(path: str) -> Network:
+    """Network at path, loaded once per process however many agents use it"""
+    if path not in _networks:
+        if not os.path.exists(path):
+            raise FileNotFoundError("No NNUE weights at {}, create them with nnue.py".format(path))
+        _networks[path] = Network(path)
+    return _networks[path]
+
+
+class Accumulator:
+    """
+    Feature transformer output for both perspectives, kept up to date as moves are pushed and popped. A king move
+    changes every feature of its own side, so that perspective is marked stale and refreshed from the board the next
+    time it is needed, as it is in Stockfish.
+    """
+
+    def __init__(self, network: Network, chessboard: chess.Board):
+        self.network = network
+        self.values = [network.refresh(chessboard, chess.BLACK), network.refresh(chessboard, chess.WHITE)]
+        self.stack = []
+
+    def refresh_stale(self, chessboard: chess.Board):
+        for perspective in chess.COLORS:
+            if self.values[perspective] is None:
+                self.values[perspective] = self.network.refresh(chessboard, perspective)
+
+    def push(self, chessboard: chess.Board, move: chess.Move):
+        """Must be called before move is pushed onto chessboard"""
+        self.refresh_stale(chessboard)
+        self.stack.append(self.values)
+
+        removed, added, king_moved = move_changes(chessboard, move)
+        if not removed:
+            return  # Null move, nothing changes
+
+        weight = self.network.ft_weight
+        values = list(self.values)
+        for perspective in chess.COLORS:
+            if king_moved and perspective == chessboard.turn:
+                values[perspective] = None
+                continue
+
+            king_square = chessboard.king(perspective)
+            add = [feature_index(perspective, king_square, *piece) for piece in added if piece[1] != chess.KING]
+            remove = [feature_index(perspective, king_square, *piece) for piece in removed if piece[1] != chess.KING]
+            values[perspective] = (values[perspective] + weight[add].sum(axis=0, dtype=np.int32)
+                                   - weight[remove].sum(axis=0, dtype=np.int32))
+        self.values = values
+
+    def pop(self):
+        self.values = self.stack.pop()
+
+    def evaluate(self, chessboard: chess.Board) -> float:
+        """Quantized evaluation for the side to move"""
+        self.refresh_stale(chessboard)
+        turn = chessboard.turn
+        return self.network.forward(self.values[turn], self.values[not turn])
+
+
+def random_network(path: str, seed: int):
+    """Writes a randomly initialised network, a starting point for training and for tests"""
+    rng = np.random.default_rng(seed)
+
+    def quantize(values, dtype):
+        info = np.iinfo(dtype)
+        return np.clip(np.round(values), info.min, info.max).astype(dtype)
+
+    np.savez_compressed(
+        path,
+        ft_weight=quantize(rng.normal(0, 0.05, (FEATURES, FT_SIZE)) * QA, np.int16),
+        ft_bias=quantize(rng.normal(0.3, 0.1, FT_SIZE) * QA, np.int16),
+        l1_weight=quantize(rng.normal(0, 0.15, (L1_SIZE, 2 * FT_SIZE)) * QB, np.int8),
+        l1_bias=quantize(rng.normal(0, 0.1, L1_SIZE) * QA * QB, np.int32),
+        l2_weight=quantize(rng.normal(0, 0.2, (L2_SIZE, L1_SIZE)) * QB, np.int8),
+        l2_bias=quantize(rng.normal(0, 0.1, L2_SIZE) * QA * QB, np.int32),
+        out_weight=quantize(rng.normal(0, 0.3, (1, L2_SIZE)) * QB, np.int8),
+        out_bias=quantize(np.zeros(1), np.int32),
+    )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Create a randomly initialised NNUE weights file")
+    parser.add_argument("--output", default="nnue.npz")
+    parser.add_argument("--seed", type=int, default=69)
+    args = parser.parse_args()
+    random_network(args.output, args.seed)
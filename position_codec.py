@@ -0,0 +1,122 @@
+import struct
+
+import chess
+
+from search_trace import pack_move, unpack_move
+
+# Encoded position: occupancy bitboard, flags (bit 0 white to move, bits 1-4 castling rights on a1, h1, a8 and h8),
+# en passant square (0xFF for none), halfmove clock, fullmove number and the number of history moves, then a nibble
+# per occupied square in square order (piece type, plus 8 for white), then the history moves packed as in
+# search_trace. The start position takes 31 bytes
+HEADER = struct.Struct("<QBBHHB")
+MOVE = struct.Struct("<H")
+
+NO_EP = 0xFF
+MAX_HISTORY = 0xFF
+CASTLING_SQUARES = [chess.A1, chess.H1, chess.A8, chess.H8]
+CASTLING_MASK = chess.BB_A1 | chess.BB_H1 | chess.BB_A8 | chess.BB_H8
+
+# Nibble of each (color, piece type), and the chess.Board bitboard attribute each piece type is kept in
+PIECE_CODES = [(color, piece_type, piece_type | (8 if color else 0)) for color in chess.COLORS
+               for piece_type in chess.PIECE_TYPES]
+PIECE_ATTRIBUTES = [None, "pawns", "knights", "bishops", "rooks", "queens", "kings"]
+
+
+def encoded_size(board: chess.Board, history: int = 0) -> int:
+    return HEADER.size + (chess.popcount(board.occupied) + 1) // 2 + MOVE.size * history_length(board, history)
+
+
+def history_length(board: chess.Board, history: int) -> int:
+    # Positions before the last capture or pawn move can't repeat, so older moves are never needed
+    return min(history, len(board.move_stack), board.halfmove_clock, MAX_HISTORY)
+
+
+def encode(board: chess.Board, history: int = 0) -> bytes:
+    """
+    Encodes board and up to history of its last moves. Decoding replays the moves onto the position they were
+    played from, so the decoded board's own repetition checks see them
+    """
+    buffer = bytearray(encoded_size(board, history))
+    encode_into(buffer, 0, board, history)
+    return bytes(buffer)
+
+
+def encode_into(buffer, offset: int, board: chess.Board, history: int = 0) -> int:
+    """Encodes board into buffer at offset, as encode does, returning the offset just past it"""
+    moves = []
+    length = history_length(board, history)
+    if length:
+        moves = board.move_stack[-length:]
+        board = board.copy(stack=length)
+        for i in range(length):
+            board.pop()
+
+    if board.castling_rights & ~CASTLING_MASK:
+        raise ValueError("only standard castling rights can be encoded")
+
+    flags = 1 if board.turn else 0
+    for i, square in enumerate(CASTLING_SQUARES):
+        if board.castling_rights & chess.BB_SQUARES[square]:
+            flags |= 2 << i
+    HEADER.pack_into(buffer, offset, board.occupied, flags, NO_EP if board.ep_square is None else board.ep_square,
+                     board.halfmove_clock, board.fullmove_number, len(moves))
+    offset += HEADER.size
+
+    codes = {}
+    for color, piece_type, code in PIECE_CODES:
+        for square in chess.scan_forward(board.pieces_mask(piece_type, color)):
+            codes[square] = code
+    nibbles = [codes[square] for square in chess.scan_forward(board.occupied)]
+    if len(nibbles) % 2:
+        nibbles.append(0)
+    for i in range(0, len(nibbles), 2):
+        buffer[offset] = nibbles[i] | (nibbles[i + 1] << 4)
+        offset += 1
+
+    for move in moves:
+        MOVE.pack_into(buffer, offset, pack_move(move))
+        offset += MOVE.size
+    return offset
+
+
+def decode(buffer, offset: int = 0) -> chess.Board:
+    """Board encoded in buffer at offset, which may be any bytes-like object, such as a memoryview of shared memory"""
+    return decode_from(buffer, offset)[0]
+
+
+def decode_from(buffer, offset: int = 0):
+    """(board, offset just past it) of the position encoded in buffer at offset"""
+    occupied, flags, ep_square, halfmove_clock, fullmove_number, length = HEADER.unpack_from(buffer, offset)
+    offset += HEADER.size
+
+    # Bitboards are filled in directly, which is much quicker than placing the pieces one at a time
+    bitboards = [0] * 7
+    colors = [0, 0]
+    for i, square in enumerate(chess.scan_forward(occupied)):
+        code = buffer[offset + i // 2] >> (4 * (i % 2)) & 0xF
+        mask = chess.BB_SQUARES[square]
+        bitboards[code & 7] |= mask
+        colors[code >> 3] |= mask
+    offset += (chess.popcount(occupied) + 1) // 2
+
+    board = chess.Board(None)
+    for piece_type in chess.PIECE_TYPES:
+        setattr(board, PIECE_ATTRIBUTES[piece_type], bitboards[piece_type])
+    board.occupied_co[chess.WHITE] = colors[1]
+    board.occupied_co[chess.BLACK] = colors[0]
+    board.occupied = occupied
+
+    board.turn = bool(flags & 1)
+    castling_rights = 0
+    for i, square in enumerate(CASTLING_SQUARES):
+        if flags & (2 << i):
+            castling_rights |= chess.BB_SQUARES[square]
+    board.castling_rights = castling_rights
+    board.ep_square = None if ep_square == NO_EP else ep_square
+    board.halfmove_clock = halfmove_clock
+    board.fullmove_number = fullmove_number
+
+    for i in range(length):
+        board.push(unpack_move(MOVE.unpack_from(buffer, offset)[0]))
+        offset += MOVE.size
+    return board, offset
@@ -0,0 +1,187 @@
+import argparse
+import collections
+import cProfile
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+
+import chess
+
+import bench
+import main
+import minimax
+
+
+class ProfConfig:
+    AGENT = "MiniMaxComplex"
+    DEPTH = 3
+    PUZZLES = 0  # Profile the first N puzzles instead of bench.BENCH_FENS
+
+    MODE = "sample"  # "sample" for collapsed stacks, "cprofile" for exact call counts
+    INTERVAL = 0.001  # Seconds between samples
+    TOP = 25
+
+    OUTPUT = "profile"  # Writes profile.json, plus profile.folded or profile.prof
+
+
+def frame_label(path: str, name: str) -> str:
+    module = os.path.splitext(os.path.basename(path))[0]
+    if os.sep + "chess" + os.sep in path:
+        module = "chess." + module if module != "__init__" else "chess"
+    return module + ":" + name
+
+
+class Sampler:
+    """Samples the profiled thread's stack from a background thread; stacks start at find_move"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.thread_id = threading.get_ident()
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.thread.join()
+
+    def run(self):
+        while self.running:
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(frame_label(frame.f_code.co_filename, frame.f_code.co_name))
+                if frame.f_code.co_name == "find_move":
+                    self.stacks[";".join(reversed(stack))] += 1
+                    break
+                frame = frame.f_back
+            time.sleep(self.interval)
+
+
+def summarise_samples(stacks: collections.Counter) -> dict:
+    functions = {}
+    total = sum(stacks.values())
+    for stack, count in stacks.items():
+        labels = stack.split(";")
+        for label in set(labels):
+            functions.setdefault(label, {"self": 0, "total": 0})["total"] += count
+        functions[labels[-1]]["self"] += count
+
+    # Shares rather than raw samples, so runs on different machines can be diffed
+    for function in functions.values():
+        function["self"] /= total
+        function["total"] /= total
+    return functions
+
+
+def summarise_cprofile(profile: cProfile.Profile) -> dict:
+    stats = pstats.Stats(profile)
+    functions = {}
+    total = stats.total_tt
+    for (path, line, name), (cc, nc, tt, ct, callers) in stats.stats.items():
+        label = frame_label(path, name)
+        function = functions.setdefault(label, {"self": 0, "total": 0, "calls": 0})
+        function["self"] += tt / total
+        function["total"] = max(function["total"], ct / total)
+        function["calls"] += nc
+    return functions
+
+
+def print_table(functions: dict, top: int):
+    print("{:>8} {:>8}  {}".format("self", "total", "function"))
+    ranked = sorted(functions.items(), key=lambda item: item[1]["self"], reverse=True)
+    for label, function in ranked[:top]:
+        print("{:>7.2%} {:>7.2%}  {}".format(function["self"], function["total"], label))
+
+    modules = collections.Counter()
+    for label, function in functions.items():
+        modules[label.split(":")[0].split(".")[0]] += function["self"]
+    print("\nBy module: " + ", ".join("{} {:.1%}".format(m, share) for m, share in modules.most_common()))
+
+
+def print_diff(functions: dict, baseline: dict, top: int):
+    labels = set(functions) | set(baseline)
+    changes = []
+    for label in labels:
+        new = functions.get(label, {"self": 0})["self"]
+        old = baseline.get(label, {"self": 0})["self"]
+        changes.append((new - old, old, new, label))
+
+    changes.sort(key=lambda change: abs(change[0]), reverse=True)
+    print("\n{:>8} {:>8} {:>8}  {}".format("change", "before", "after", "function"))
+    for change, old, new, label in changes[:top]:
+        print("{:>+7.2%} {:>7.2%} {:>7.2%}  {}".format(change, old, new, label))
+
+
+def profile(argv=None):
+    parser = argparse.ArgumentParser(description="Profile find_move for one MiniMax agent")
+    parser.add_argument("--agent", default=ProfConfig.AGENT)
+    parser.add_argument("--depth", type=int, default=ProfConfig.DEPTH)
+    parser.add_argument("--puzzles", type=int, default=ProfConfig.PUZZLES)
+    parser.add_argument("--mode", choices=["sample", "cprofile"], default=ProfConfig.MODE)
+    parser.add_argument("--interval", type=float, default=ProfConfig.INTERVAL)
+    parser.add_argument("--top", type=int, default=ProfConfig.TOP)
+    parser.add_argument("--output", default=ProfConfig.OUTPUT)
+    parser.add_argument("--diff", help="summary json of an earlier run to compare against")
+    args = parser.parse_args(argv)
+
+    main.Config.OPENING_BOOK = False
+    main.Config.INDEX_MODE = False
+    main.Config.DEBUG = False
+    main.Config.INFO = False
+
+    agent_cls = getattr(minimax, args.agent)
+    positions = bench.load_positions(args.puzzles)
+
+    # Boards and agents are built outside the profiled region; only find_move is measured
+    agents = [agent_cls(chess.Board(fen), args.depth) for fen in positions]
+    for agent in agents:
+        agent.time_limit = float("inf")
+
+    if args.mode == "sample":
+        sampler = Sampler(args.interval)
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(args.interval / 2)
+        sampler.start()
+        for agent in agents:
+            agent.find_move()
+        sampler.stop()
+        sys.setswitchinterval(switch_interval)
+
+        functions = summarise_samples(sampler.stacks)
+        with open(args.output + ".folded", "w") as io:
+            for stack in sorted(sampler.stacks):
+                io.write("{} {}\n".format(stack, sampler.stacks[stack]))
+        print("{} samples".format(sum(sampler.stacks.values())))
+    else:
+        profiler = cProfile.Profile()
+        for agent in agents:
+            profiler.enable()
+            agent.find_move()
+            profiler.disable()
+
+        profiler.dump_stats(args.output + ".prof")
+        functions = summarise_cprofile(profiler)
+
+    summary = {"agent": args.agent, "depth": args.depth, "mode": args.mode, "positions": positions,
+               "functions": functions}
+    with open(args.output + ".json", "w") as io:
+        json.dump(summary, io, indent=2, sort_keys=True)
+
+    print_table(functions, args.top)
+
+    if args.diff:
+        with open(args.diff, "r") as io:
+            print_diff(functions, json.load(io)["functions"], args.top)
+
+
+if __name__ == '__main__':
+    profile()
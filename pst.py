@@ -0,0 +1,203 @@
+import chess
+
+# Piece-square tables from white's point of view, written as the board is displayed: index 0 is a8, 63 is h1
+
+pos_pawn = [0, 0, 0, 0, 0, 0, 0, 0,
+            50, 50, 50, 50, 50, 50, 50, 50,
+            10, 10, 20, 30, 30, 20, 10, 10,
+            5, 5, 10, 25, 25, 10, 5, 5,
+            0, 0, 0, 20, 20, 0, 0, 0,
+            5, -5, -10, 0, 0, -10, -5, 5,
+            5, 10, 10, -20, -20, 10, 10, 5,
+            0, 0, 0, 0, 0, 0, 0, 0]
+
+pos_pawn_endgame = [0, 0, 0, 0, 0, 0, 0, 0,
+                    80, 80, 80, 80, 80, 80, 80, 80,
+                    50, 50, 50, 50, 50, 50, 50, 50,
+                    30, 30, 30, 30, 30, 30, 30, 30,
+                    20, 20, 20, 20, 20, 20, 20, 20,
+                    10, 10, 10, 10, 10, 10, 10, 10,
+                    0, 0, 0, 0, 0, 0, 0, 0,
+                    0, 0, 0, 0, 0, 0, 0, 0]
+
+pos_knight = [-50, -40, -30, -30, -30, -30, -40, -50,
+              -40, -20, 0, 0, 0, 0, -20, -40,
+              -30, 0, 10, 15, 15, 10, 0, -30,
+              -30, 5, 15, 20, 20, 15, 5, -30,
+              -30, 0, 15, 20, 20, 15, 0, -30,
+              -30, 5, 10, 15, 15, 10, 5, -30,
+              -40, -20, 0, 5, 5, 0, -20, -40,
+              -50, -40, -30, -30, -30, -30, -40, -50]
+
+pos_bishop = [-20, -10, -10, -10, -10, -10, -10, -20,
+              -10, 0, 0, 0, 0, 0, 0, -10,
+              -10, 0, 5, 10, 10, 5, 0, -10,
+              -10, 5, 5, 10, 10, 5, 5, -10,
+              -10, 0, 10, 10, 10, 10, 0, -10,
+              -10, 10, 10, 10, 10, 10, 10, -10,
+              -10, 5, 0, 0, 0, 0, 5, -10,
+              -20, -10, -10, -10, -10, -10, -10, -20]
+
+pos_rook = [0, 0, 0, 0, 0, 0, 0, 0,
+            5, 10, 10, 10, 10, 10, 10, 5,
+            -5, 0, 0, 0, 0, 0, 0, -5,
+            -5, 0, 0, 0, 0, 0, 0, -5,
+            -5, 0, 0, 0, 0, 0, 0, -5,
+            -5, 0, 0, 0, 0, 0, 0, -5,
+            -5, 0, 0, 0, 0, 0, 0, -5,
+            0, 0, 0, 5, 5, 0, 0, 0]
+
+pos_queen = [-20, -10, -10, -5, -5, -10, -10, -20,
+             -10, 0, 0, 0, 0, 0, 0, -10,
+             -10, 0, 5, 5, 5, 5, 0, -10,
+             -5, 0, 5, 5, 5, 5, 0, -5,
+             0, 0, 5, 5, 5, 5, 0, -5,
+             -10, 5, 5, 5, 5, 5, 0, -10,
+             -10, 0, 5, 0, 0, 0, 0, -10,
+             -20, -10, -10, -5, -5, -10, -10, -20]
+
+pos_king = [-30, -40, -40, -50, -50, -40, -40, -30,
+            -30, -40, -40, -50, -50, -40, -40, -30,
+            -30, -40, -40, -50, -50, -40, -40, -30,
+            -30, -40, -40, -50, -50, -40, -40, -30,
+            -20, -30, -30, -40, -40, -30, -30, -20,
+            -10, -20, -20, -20, -20, -20, -20, -10,
+            20, 20, 0, 0, 0, 0, 20, 20,
+            20, 30, 10, 0, 0, 10, 30, 20]
+
+pos_king_endgame = [-50, -40, -30, -20, -20, -30, -40, -50,
+                    -30, -20, -10, 0, 0, -10, -20, -30,
+                    -30, -10, 20, 30, 30, 20, -10, -30,
+                    -30, -10, 30, 40, 40, 30, -10, -30,
+                    -30, -10, 30, 40, 40, 30, -10, -30,
+                    -30, -10, 20, 30, 30, 20, -10, -30,
+                    -30, -30, 0, 0, 0, 0, -30, -30,
+                    -50, -30, -30, -30, -30, -30, -30, -50]
+
+# Centipawn material, added to every square of the table; kings are always on the board so count nothing
+material = [0, 100, 320, 330, 500, 900, 0]
+
+middlegame_tables = [None, pos_pawn, pos_knight, pos_bishop, pos_rook, pos_queen, pos_king]
+endgame_tables = [None, pos_pawn_endgame, pos_knight, pos_bishop, pos_rook, pos_queen, pos_king_endgame]
+
+# Game phase: 24 with all minor and major pieces on the board, 0 with only kings and pawns
+PHASE_WEIGHTS = [0, 0, 1, 1, 2, 4, 0]
+MAX_PHASE = 24
+
+
+def flatten(tables, color: chess.Color) -> [int]:
+    """Signed values indexed by piece_type * 64 + square, with material included; black's are negated"""
+    sign = 1 if color == chess.WHITE else -1
+    flat = [0] * (7 * 64)
+    for piece_type in chess.PIECE_TYPES:
+        for square in chess.SQUARES:
+            # White reads the table upside down (a1 is index 56), black reads it as written
+            index = chess.square_mirror(square) if color == chess.WHITE else square
+            flat[piece_type * 64 + square] = sign * (material[piece_type] + tables[piece_type][index])
+    return flat
+
+
+MIDDLEGAME = [flatten(middlegame_tables, chess.BLACK), flatten(middlegame_tables, chess.WHITE)]
+ENDGAME = [flatten(endgame_tables, chess.BLACK), flatten(endgame_tables, chess.WHITE)]
+
+
+def taper(middlegame: int, endgame: int, phase: int) -> float:
+    phase = min(phase, MAX_PHASE)
+    return (middlegame * phase + endgame * (MAX_PHASE - phase)) / MAX_PHASE
+
+
+def evaluate_pst(chessboard: chess.Board) -> float:
+    middlegame = endgame = phase = 0
+    for color in chess.COLORS:
+        middlegame_table = MIDDLEGAME[color]
+        endgame_table = ENDGAME[color]
+        for piece_type in chess.PIECE_TYPES:
+            offset = piece_type * 64
+            for square in chess.scan_forward(chessboard.pieces_mask(piece_type, color)):
+                middlegame += middlegame_table[offset + square]
+                endgame += endgame_table[offset + square]
+                phase += PHASE_WEIGHTS[piece_type]
+
+    return taper(middlegame, endgame, phase)
+
+
+class PSTAccumulator:
+    """
+    Keeps the middlegame and endgame sums and the phase of a board up to date as moves are pushed and popped, so
+    evaluating a leaf is a taper instead of a scan over every piece.
+    """
+
+    def __init__(self, chessboard: chess.Board):
+        self.middlegame = self.endgame = self.phase = 0
+        self.stack = []
+
+        for color in chess.COLORS:
+            for piece_type in chess.PIECE_TYPES:
+                for square in chess.scan_forward(chessboard.pieces_mask(piece_type, color)):
+                    self.middlegame += MIDDLEGAME[color][piece_type * 64 + square]
+                    self.endgame += ENDGAME[color][piece_type * 64 + square]
+                    self.phase += PHASE_WEIGHTS[piece_type]
+
+    def push(self, chessboard: chess.Board, move: chess.Move):
+        """Must be called before move is pushed onto chessboard"""
+        delta = move_delta(chessboard, move)
+        self.middlegame += delta[0]
+        self.endgame += delta[1]
+        self.phase += delta[2]
+        self.stack.append(delta)
+
+    def pop(self):
+        delta = self.stack.pop()
+        self.middlegame -= delta[0]
+        self.endgame -= delta[1]
+        self.phase -= delta[2]
+
+    def score(self) -> float:
+        return taper(self.middlegame, self.endgame, self.phase)
+
+
+def move_delta(chessboard: chess.Board, move: chess.Move):
+    """Change in (middlegame, endgame, phase) from playing move on chessboard"""
+    if not move:
+        return 0, 0, 0
+
+    color = chessboard.turn
+    middlegame_table = MIDDLEGAME[color]
+    endgame_table = ENDGAME[color]
+
+    from_square = move.from_square
+    to_square = move.to_square
+    piece_type = chessboard.piece_type_at(from_square)
+    new_type = move.promotion or piece_type
+
+    middlegame = endgame = phase = 0
+
+    if chessboard.is_castling(move):
+        rank = chess.square_rank(from_square)
+        kingside = chessboard.is_kingside_castling(move)
+        rook_from = chess.square(7 if kingside else 0, rank)
+        if chessboard.piece_type_at(to_square) == chess.ROOK:
+            rook_from = to_square  # Chess960 style king-takes-rook encoding
+        rook_to = chess.square(5 if kingside else 3, rank)
+        to_square = chess.square(6 if kingside else 2, rank)
+
+        rook = chess.ROOK * 64
+        middlegame += middlegame_table[rook + rook_to] - middlegame_table[rook + rook_from]
+        endgame += endgame_table[rook + rook_to] - endgame_table[rook + rook_from]
+    else:
+        captured_square = to_square
+        if chessboard.is_en_passant(move):
+            captured_square = chess.square(chess.square_file(to_square), chess.square_rank(from_square))
+
+        captured_type = chessboard.piece_type_at(captured_square)
+        if captured_type is not None:
+            # Removing the opponent's signed value
+            middlegame -= MIDDLEGAME[not color][captured_type * 64 + captured_square]
+            endgame -= ENDGAME[not color][captured_type * 64 + captured_square]
+            phase -= PHASE_WEIGHTS[captured_type]
+
+    middlegame += middlegame_table[new_type * 64 + to_square] - middlegame_table[piece_type * 64 + from_square]
+    endgame += endgame_table[new_type * 64 + to_square] - endgame_table[piece_type * 64 + from_square]
+    phase += PHASE_WEIGHTS[new_type] - PHASE_WEIGHTS[piece_type]
+
+    return middlegame, endgame, phase
@@ -1,13 +1,21 @@
+import csv
+import io
+import itertools
 import random
+import struct
+import sys
 import time
 
 import chess
 import chess.pgn
 
 import main
-from chessboard import display
 import agent
+import batch_eval
 import minimax
+import render
+import results
+import search_trace
 
 
 class PuzConfig:
@@ -23,11 +31,28 @@ class PuzConfig:
     GUI = False
     GUI_PREVIEW = False
 
+    # Plain .csv or the .csv.zst Lichess distributes, which is decompressed while it is read (needs zstandard)
+    PUZZLE_FILE = "puzzles/lichess_db_puzzle.csv"
+    READ_CHUNK = 1 << 20  # Bytes decompressed at a time
+
     MIN_RATING = 1501
     MAX_RATING = 1750
+    THEMES = []  # Only keep puzzles with at least one of these themes (empty = keep all)
+
+    # Skip puzzles where the solver's evaluate_material balance is already beyond this (None = keep all)
+    MAX_MATERIAL_IMBALANCE = None
 
     MINIMAX_MIN_DEPTH = 1
     MINIMAX_MAX_DEPTH = 3
+    # Solve every depth from one iterative deepening search per position, with the transposition table kept warm
+    # across a puzzle's follow-up moves. The first move at each depth is exactly what a fresh agent of that depth
+    # plays; later moves are searched with entries left by deeper searches
+    SHARED_DEPTH_SEARCH = True
+    # Mate puzzles are given to the mate solver first, looking for a mate in as many moves as the solution has
+    MATE_SOLVER = True
+
+    # Attempts are stored here as they finish and skipped when re-run with the same engine version (None = off)
+    RESULTS_DB = results.ResultsConfig.DB_FILE
 
 
 random.seed(PuzConfig.RANDOM_SEED)
@@ -38,73 +63,183 @@ if PuzConfig.LOAD_TESTS < PuzConfig.NUM_TESTS:
 if PuzConfig.MINIMAX_MIN_DEPTH > PuzConfig.MINIMAX_MAX_DEPTH:
     PuzConfig.MINIMAX_MAX_DEPTH = PuzConfig.MINIMAX_MIN_DEPTH
 
-def load_puzzles():
-    # LiChess format: PuzzleId,FEN,Moves,Rating,RatingDeviation,Popularity,NbPlays,Themes,GameUrl
-    file = open("puzzles/lichess_db_puzzle.csv", "r")
+def open_puzzle_file(path: str, chunk_size: int = None):
+    """Text stream over a puzzle CSV, decompressing .zst files on the fly so they never have to be unpacked on disk"""
+    chunk_size = PuzConfig.READ_CHUNK if chunk_size is None else chunk_size
+    if not path.endswith(".zst"):
+        return open(path, "r", newline="", buffering=chunk_size)
+
+    import zstandard
+
+    raw = open(path, "rb")
+    reader = zstandard.ZstdDecompressor().stream_reader(raw, read_size=chunk_size, closefd=True)
+    return io.TextIOWrapper(io.BufferedReader(reader, buffer_size=chunk_size), encoding="utf-8", newline="")
 
+
+def iter_puzzles(path: str = None, min_rating: int = None, max_rating: int = None, themes: [str] = None):
+    """
+    Lazily yields the Puzzles in path within the rating range and with any of themes, as the file is read. Arguments
+    left as None come from PuzConfig
+    """
+    path = PuzConfig.PUZZLE_FILE if path is None else path
+    min_rating = PuzConfig.MIN_RATING if min_rating is None else min_rating
+    max_rating = PuzConfig.MAX_RATING if max_rating is None else max_rating
+    themes = PuzConfig.THEMES if themes is None else themes
+
+    # LiChess format: PuzzleId,FEN,Moves,Rating,RatingDeviation,Popularity,NbPlays,Themes,GameUrl[,OpeningTags]
     # Sample line:
     # 000aY,r4rk1/pp3ppp/2n1b3/q1pp2B1/8/P1Q2NP1/1PP1PP1P/2KR3R w - - 0 15,g5e7 a5c3 b2c3 c6e7,1407,75,91,243,advantage master middlegame short,https://lichess.org/iihZGl6t#29
+    wanted_themes = set(themes)
+
+    with open_puzzle_file(path) as file:
+        for row in csv.reader(file):
+            if not row or row[0] == "PuzzleId":
+                continue
+
+            # Filter on the cheap columns before building anything
+            rating = int(row[3])
+            if rating < min_rating or rating > max_rating:
+                continue
+            line_themes = row[7].split(" ")
+            if wanted_themes and wanted_themes.isdisjoint(line_themes):
+                continue
+
+            yield Puzzle(row[0], row[1], row[2].split(" "), rating, int(row[4]), int(row[5]), int(row[6]),
+                         line_themes, row[8])
 
-    puzzle_cache = []
-    loaded_puzzles = 0
-
-    total_ratings = 0
-    for line_index, line in enumerate(file):
-        if loaded_puzzles >= PuzConfig.LOAD_TESTS:
-            break
-
-        split = line.split(",")
-        line_id = split[0]
-        line_fen = split[1]
-        line_moves = split[2]
-        line_rating = split[3]
-        line_rating_deviation = split[4]
-        line_popularity = split[5]
-        line_nb_plays = split[6]
-        line_themes = split[7]
-        line_gameurl = split[8]
-
-        moves = line_moves.split(" ")
-        rating = int(line_rating)
-        rating_deviation = int(line_rating_deviation)
-        popularity = int(line_popularity)
-        plays = int(line_nb_plays)
-        themes = line_themes.split(" ")
-
-        if rating < PuzConfig.MIN_RATING or rating > PuzConfig.MAX_RATING:
-            continue
-
-        puzzle = Puzzle(line_id, line_fen, moves, rating, rating_deviation, popularity, plays, themes, line_gameurl)
-        puzzle_cache.append(puzzle)
-
-        loaded_puzzles += 1
-        total_ratings += rating
+
+def load_puzzles():
+    puzzle_cache = list(itertools.islice(iter_puzzles(), PuzConfig.LOAD_TESTS))
 
     if len(puzzle_cache) < 1:
         print("WARN no puzzles loaded")
     else:
-        print("Loaded {} puzzles. Average rating: {}".format(loaded_puzzles, (total_ratings / loaded_puzzles)))
+        total_ratings = sum(puz.rating for puz in puzzle_cache)
+        print("Loaded {} puzzles. Average rating: {}".format(len(puzzle_cache), (total_ratings / len(puzzle_cache))))
     return puzzle_cache
 
 
+def select_puzzles():
+    """The puzzles to run, streamed straight from the file unless they have to be picked at random or prescreened"""
+    if not PuzConfig.RANDOM_TESTS and PuzConfig.MAX_MATERIAL_IMBALANCE is None:
+        return itertools.islice(iter_puzzles(), PuzConfig.NUM_TESTS)
+
+    puzzles = prescreen_puzzles(load_puzzles())
+    if not PuzConfig.RANDOM_TESTS:
+        return puzzles[:PuzConfig.NUM_TESTS]
+
+    def random_puzzles():
+        for i in range(min(len(puzzles), PuzConfig.NUM_TESTS)):
+            puz = random.choice([p for p in puzzles])
+            puzzles.remove(puz)
+            yield puz
+
+    return random_puzzles()
+
+
+def prescreen_puzzles(puzzle_cache):
+    if PuzConfig.MAX_MATERIAL_IMBALANCE is None:
+        return puzzle_cache
+
+    # Material balance of every puzzle at once, from the solver's side after the opponent's first move
+    boards = []
+    for puz in puzzle_cache:
+        prescreen_board = chess.Board(puz.fen)
+        prescreen_board.push(puz.move(0))
+        boards.append(prescreen_board)
+
+    batch = batch_eval.PositionBatch(boards)
+    balance = batch_eval.evaluate_material_batch(batch) * (batch.turn * 2 - 1)
+
+    screened = [puz for puz, score in zip(puzzle_cache, balance) if abs(score) <= PuzConfig.MAX_MATERIAL_IMBALANCE]
+    print("Prescreen kept {}/{} puzzles with material balance within {}".format(len(screened), len(puzzle_cache),
+                                                                                PuzConfig.MAX_MATERIAL_IMBALANCE))
+    return screened
+
+
+# Theme names are interned once and puzzles hold their small integer ids
+THEME_NAMES: [str] = []
+THEME_IDS = {}
+
+
+def theme_id(name: str) -> int:
+    iden = THEME_IDS.get(name)
+    if iden is None:
+        iden = THEME_IDS[name] = len(THEME_NAMES)
+        THEME_NAMES.append(sys.intern(name))
+    return iden
+
+
+def make_puzzle(iden, fen, packed_moves, rating, rating_deviation, popularity, plays, themes, url):
+    # Unpickling re-interns theme names, since theme ids are only meaningful within one process
+    puzzle = Puzzle(iden, fen, [], rating, rating_deviation, popularity, plays, themes, url)
+    object.__setattr__(puzzle, "packed_moves", packed_moves)
+    return puzzle
+
+
 class Puzzle:
+    """
+    Immutable puzzle record. Moves are kept packed two bytes each and only parsed into chess.Moves when asked for;
+    the state of an attempt at solving it lives in a PuzzleSession.
+    """
+
+    __slots__ = ("iden", "fen", "packed_moves", "rating", "rating_deviation", "popularity", "plays", "theme_ids",
+                 "url")
+
     def __init__(self, iden: str, fen: str, uci_moves: [str], rating: int, rating_deviation: int, popularity: int,
                  plays: int,
                  themes: [str], url: str):
-        self.iden = iden
-        self.fen = fen
-        self.moves: [chess.Move] = []
-        self.rating = rating
-        self.rating_deviation = rating_deviation
-        self.popularity = popularity
-        self.plays = plays
-        self.themes = themes
-        self.url = url
-        self.solution_str = ""
-
-        for uci in uci_moves:
-            self.moves.append(chess.Move.from_uci(uci))
-            self.solution_str = self.solution_str + " " + uci
+        packed = [search_trace.pack_move(chess.Move.from_uci(uci)) for uci in uci_moves]
+
+        set_slot = object.__setattr__
+        set_slot(self, "iden", iden)
+        set_slot(self, "fen", fen)
+        set_slot(self, "packed_moves", struct.pack("<{}H".format(len(packed)), *packed))
+        set_slot(self, "rating", rating)
+        set_slot(self, "rating_deviation", rating_deviation)
+        set_slot(self, "popularity", popularity)
+        set_slot(self, "plays", plays)
+        set_slot(self, "theme_ids", tuple(theme_id(theme) for theme in themes))
+        set_slot(self, "url", url)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Puzzle is immutable")
+
+    def __reduce__(self):
+        return make_puzzle, (self.iden, self.fen, self.packed_moves, self.rating, self.rating_deviation,
+                             self.popularity, self.plays, self.themes, self.url)
+
+    def __len__(self):
+        return len(self.packed_moves) // 2
+
+    def move(self, index: int) -> chess.Move:
+        return search_trace.unpack_move(struct.unpack_from("<H", self.packed_moves, index * 2)[0])
+
+    @property
+    def moves(self) -> [chess.Move]:
+        return [self.move(index) for index in range(len(self))]
+
+    @property
+    def themes(self) -> [str]:
+        return [THEME_NAMES[iden] for iden in self.theme_ids]
+
+    @property
+    def solution_str(self) -> str:
+        return "".join(" " + move.uci() for move in self.moves)
+
+    @property
+    def is_mate_puzzle(self) -> bool:
+        return any("mate" in theme.lower() for theme in self.themes)
+
+
+class PuzzleSession:
+    """One attempt at solving a puzzle: the moves received so far and whether it has failed"""
+
+    __slots__ = ("puzzle", "move_index", "received_moves", "fail_reason", "failed", "is_mate_puzzle")
+
+    def __init__(self, puzzle: Puzzle):
+        self.puzzle = puzzle
+        self.is_mate_puzzle = puzzle.is_mate_puzzle
 
         self.move_index = 0
         self.received_moves: [chess.Move] = []
@@ -112,15 +247,9 @@ class Puzzle:
         self.fail_reason: str = "No reason defined"
         self.failed = False
 
-        self.is_mate_puzzle = False
-        for theme in self.themes:
-            if "mate" in theme.lower():
-                self.is_mate_puzzle = True
-                break
-
     def setup(self, p_board: chess.Board):
         p_board.clear()
-        p_board.set_fen(self.fen)
+        p_board.set_fen(self.puzzle.fen)
 
         self.received_moves = []
         self.move_index = 0
@@ -135,7 +264,7 @@ class Puzzle:
             self.fail_reason = "Puzzle setup failed: {}".format(self.fail_reason)
 
     def correct_next_move(self):
-        return self.moves[self.move_index]
+        return self.puzzle.move(self.move_index)
 
     def receive_move(self, receive_board: chess.Board, move_check: chess.Move):
         self.received_moves.append(move_check)
@@ -163,11 +292,82 @@ class Puzzle:
 
     def is_complete(self):
         # Checkmate puzzles can be completed in multiple ways sometimes
-        return self.move_index >= len(self.moves) or (self.failed and not self.is_mate_puzzle)
+        return self.move_index >= len(self.puzzle) or (self.failed and not self.is_mate_puzzle)
+
+
+def expect_mate(solver, puz: Puzzle):
+    if PuzConfig.MATE_SOLVER and puz.is_mate_puzzle and hasattr(solver, "mate_depth"):
+        solver.mate_depth = len(puz) // 2
+
+
+def fix_depth(solver):
+    # Results are kept per depth, so searches go to their full depth rather than stopping once the move is stable
+    if hasattr(solver, "manage_time"):
+        solver.manage_time = False
+
+
+def new_agent(agent_cls, board: chess.Board, depth: int):
+    agent = agent_cls(board) if depth == -1 else agent_cls(board, depth)
+    _descriptions[agent_cls] = agent.eval_description
+    return agent
+
+
+# Agent class to its eval description, so agents need only be built to search
+_descriptions = {}
+
+
+def eval_description(agent_cls) -> str:
+    if agent_cls not in _descriptions:
+        new_agent(agent_cls, chess.Board(), 1 if issubclass(agent_cls, minimax.MiniMaxAbstract) else -1)
+    return _descriptions[agent_cls]
+
+
+def solve_depths(agent_cls, puz: Puzzle, depths: [int]):
+    """
+    Attempts puz at every depth with one agent, searching each distinct position once to the deepest depth that
+    reached it. Returns {depth: (session, elapsed, nodes)}, counting the iterations that depth would have searched
+    """
+    boards = {depth: chess.Board() for depth in depths}
+    sessions = {depth: PuzzleSession(puz) for depth in depths}
+    elapsed = dict.fromkeys(depths, 0.0)
+    nodes = dict.fromkeys(depths, 0)
+    for depth in depths:
+        sessions[depth].setup(boards[depth])
+
+    agent_turn = boards[depths[0]].turn
+    shared_agent = new_agent(agent_cls, boards[depths[0]], max(depths))
+    fix_depth(shared_agent)
+    expect_mate(shared_agent, puz)
+
+    while not all(session.is_complete() for session in sessions.values()):
+        # Depths still on the puzzle's line share a position, and so a search
+        waiting = {}
+        for depth in depths:
+            session = sessions[depth]
+            if session.is_complete():
+                continue
+            if boards[depth].turn == agent_turn:
+                waiting.setdefault(boards[depth].fen(), []).append(depth)
+            else:
+                session.receive_move(boards[depth], session.correct_next_move())
+
+        for group in waiting.values():
+            shared_agent.board = boards[group[0]]
+            shared_agent.depth = max(group)
+            shared_agent.find_move()
+
+            moves = shared_agent.moves_by_depth(group)
+            for depth in group:
+                iterations = shared_agent.iterations[:depth]
+                elapsed[depth] += sum(it["time"] for it in iterations)
+                nodes[depth] += sum(it["nodes"] for it in iterations)
+                sessions[depth].receive_move(boards[depth], moves[depth])
+
+    return {depth: (sessions[depth], elapsed[depth], nodes[depth]) for depth in depths}
 
 
 def hide_pieces():
-    display.start("8/8/8/8/8/8/8/8 b - - 0 1")
+    render.shared_display().show("8/8/8/8/8/8/8/8 b - - 0 1")
 
 
 def blink_display(blinks, fen):
@@ -175,19 +375,20 @@ def blink_display(blinks, fen):
         hide_pieces()
         time.sleep(0.2)
 
-        display.start(fen)
+        render.shared_display().show(fen)
         time.sleep(0.2)
 
 
 def preview_puzzle(previewing_board, previewing_puzzle):
     blink_display(2, previewing_puzzle.fen)
-    while not previewing_puzzle.is_complete():
+    session = PuzzleSession(previewing_puzzle)
+    while not session.is_complete():
         time.sleep(2)
 
-        preview_move = previewing_puzzle.correct_next_move()
-        previewing_puzzle.receive_move(previewing_board, preview_move)
+        preview_move = session.correct_next_move()
+        session.receive_move(previewing_board, preview_move)
 
-        display.start(previewing_board.fen())
+        render.shared_display().show(previewing_board.fen())
 
     time.sleep(2)
     hide_pieces()
@@ -207,10 +408,11 @@ if __name__ == '__main__':
     if PuzConfig.LOAD_TESTS > 5000:
         print("Loading puzzles...")
 
-    puzzles = load_puzzles()
+    puzzles = select_puzzles()
 
     basic_agents = [agent.RandomAgent, agent.BetterRandom]
-    minimax_agents = [minimax.MiniMaxMaterial, minimax.MiniMaxMobility, minimax.MiniMaxComplex]
+    minimax_agents = [minimax.MiniMaxMaterial, minimax.MiniMaxMobility, minimax.MiniMaxPosition,
+                      minimax.MiniMaxComplex]
 
     agents = []
     if PuzConfig.BASIC_AGENTS:
@@ -220,18 +422,20 @@ if __name__ == '__main__':
         for mini in minimax_agents:
             agents.append(mini)
 
-    total_puzzles = min(len(puzzles), PuzConfig.NUM_TESTS)
+    store = None
+    if PuzConfig.RESULTS_DB is not None and not PuzConfig.VALIDATE_TESTS:
+        store = results.ResultsStore(PuzConfig.RESULTS_DB, options={"mate_solver": PuzConfig.MATE_SOLVER,
+                                                                    "shared_depth": PuzConfig.SHARED_DEPTH_SEARCH})
+        print("Storing results in {} (engine version {})".format(PuzConfig.RESULTS_DB, store.version))
+
+    total_puzzles = PuzConfig.NUM_TESTS  # Upper bound until the stream runs out
+    solved_puzzles = 0
     total_plies = 0
     passed = failed = 0
 
-    for i in range(0, total_puzzles):
-        if PuzConfig.RANDOM_TESTS:
-            puz = random.choice([p for p in puzzles])
-            puzzles.remove(puz)
-        else:
-            puz = puzzles[i]
-
-        total_plies += len(puz.moves)
+    for i, puz in enumerate(puzzles):
+        solved_puzzles += 1
+        total_plies += len(puz)
         board = chess.Board(puz.fen)
 
         print(
@@ -247,48 +451,75 @@ if __name__ == '__main__':
             if "MiniMax" in agent_name:
                 depths = [i for i in range(PuzConfig.MINIMAX_MIN_DEPTH, PuzConfig.MINIMAX_MAX_DEPTH + 1)]
 
+            shared = None
+            if depths != [-1] and PuzConfig.SHARED_DEPTH_SEARCH and not PuzConfig.GUI and not PuzConfig.VALIDATE_TESTS:
+                unsolved = [depth for depth in depths if store is None or store.get(puz.iden, agent_name, depth) is None]
+                if unsolved:
+                    shared = solve_depths(agent_cls, puz, unsolved)
+
             for depth in depths:
-                if depth != -1:
-                    agent = agent_cls(board, depth)
-                else:
-                    agent = agent_cls(board)
+                stored = None if store is None else store.get(puz.iden, agent_name, depth)
+                if stored is not None:
+                    stored_passed, fail_reason, agent_moves_str, nodes, elapsed = stored
+                    if depth == -1 or depth == PuzConfig.MINIMAX_MIN_DEPTH:
+                        print("\n\t{} - {}".format(agent_name, eval_description(agent_cls)))
+
+                    agent_cls.elapsed += elapsed
+                    if stored_passed:
+                        agent_cls.passed += 1
+                        passed += 1
+                    else:
+                        agent_cls.failed += 1
+                        failed += 1
+                    print("\t\t{}: {} (stored)".format("Depth " + str(depth) if depth != -1 else "Output",
+                                                        agent_moves_str))
+                    continue
+
+                # Only built when it has to search; shared results and stored ones need no agent of their own
+                if shared is None:
+                    agent = new_agent(agent_cls, board, depth)
+                    fix_depth(agent)
+                    expect_mate(agent, puz)
 
-                if PuzConfig.GUI and (depth == -1 or depth == 1):
-                    blink_display(1, puz.fen)
-                    time.sleep(1)
+                if depth == -1 or depth == PuzConfig.MINIMAX_MIN_DEPTH:
+                    print("\n\t{} - {}".format(agent_name, eval_description(agent_cls)))
 
-                puz.setup(board)
+                if shared is not None:
+                    session, elapsed, nodes = shared[depth]
+                else:
+                    if PuzConfig.GUI and (depth == -1 or depth == 1):
+                        blink_display(1, puz.fen)
+                        time.sleep(1)
 
-                if PuzConfig.GUI and (depth == -1 or depth == 1):
-                    display.start(board.board_fen())
-                    time.sleep(1)
+                    session = PuzzleSession(puz)
+                    session.setup(board)
 
-                if depth == -1 or depth == PuzConfig.MINIMAX_MIN_DEPTH:
-                    print("\n\t{} - {}".format(agent_name, agent.eval_description))
+                    if PuzConfig.GUI and (depth == -1 or depth == 1):
+                        render.shared_display().show(board.board_fen())
+                        time.sleep(1)
 
-                agent_turn = board.turn
-                start_time = time.time()
-                while not puz.is_complete():
-                    if board.turn == agent_turn and not PuzConfig.VALIDATE_TESTS:
-                        move = agent.find_move()
-                    else:
-                        move = puz.correct_next_move()
+                    agent_turn = board.turn
+                    start_time = time.time()
+                    while not session.is_complete():
+                        if board.turn == agent_turn and not PuzConfig.VALIDATE_TESTS:
+                            move = agent.find_move()
+                        else:
+                            move = session.correct_next_move()
 
-                    puz.receive_move(board, move)
-                    if PuzConfig.GUI:
-                        display.start(board.board_fen())
-                        time.sleep(1)
-                        start_time += 1
+                        session.receive_move(board, move)
+                        if PuzConfig.GUI:
+                            render.shared_display().show(board.board_fen())
 
-                elapsed = time.time() - start_time
+                    elapsed = time.time() - start_time
+                    nodes = getattr(agent, "nodes", None)
                 agent_cls.elapsed += elapsed
 
                 agent_moves_str = ""
-                for m in puz.received_moves:
+                for m in session.received_moves:
                     agent_moves_str = agent_moves_str + " " + m.uci()
 
-                if puz.failed:
-                    result = "FAILED move {}: {}".format(puz.move_index, puz.fail_reason)
+                if session.failed:
+                    result = "FAILED move {}: {}".format(session.move_index, session.fail_reason)
                     agent_cls.failed += 1
                     failed += 1
                 else:
@@ -303,7 +534,18 @@ if __name__ == '__main__':
                     prefix = "Output"
 
                 print("\t\t{}: {}".format(prefix, agent_moves_str))
-                print("\t\t\t: {}: ({:.3f}s)".format(result, elapsed))
+                if store is not None:
+                    store.record(puz, agent_name, depth, not session.failed, session.fail_reason, agent_moves_str,
+                                 nodes, elapsed)
+                if nodes is not None:
+                    print("\t\t\t: {}: ({:.3f}s, {} nodes)".format(result, elapsed, nodes))
+                    if shared is None and agent.stats is not None:
+                        main.debug("\t\t\t  " + agent.stats.to_json())
+                else:
+                    print("\t\t\t: {}: ({:.3f}s)".format(result, elapsed))
+
+    if store is not None:
+        store.close()
 
     if PuzConfig.VALIDATE_TESTS:
         print("\n------------------------------------")
@@ -314,7 +556,7 @@ if __name__ == '__main__':
     pass_rate = (passed / total_tests) * 100
 
     total_plies = total_plies / 2
-    avg_puzzle_len = total_plies / total_puzzles
+    avg_puzzle_len = total_plies / solved_puzzles
 
     print("\nSUMMARY \n\tTotal: passed {}/{} ({:.2f}%)".format(passed, total_tests, pass_rate))
     print("\tAvg. plies: {:.2f}".format(avg_puzzle_len))
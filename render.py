@@ -0,0 +1,83 @@
+import queue
+import threading
+import time
+
+
+class DisplayConfig:
+    REFRESH_RATE = 30  # Frames per second at most; positions shown faster than this are skipped
+
+
+class BoardDisplay:
+    """
+    Draws positions in a thread of its own, so showing a position never holds up a search. show only queues the
+    FEN; the thread draws the latest one queued, at most REFRESH_RATE times a second, and skips any behind it
+    """
+
+    def __init__(self, refresh_rate: int = DisplayConfig.REFRESH_RATE):
+        self.interval = 1.0 / refresh_rate
+        self.frames = queue.Queue()
+        self.thread = threading.Thread(target=self.run, name="BoardDisplay", daemon=True)
+        self.closed = False
+        self.shown = 0
+        self.drawn = 0
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def show(self, fen: str):
+        if not self.closed:
+            self.shown += 1
+            self.frames.put(fen)
+
+    def stop(self):
+        self.closed = True
+        self.frames.put(None)
+        self.thread.join(timeout=1.0)
+
+    def run(self):
+        # pygame is only imported by the thread that draws, and not at all without a display
+        from chessboard import display
+
+        game_board = None
+        while True:
+            try:
+                fen = self.frames.get(timeout=self.interval)
+                while not self.frames.empty():
+                    fen = self.frames.get_nowait()
+            except queue.Empty:
+                fen = ""
+            if fen is None:
+                return
+
+            frame_start = time.perf_counter()
+            try:
+                if not fen:
+                    # Nothing new to draw, but the window still has to handle its events to stay responsive
+                    if game_board is not None:
+                        display.check_for_quit()
+                    continue
+                if game_board is None:
+                    game_board = display.start(fen)
+                else:
+                    display.update(fen, game_board)
+            except SystemExit:
+                # The window was closed, which chessboard handles by exiting; only drawing stops, not the caller
+                self.closed = True
+                return
+            self.drawn += 1
+
+            remaining = self.interval - (time.perf_counter() - frame_start)
+            if remaining > 0:
+                time.sleep(remaining)
+
+
+_display: BoardDisplay = None
+
+
+def shared_display() -> BoardDisplay:
+    """The process's display, started the first time it is asked for"""
+    global _display
+    if _display is None:
+        _display = BoardDisplay().start()
+    return _display
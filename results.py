@@ -0,0 +1,199 @@
+import argparse
+import hashlib
+import os
+import sqlite3
+import time
+
+import main
+
+
+class ResultsConfig:
+    DB_FILE = "puzzle_results.sqlite"
+    # Changes to these files make a new engine version, so results of older code are never mistaken for current ones
+    # puzzle.py is included since it judges each attempt
+    ENGINE_FILES = ["agent.py", "minimax.py", "evaluate.py", "eval_cache.py", "pst.py", "nnue.py", "mate.py",
+                    "bitbase.py", "puzzle.py", "eval_weights.json", "nnue.npz"]
+    RATING_BUCKET = 100
+    PERCENTILES = [50, 90, 99]
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS attempts (
+    puzzle_id TEXT NOT NULL,
+    agent TEXT NOT NULL,
+    depth INTEGER NOT NULL,
+    engine_version TEXT NOT NULL,
+    rating INTEGER,
+    passed INTEGER NOT NULL,
+    fail_reason TEXT,
+    moves TEXT,
+    nodes INTEGER,
+    time REAL,
+    created REAL,
+    PRIMARY KEY (puzzle_id, agent, depth, engine_version)
+);
+CREATE TABLE IF NOT EXISTS puzzle_themes (
+    puzzle_id TEXT NOT NULL,
+    theme TEXT NOT NULL,
+    PRIMARY KEY (puzzle_id, theme)
+);
+"""
+
+
+def engine_version(files: [str] = None, options: dict = None) -> str:
+    """
+    Short hash of the engine's source and weight files, the bitbase tables, the search options in main.Config and any
+    others given
+    """
+    digest = hashlib.sha1()
+    for path in ResultsConfig.ENGINE_FILES if files is None else files:
+        if os.path.exists(path):
+            with open(path, "rb") as io:
+                digest.update(path.encode() + b"\0" + io.read())
+
+    config = ["INDEX_MODE", "CACHE_EVALS", "NULL_PRUNE", "SORT_MOVES", "OPENING_BOOK", "EVAL_CACHE", "MATE_PROBE",
+              "BITBASES"]
+    digest.update(repr([getattr(main.Config, option) for option in config]).encode())
+
+    # The tables found change search results as much as the code probing them does
+    if main.Config.BITBASES and os.path.isdir(main.Config.BITBASE_DIR):
+        for name in sorted(os.listdir(main.Config.BITBASE_DIR)):
+            if name.endswith((".bb", ".dtm")):
+                with open(os.path.join(main.Config.BITBASE_DIR, name), "rb") as io:
+                    digest.update(name.encode() + b"\0" + io.read())
+
+    if options:
+        digest.update(repr(sorted(options.items())).encode())
+    return digest.hexdigest()[:12]
+
+
+class ResultsStore:
+    """
+    Puzzle attempts in SQLite, keyed by (puzzle id, agent class, depth, engine version). Each attempt is committed
+    as soon as it is recorded, so an interrupted run loses at most the attempt in progress.
+    """
+
+    def __init__(self, path: str = ResultsConfig.DB_FILE, version: str = None, options: dict = None):
+        self.path = path
+        self.version = engine_version(options=options) if version is None else version
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def get(self, puzzle_id: str, agent: str, depth: int):
+        """(passed, fail_reason, moves, nodes, time) of an attempt with this engine version, or None"""
+        return self.connection.execute(
+            "SELECT passed, fail_reason, moves, nodes, time FROM attempts "
+            "WHERE puzzle_id = ? AND agent = ? AND depth = ? AND engine_version = ?",
+            (puzzle_id, agent, depth, self.version)).fetchone()
+
+    def record(self, puzzle, agent: str, depth: int, passed: bool, fail_reason: str, moves: str, nodes, elapsed):
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO attempts VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (puzzle.iden, agent, depth, self.version, puzzle.rating, int(passed), None if passed else fail_reason,
+                 moves, nodes, elapsed, time.time()))
+            self.connection.executemany("INSERT OR IGNORE INTO puzzle_themes VALUES (?, ?)",
+                                        [(puzzle.iden, theme) for theme in puzzle.themes])
+
+    def versions(self):
+        return self.connection.execute(
+            "SELECT engine_version, COUNT(*), MIN(created), MAX(created) FROM attempts "
+            "GROUP BY engine_version ORDER BY MAX(created)").fetchall()
+
+    def pass_rates(self, version: str = None):
+        """(agent, depth, attempts, passed, pass rate) for every agent and depth"""
+        return self.connection.execute(
+            "SELECT agent, depth, COUNT(*), SUM(passed), AVG(passed) FROM attempts WHERE engine_version = ? "
+            "GROUP BY agent, depth ORDER BY agent, depth", (version or self.version,)).fetchall()
+
+    def pass_rate_by_rating(self, bucket: int = ResultsConfig.RATING_BUCKET, version: str = None):
+        """(agent, depth, bucket floor, attempts, pass rate) by rating bucket"""
+        return self.connection.execute(
+            "SELECT agent, depth, (rating / ?) * ? AS bucket, COUNT(*), AVG(passed) FROM attempts "
+            "WHERE engine_version = ? GROUP BY agent, depth, bucket ORDER BY agent, depth, bucket",
+            (bucket, bucket, version or self.version)).fetchall()
+
+    def pass_rate_by_theme(self, version: str = None):
+        """(agent, depth, theme, attempts, pass rate) by puzzle theme"""
+        return self.connection.execute(
+            "SELECT a.agent, a.depth, t.theme, COUNT(*), AVG(a.passed) FROM attempts a "
+            "JOIN puzzle_themes t ON t.puzzle_id = a.puzzle_id WHERE a.engine_version = ? "
+            "GROUP BY a.agent, a.depth, t.theme ORDER BY a.agent, a.depth, t.theme",
+            (version or self.version,)).fetchall()
+
+    def time_percentiles(self, percentiles: [int] = None, version: str = None):
+        """(agent, depth, {percentile: seconds}) using the nearest-rank method"""
+        percentiles = ResultsConfig.PERCENTILES if percentiles is None else percentiles
+        version = version or self.version
+
+        rows = []
+        groups = self.connection.execute(
+            "SELECT agent, depth, COUNT(*) FROM attempts WHERE engine_version = ? AND time IS NOT NULL "
+            "GROUP BY agent, depth ORDER BY agent, depth", (version,)).fetchall()
+        for agent, depth, count in groups:
+            values = {}
+            for percentile in percentiles:
+                rank = max(0, -(-percentile * count // 100) - 1)
+                values[percentile] = self.connection.execute(
+                    "SELECT time FROM attempts WHERE engine_version = ? AND agent = ? AND depth = ? "
+                    "AND time IS NOT NULL ORDER BY time LIMIT 1 OFFSET ?", (version, agent, depth, rank)).fetchone()[0]
+            rows.append((agent, depth, values))
+        return rows
+
+    def compare(self, old_version: str, new_version: str = None):
+        """(agent, depth, common puzzles, old pass rate, new pass rate, changed results) over puzzles both solved"""
+        return self.connection.execute(
+            "SELECT o.agent, o.depth, COUNT(*), AVG(o.passed), AVG(n.passed), SUM(o.passed != n.passed) "
+            "FROM attempts o JOIN attempts n ON n.puzzle_id = o.puzzle_id AND n.agent = o.agent "
+            "AND n.depth = o.depth WHERE o.engine_version = ? AND n.engine_version = ? "
+            "GROUP BY o.agent, o.depth ORDER BY o.agent, o.depth",
+            (old_version, new_version or self.version)).fetchall()
+
+
+def print_summary(store: ResultsStore, version: str, by_theme: bool):
+    print("Engine version {}".format(version))
+    for agent, depth, attempts, passed, rate in store.pass_rates(version):
+        print("\t{}\tdepth {}\t{}/{} ({:.2%})".format(agent, depth, passed, attempts, rate))
+
+    print("\nPass rate by rating")
+    for agent, depth, bucket, attempts, rate in store.pass_rate_by_rating(version=version):
+        print("\t{}\tdepth {}\t{}-{}\t{:.2%} of {}".format(agent, depth, bucket, bucket + ResultsConfig.RATING_BUCKET - 1,
+                                                             rate, attempts))
+
+    if by_theme:
+        print("\nPass rate by theme")
+        for agent, depth, theme, attempts, rate in store.pass_rate_by_theme(version):
+            print("\t{}\tdepth {}\t{}\t{:.2%} of {}".format(agent, depth, theme, rate, attempts))
+
+    print("\nTime percentiles")
+    for agent, depth, values in store.time_percentiles(version=version):
+        print("\t{}\tdepth {}\t".format(agent, depth)
+              + "\t".join("p{} {:.3f}s".format(percentile, value) for percentile, value in values.items()))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Summarise stored puzzle results")
+    parser.add_argument("--db", default=ResultsConfig.DB_FILE)
+    parser.add_argument("--version", help="engine version to summarise (default: the most recent run)")
+    parser.add_argument("--themes", action="store_true", help="include pass rates by theme")
+    parser.add_argument("--compare", help="engine version to compare against")
+    parser.add_argument("--versions", action="store_true", help="list stored engine versions")
+    args = parser.parse_args()
+
+    results_store = ResultsStore(args.db)
+    stored_versions = results_store.versions()
+    summary_version = args.version or (stored_versions[-1][0] if stored_versions else results_store.version)
+
+    if args.versions:
+        for stored_version, count, first, last in stored_versions:
+            print("{}\t{} attempts\t{} - {}".format(stored_version, count, time.ctime(first), time.ctime(last)))
+    elif args.compare:
+        for row in results_store.compare(args.compare, summary_version):
+            print("{}\tdepth {}\t{} puzzles\t{:.2%} -> {:.2%}\t{} changed".format(*row))
+    else:
+        print_summary(results_store, summary_version, args.themes)
+
+    results_store.close()
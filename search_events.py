@@ -0,0 +1,133 @@
+import collections
+import json
+import os
+import socket
+import time
+
+import chess
+
+# Searches publish JSON datagrams to a local UDP port, and a dashboard (see gui.py) binds that port to watch them.
+# Sending never blocks and needs no one listening, so a search costs the same with or without a dashboard open.
+# Events are dicts with a "kind" of
+#   "progress"   sent from inside negamax at most every EVENTS_INTERVAL: nodes and nodes/sec so far
+#   "iteration"  at the end of every iterative deepening iteration: depth, eval, principal variation
+#   "move"       once a move has been chosen
+# and "agent", "pid" and "time" added to each
+MAX_DATAGRAM = 65507
+
+
+class EventPublisher:
+    def __init__(self, host: str, port: int, interval: float):
+        self.address = (host, port)
+        self.interval = interval
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setblocking(False)
+        self.last_progress = 0.0
+        self.sent = 0
+        self.dropped = 0
+
+    def progress_due(self) -> bool:
+        return time.perf_counter() - self.last_progress >= self.interval
+
+    def publish(self, kind: str, agent: str, event: dict):
+        event.update(kind=kind, agent=agent, pid=os.getpid(), time=time.time())
+        if kind == "progress":
+            self.last_progress = time.perf_counter()
+        try:
+            self.socket.sendto(json.dumps(event).encode(), self.address)
+            self.sent += 1
+        except OSError:
+            # A full socket buffer drops the event rather than holding up the search
+            self.dropped += 1
+
+
+class EventSubscriber:
+    def __init__(self, host: str, port: int):
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind((host, port))
+        self.socket.setblocking(False)
+
+    def poll(self, limit: int = 10000) -> [dict]:
+        """Every event received since the last poll, up to limit"""
+        events = []
+        while len(events) < limit:
+            try:
+                data = self.socket.recv(MAX_DATAGRAM)
+            except BlockingIOError:
+                break
+            try:
+                events.append(json.loads(data))
+            except ValueError:
+                continue
+        return events
+
+    def close(self):
+        self.socket.close()
+
+
+class SearchMonitor:
+    """
+    What the dashboard shows, built from events without any GUI: for every agent, its latest progress or iteration
+    event, its latest principal variation in SAN, and each metric's values over the last history seconds. Agents
+    are named by agent class and process id
+    """
+
+    METRICS = ["nps", "depth", "tt_hit_rate", "eval"]
+
+    def __init__(self, history: float, eval_clamp: float):
+        self.history = history
+        self.eval_clamp = eval_clamp  # Evals are kept within this, so mate scores don't flatten everything else
+        self.series = {metric: {} for metric in self.METRICS}  # Metric to agent to a deque of (time, value)
+        self.agents = []  # In the order they were first heard from
+        self.latest = {}
+        self.pvs = {}
+        self.received = 0
+
+    def add(self, event: dict):
+        self.received += 1
+        agent = "{} {}".format(event["agent"], event["pid"])
+        if agent not in self.agents:
+            self.agents.append(agent)
+        at = event["time"]
+
+        if event["kind"] in ("progress", "iteration"):
+            self.latest[agent] = event
+            self.record("nps", agent, at, event["nps"])
+            self.record("tt_hit_rate", agent, at, event["tt_hit_rate"])
+        if event["kind"] == "iteration":
+            self.record("depth", agent, at, event["depth"])
+            self.record("eval", agent, at, max(-self.eval_clamp, min(self.eval_clamp, event["eval"])))
+            self.pvs[agent] = self.variation_san(event)
+
+    def record(self, metric: str, agent: str, at: float, value):
+        if value is not None:
+            self.series[metric].setdefault(agent, collections.deque()).append((at, value))
+
+    def prune(self, now: float):
+        """Drops values from before the last history seconds"""
+        start = now - self.history
+        for agents in self.series.values():
+            for points in agents.values():
+                while points and points[0][0] < start:
+                    points.popleft()
+
+    @staticmethod
+    def variation_san(event: dict) -> str:
+        if not event["pvs"]:
+            return ""
+        try:
+            board = chess.Board(event["fen"])
+            return board.variation_san([chess.Move.from_uci(move) for move in event["pvs"][0]["pv"]])
+        except ValueError:
+            return " ".join(event["pvs"][0]["pv"])
+
+
+_publishers = {}
+
+
+def load_publisher(host: str, port: int, interval: float) -> EventPublisher:
+    """One publisher per address in each process, shared by its agents"""
+    if (host, port) not in _publishers:
+        _publishers[(host, port)] = EventPublisher(host, port, interval)
+    return _publishers[(host, port)]
@@ -0,0 +1,133 @@
+import json
+import time
+
+# Only one in every (mask + 1) evaluations is timed; the rest are extrapolated from the samples
+EVAL_SAMPLE_MASK = 0xFF
+
+TT_FLAGS = ["e", "l", "u"]
+
+
+class SearchStats:
+    """
+    Counters for a single find_move call. MiniMaxAbstract only keeps one of these when
+    main.Config.SEARCH_STATS is set; otherwise its stats are None and every hook is skipped by a single branch.
+    """
+
+    def __init__(self):
+        self.nodes_per_ply = []
+
+        self.tt_probes = 0
+        self.tt_hits = 0
+        self.tt_cutoffs = {flag: 0 for flag in TT_FLAGS}
+
+        # Index of the move in the sorted move list that caused each beta cutoff
+        self.beta_cutoffs = []
+
+        self.null_tries = 0
+        self.null_cutoffs = 0
+
+        self.bitbase_hits = 0
+        self.mate_nodes = 0  # Searched by the mate solver before the main search, or instead of it
+
+        self.evals = 0
+        self.eval_samples = 0
+        self.eval_sample_ns = 0
+
+        self.start_ns = time.perf_counter_ns()
+        self.elapsed_ns = 0
+
+    def node(self, ply: int):
+        nodes_per_ply = self.nodes_per_ply
+        if ply >= len(nodes_per_ply):
+            nodes_per_ply.extend([0] * (ply + 1 - len(nodes_per_ply)))
+        nodes_per_ply[ply] += 1
+
+    def tt_probe(self, hit: bool):
+        self.tt_probes += 1
+        if hit:
+            self.tt_hits += 1
+
+    def tt_cutoff(self, flag: str):
+        self.tt_cutoffs[flag] += 1
+
+    def beta_cutoff(self, move_index: int):
+        beta_cutoffs = self.beta_cutoffs
+        if move_index >= len(beta_cutoffs):
+            beta_cutoffs.extend([0] * (move_index + 1 - len(beta_cutoffs)))
+        beta_cutoffs[move_index] += 1
+
+    def null_move(self, cutoff: bool):
+        self.null_tries += 1
+        if cutoff:
+            self.null_cutoffs += 1
+
+    def evaluate(self, evaluate_board) -> int:
+        self.evals += 1
+        if self.evals & EVAL_SAMPLE_MASK:
+            return evaluate_board()
+
+        start = time.perf_counter_ns()
+        value = evaluate_board()
+        self.eval_sample_ns += time.perf_counter_ns() - start
+        self.eval_samples += 1
+        return value
+
+    def finish(self):
+        self.elapsed_ns = time.perf_counter_ns() - self.start_ns
+
+    @property
+    def nodes(self) -> int:
+        return sum(self.nodes_per_ply)
+
+    @property
+    def elapsed(self) -> float:
+        return self.elapsed_ns / 1e9
+
+    @property
+    def nps(self) -> float:
+        return self.nodes / self.elapsed if self.elapsed_ns else 0
+
+    @property
+    def tt_hit_rate(self) -> float:
+        return self.tt_hits / self.tt_probes if self.tt_probes else 0
+
+    @property
+    def eval_time(self) -> float:
+        """Estimated seconds spent in evaluate_board, extrapolated from the sampled calls"""
+        if not self.eval_samples:
+            return 0
+        return (self.eval_sample_ns / self.eval_samples) * self.evals / 1e9
+
+    @property
+    def first_move_cutoff_rate(self) -> float:
+        total = sum(self.beta_cutoffs)
+        return self.beta_cutoffs[0] / total if total else 0
+
+    def to_dict(self) -> dict:
+        return {
+            "nodes": self.nodes,
+            "nodes_per_ply": list(self.nodes_per_ply),
+            "time": self.elapsed,
+            "nps": self.nps,
+            "tt_probes": self.tt_probes,
+            "tt_hits": self.tt_hits,
+            "tt_hit_rate": self.tt_hit_rate,
+            "tt_cutoffs": dict(self.tt_cutoffs),
+            "beta_cutoffs": list(self.beta_cutoffs),
+            "first_move_cutoff_rate": self.first_move_cutoff_rate,
+            "null_tries": self.null_tries,
+            "null_cutoffs": self.null_cutoffs,
+            "bitbase_hits": self.bitbase_hits,
+            "mate_nodes": self.mate_nodes,
+            "evals": self.evals,
+            "eval_time": self.eval_time,
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict())
+
+    def __str__(self):
+        return "{} nodes in {:.2f}s ({:.0f} nps), {} evals (~{:.2f}s), TT hits {:.1%}, first move cutoffs {:.1%}, " \
+               "null cutoffs {}/{}".format(self.nodes, self.elapsed, self.nps, self.evals, self.eval_time,
+                                           self.tt_hit_rate, self.first_move_cutoff_rate, self.null_cutoffs,
+                                           self.null_tries)
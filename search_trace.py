@@ -0,0 +1,172 @@
+import argparse
+import mmap
+import os
+import struct
+import sys
+
+import chess
+
+# File layout: a fixed header followed by a ring buffer of fixed size records
+HEADER = struct.Struct("<4sHHIQ12x")
+MAGIC = b"CTRC"
+VERSION = 1
+
+# ply, flag, packed move, alpha, beta, score
+RECORD = struct.Struct("<BBHfff")
+
+# Record flags; the first three match the transposition table flags
+EXACT = 0
+LOWERBOUND = 1
+UPPERBOUND = 2
+LEAF = 3
+TT_CUTOFF = 4
+NULL_CUTOFF = 5
+
+FLAG_NAMES = {EXACT: "exact", LOWERBOUND: "lower", UPPERBOUND: "upper", LEAF: "leaf", TT_CUTOFF: "tt",
+              NULL_CUTOFF: "null"}
+TT_FLAGS = {"e": EXACT, "l": LOWERBOUND, "u": UPPERBOUND}
+
+
+def pack_move(move: chess.Move) -> int:
+    return move.from_square | (move.to_square << 6) | ((move.promotion or 0) << 12)
+
+
+def unpack_move(packed: int) -> chess.Move:
+    promotion = packed >> 12
+    return chess.Move(packed & 0x3F, (packed >> 6) & 0x3F, promotion if promotion else None)
+
+
+class SearchTrace:
+    """
+    Ring buffer of compact search records, one per node on exit, with scores from the side to move at that node.
+    Records are written in post-order, so each node follows its children; read_tree rebuilds the tree from the ply
+    of each record. With a path the buffer is a memory-mapped file, otherwise it is held in memory and can be
+    written out with save.
+    """
+
+    def __init__(self, capacity: int = 1 << 20, path: str = None):
+        self.capacity = capacity
+        self.count = 0
+        self.path = path
+
+        size = HEADER.size + capacity * RECORD.size
+        if path is None:
+            self.io = None
+            self.buffer = bytearray(size)
+        else:
+            directory = os.path.dirname(path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+            self.io = open(path, "w+b")
+            self.io.truncate(size)
+            self.buffer = mmap.mmap(self.io.fileno(), size)
+
+        self.flush()
+
+    def record(self, ply: int, move: chess.Move, alpha, beta, score, flag: int):
+        offset = HEADER.size + (self.count % self.capacity) * RECORD.size
+        RECORD.pack_into(self.buffer, offset, ply, flag, pack_move(move), alpha, beta, score)
+        self.count += 1
+
+    def flush(self):
+        HEADER.pack_into(self.buffer, 0, MAGIC, VERSION, RECORD.size, self.capacity, self.count)
+        if self.io is not None:
+            self.buffer.flush()
+
+    def save(self, path: str):
+        self.flush()
+        with open(path, "wb") as io:
+            io.write(self.buffer)
+
+    def close(self):
+        self.flush()
+        if self.io is not None:
+            self.buffer.close()
+            self.io.close()
+            self.io = None
+
+    def records(self):
+        """Yields (ply, flag, move, alpha, beta, score) from oldest to newest"""
+        return iter_records(self.buffer, self.capacity, self.count)
+
+
+def iter_records(buffer, capacity: int, count: int):
+    first = max(0, count - capacity)
+    for index in range(first, count):
+        offset = HEADER.size + (index % capacity) * RECORD.size
+        ply, flag, move, alpha, beta, score = RECORD.unpack_from(buffer, offset)
+        yield ply, flag, unpack_move(move), alpha, beta, score
+
+
+def read_records(path: str):
+    with open(path, "rb") as io:
+        buffer = io.read()
+
+    magic, version, record_size, capacity, count = HEADER.unpack_from(buffer, 0)
+    if magic != MAGIC or version != VERSION or record_size != RECORD.size:
+        raise ValueError("Not a search trace: " + path)
+
+    return list(iter_records(buffer, capacity, count))
+
+
+class TraceNode:
+    def __init__(self, ply, flag, move, alpha, beta, score):
+        self.ply = ply
+        self.flag = flag
+        self.move = move
+        self.alpha = alpha
+        self.beta = beta
+        self.score = score
+        self.children = []
+
+    def __str__(self):
+        return "{} {} [{:g}, {:g}] {}".format(self.move.uci() if self.move else "0000", "{:g}".format(self.score),
+                                             self.alpha, self.beta, FLAG_NAMES.get(self.flag, self.flag))
+
+
+def read_tree(records) -> [TraceNode]:
+    """Rebuilds the searched trees from post-ordered records; returns one root per completed root search"""
+    pending = {}
+    for record in records:
+        node = TraceNode(*record)
+        node.children = pending.pop(node.ply + 1, [])
+        pending.setdefault(node.ply, []).append(node)
+
+    # Children of roots lost to ring buffer wrap-around are left behind at deeper plies
+    return pending.get(0, [])
+
+
+def print_tree(node: TraceNode, max_ply: int, path_filter: [str], flags, out=sys.stdout):
+    if node.ply > max_ply:
+        return
+
+    if node.ply > 0 and node.ply <= len(path_filter) and node.move.uci() != path_filter[node.ply - 1]:
+        return
+
+    if flags is None or node.flag in flags:
+        out.write("\t" * node.ply + str(node) + "\n")
+
+    for child in node.children:
+        print_tree(child, max_ply, path_filter, flags, out)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Print the search tree stored in a search trace")
+    parser.add_argument("trace")
+    parser.add_argument("--root", type=int, default=-1, help="index of the root search to print (default: last)")
+    parser.add_argument("--max-ply", type=int, default=2)
+    parser.add_argument("--path", default="", help="only follow this line of uci moves from the root")
+    parser.add_argument("--flag", action="append", choices=list(FLAG_NAMES.values()),
+                        help="only print nodes with these flags")
+    args = parser.parse_args()
+
+    roots = read_tree(read_records(args.trace))
+    if not roots:
+        sys.exit("No complete root search in " + args.trace)
+
+    selected_flags = None
+    if args.flag:
+        selected_flags = {flag for flag, name in FLAG_NAMES.items() if name in args.flag}
+
+    print("{} root searches".format(len(roots)))
+    print_tree(roots[args.root], args.max_ply, args.path.split(), selected_flags)
@@ -0,0 +1,309 @@
+import argparse
+import json
+import multiprocessing
+import os
+import random
+
+import chess
+import chess.polyglot
+import numpy as np
+
+import batch_eval
+import main
+import minimax
+from agent import make_opening_move
+
+
+class SelfPlayConfig:
+    OUTPUT_DIR = "selfplay"
+    AGENT = "MiniMaxComplex"
+    DEPTH = 2
+    GAMES = 100
+    WORKERS = os.cpu_count() or 1
+
+    BOOK_PLIES = 12  # Opening book moves, while the books in ./openings still have the position
+    RANDOM_PLIES = 4  # Random moves after the book, so games with the same opening still diverge
+    MAX_PLIES = 300  # Adjudicated as a draw after this many plies
+
+    SHARD_SIZE = 1 << 16  # Positions per shard file
+    SEED = 69
+
+
+MANIFEST = "manifest.json"
+PENDING = "pending.npz"  # Positions short of a full shard, carried over into the next run's first shard
+
+# Arrays stored in every shard, one row per recorded position
+FIELDS = {
+    "bitboards": "<u8",  # (N, 12) piece bitboards in batch_eval.PLANES order
+    "turn": "?",
+    "castling": "<u8",  # Castling rights as a bitboard of rook squares
+    "ep_square": "<i1",  # -1 if there is none
+    "score": "<f4",  # Search score of the deepest completed iteration, from white's point of view
+    "result": "<f4",  # Game result for white: 1, 0.5 or 0
+    "key": "<u8",  # Polyglot zobrist hash, used to dedupe positions
+}
+
+
+def play_game(agent_name: str, depth: int, seed: int):
+    """Plays one self-play game, returning a record per searched ply and the game result for white"""
+    rng = random.Random(seed)
+    board = chess.Board()
+    agent = getattr(minimax, agent_name)(board, depth)
+
+    records = []
+    while not board.is_game_over() and board.ply() < SelfPlayConfig.MAX_PLIES:
+        move = None
+        if board.ply() < SelfPlayConfig.BOOK_PLIES:
+            move = make_opening_move(board)
+        if move is None and board.ply() < SelfPlayConfig.BOOK_PLIES + SelfPlayConfig.RANDOM_PLIES:
+            move = rng.choice(list(board.legal_moves))
+
+        if move is None:
+            move = agent.find_move()
+            score = agent.iterations[-1]["eval"] if agent.iterations else 0
+            records.append((board.copy(stack=False), score if board.turn == chess.WHITE else -score))
+
+        board.push(move)
+
+    outcome = board.outcome()
+    if outcome is None or outcome.winner is None:
+        result = 0.5
+    else:
+        result = 1.0 if outcome.winner == chess.WHITE else 0.0
+    return records, result
+
+
+def encode_records(records, result: float) -> dict:
+    boards = [board for board, score in records]
+    return {
+        "bitboards": batch_eval.encode_bitboards(boards),
+        "turn": np.array([board.turn for board in boards], dtype=FIELDS["turn"]),
+        "castling": np.array([board.castling_rights for board in boards], dtype=FIELDS["castling"]),
+        "ep_square": np.array([-1 if board.ep_square is None else board.ep_square for board in boards],
+                              dtype=FIELDS["ep_square"]),
+        "score": np.array([score for board, score in records], dtype=FIELDS["score"]),
+        "result": np.full(len(boards), result, dtype=FIELDS["result"]),
+        "key": np.array([chess.polyglot.zobrist_hash(board) for board in boards], dtype=FIELDS["key"]),
+    }
+
+
+def decode_boards(shard: dict):
+    """Yields the chess.Board of every row of a loaded shard"""
+    for i in range(len(shard["key"])):
+        board = chess.Board(None)
+        for plane, (color, piece_type) in enumerate(batch_eval.PLANES):
+            for square in chess.scan_forward(int(shard["bitboards"][i, plane])):
+                board.set_piece_at(square, chess.Piece(piece_type, color))
+        board.turn = bool(shard["turn"][i])
+        board.castling_rights = int(shard["castling"][i])
+        board.ep_square = None if shard["ep_square"][i] < 0 else int(shard["ep_square"][i])
+        yield board
+
+
+def play_worker(job):
+    game_id, agent_name, depth, seed = job
+    records, result = play_game(agent_name, depth, seed + game_id)
+    return game_id, encode_records(records, result)
+
+
+def init_worker():
+    # Self-play moves come from play_game's own book and random plies; searches must not write index files
+    main.Config.OPENING_BOOK = False
+    main.Config.INDEX_MODE = False
+    main.Config.DEBUG = False
+    main.Config.INFO = False
+    main.Config.SEARCH_STATS = False
+    main.Config.TRACE = False
+
+
+def load_manifest(directory: str) -> dict:
+    path = os.path.join(directory, MANIFEST)
+    if not os.path.exists(path):
+        return {"shards": [], "games": [], "pending": None}
+    with open(path, "r") as io:
+        return json.load(io)
+
+
+def load_shard(directory: str, file_name: str) -> dict:
+    with np.load(os.path.join(directory, file_name)) as data:
+        return {name: data[name] for name in FIELDS}
+
+
+def iter_shards(directory: str):
+    """Yields every shard listed in the manifest, one at a time. Pending positions are not in a shard yet"""
+    for shard in load_manifest(directory)["shards"]:
+        yield load_shard(directory, shard["file"])
+
+
+def write_atomic(path: str, write):
+    # Written beside the target then renamed, so an interrupted run never leaves a half written file behind
+    temp = path + ".tmp"
+    with open(temp, "wb") as io:
+        write(io)
+    os.replace(temp, path)
+
+
+class ShardWriter:
+    """
+    Buffers deduplicated positions and writes them out SHARD_SIZE at a time. A game is only marked done in the
+    manifest once all of its positions are in shard files. Positions still buffered at the end of a run are kept in
+    the pending file along with their games, and start the next run's buffer, so every shard stays full until
+    finish writes the last one. A resumed run replays exactly the games that are neither done nor pending.
+    """
+
+    def __init__(self, directory: str, shard_size: int):
+        self.directory = directory
+        self.shard_size = shard_size
+        self.manifest = load_manifest(directory)
+        self.done = set(self.manifest["games"])
+
+        self.seen = set()
+        for shard in iter_shards(directory):
+            self.seen.update(shard["key"].tolist())
+
+        self.buffer = {name: [] for name in FIELDS}
+        self.buffered = 0
+        self.queue = []  # [game id, positions still buffered], in buffer order
+
+        pending = self.manifest.get("pending")
+        if pending is not None:
+            rows = load_shard(directory, pending["file"])
+            # Rows already in a shard were written by a run that stopped before it could clear the pending file
+            owners = np.repeat([game_id for game_id, count in pending["games"]],
+                               [count for game_id, count in pending["games"]])
+            keep = np.array([key not in self.seen for key in rows["key"].tolist()], dtype=bool)
+            self.buffer = {name: [rows[name][keep]] for name in FIELDS}
+            self.buffered = int(keep.sum())
+            self.queue = [[game_id, int(np.count_nonzero(keep[owners == game_id]))]
+                          for game_id, count in pending["games"] if game_id not in self.done]
+            self.seen.update(rows["key"].tolist())
+
+    def recorded(self, game_id: int) -> bool:
+        """Whether a game's positions are already in a shard or pending"""
+        return game_id in self.done or any(queued == game_id for queued, count in self.queue)
+
+    def add(self, game_id: int, rows: dict):
+        keep = np.ones(len(rows["key"]), dtype=bool)
+        for i, key in enumerate(rows["key"].tolist()):
+            if key in self.seen:
+                keep[i] = False
+            self.seen.add(key)
+
+        for name in FIELDS:
+            self.buffer[name].append(rows[name][keep])
+        count = int(keep.sum())
+        self.buffered += count
+        self.queue.append([game_id, count])
+
+        while self.buffered >= self.shard_size:
+            self.write_shard(self.shard_size)
+
+    def write_shard(self, size: int):
+        arrays = {name: np.concatenate(self.buffer[name]) for name in FIELDS}
+        file_name = "shard_{:05d}.npz".format(len(self.manifest["shards"]))
+        write_atomic(os.path.join(self.directory, file_name),
+                     lambda io: np.savez_compressed(io, **{name: arrays[name][:size] for name in FIELDS}))
+
+        self.buffer = {name: [arrays[name][size:]] for name in FIELDS}
+        self.buffered -= size
+
+        # Games at the front of the buffer are now fully written; the first one that isn't keeps its remainder
+        written = size
+        while self.queue and self.queue[0][1] <= written:
+            game_id, count = self.queue.pop(0)
+            written -= count
+            self.done.add(game_id)
+        if self.queue:
+            self.queue[0][1] -= written
+
+        self.manifest["shards"].append({"file": file_name, "positions": size})
+        # Pending rows start the buffer and are fewer than a shard, so the first shard written takes them all
+        carried = self.manifest.get("pending")
+        self.manifest["pending"] = None
+        self.save_manifest()
+        if carried is not None:
+            os.remove(os.path.join(self.directory, carried["file"]))
+
+    def save_manifest(self):
+        self.manifest["games"] = sorted(self.done)
+        data = json.dumps(self.manifest, indent=2).encode()
+        write_atomic(os.path.join(self.directory, MANIFEST), lambda io: io.write(data))
+
+    def close(self):
+        """Keeps whatever is short of a full shard pending, for the next run to carry on from"""
+        pending_path = os.path.join(self.directory, PENDING)
+        if self.queue:
+            arrays = {name: np.concatenate(self.buffer[name]) for name in FIELDS}
+            write_atomic(pending_path, lambda io: np.savez_compressed(io, **arrays))
+            self.manifest["pending"] = {"file": PENDING, "positions": self.buffered, "games": self.queue}
+        else:
+            self.manifest["pending"] = None
+        self.save_manifest()
+        if not self.queue and os.path.exists(pending_path):
+            os.remove(pending_path)
+
+    def finish(self):
+        """Writes the pending positions as the last shard, which is the only one that may be short"""
+        if self.buffered > 0:
+            self.write_shard(self.buffered)
+        # Anything left has no positions of its own, every one was a duplicate
+        self.done.update(game_id for game_id, count in self.queue)
+        self.queue = []
+        self.close()
+
+
+def generate(directory: str, agent_name: str, depth: int, games: int, workers: int, shard_size: int, seed: int,
+             finish: bool = False):
+    """
+    Plays the games of range(games) not already in directory. Every shard is shard_size positions, and the
+    remainder is pending until a later run fills it, or finish writes it as a short last shard
+    """
+    os.makedirs(directory, exist_ok=True)
+    writer = ShardWriter(directory, shard_size)
+
+    # Resuming with other settings would mix two datasets under one label
+    settings = {"agent": agent_name, "depth": depth, "seed": seed, "shard_size": shard_size}
+    for name, value in settings.items():
+        if name in writer.manifest and writer.manifest[name] != value:
+            raise ValueError("{} holds {} {}, not {}; use another output directory".format(
+                directory, name, writer.manifest[name], value))
+    writer.manifest.update(settings, fields=FIELDS)
+
+    jobs = [(game_id, agent_name, depth, seed) for game_id in range(games) if not writer.recorded(game_id)]
+    main.info("{} of {} games left to play, {} positions already written".format(len(jobs), games, len(writer.seen)))
+
+    with multiprocessing.Pool(workers, initializer=init_worker) as pool:
+        for played, (game_id, rows) in enumerate(pool.imap_unordered(play_worker, jobs)):
+            writer.add(game_id, rows)
+            main.info("Game {} done ({}/{}): {} positions, {} buffered".format(game_id, played + 1, len(jobs),
+                                                                               len(rows["key"]), writer.buffered))
+    if finish:
+        writer.finish()
+    else:
+        writer.close()
+        main.info("{} positions pending for the next run".format(writer.buffered))
+
+    written = sum(shard["positions"] for shard in writer.manifest["shards"])
+    main.info("{} positions in {} shards".format(written, len(writer.manifest["shards"])))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate training positions from MiniMax self-play")
+    parser.add_argument("--output", default=SelfPlayConfig.OUTPUT_DIR)
+    parser.add_argument("--agent", default=SelfPlayConfig.AGENT)
+    parser.add_argument("--depth", type=int, default=SelfPlayConfig.DEPTH)
+    parser.add_argument("--games", type=int, default=SelfPlayConfig.GAMES,
+                        help="total games; a rerun with the same output resumes the unfinished ones")
+    parser.add_argument("--workers", type=int, default=SelfPlayConfig.WORKERS)
+    parser.add_argument("--shard-size", type=int, default=SelfPlayConfig.SHARD_SIZE)
+    parser.add_argument("--seed", type=int, default=SelfPlayConfig.SEED)
+    parser.add_argument("--finish", action="store_true",
+                        help="write positions short of a full shard as a last, short shard instead of keeping them "
+                             "for the next run")
+    args = parser.parse_args()
+
+    try:
+        generate(args.output, args.agent, args.depth, args.games, args.workers, args.shard_size, args.seed,
+                 args.finish)
+    except ValueError as ex:
+        parser.error(str(ex))
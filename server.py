@@ -0,0 +1,379 @@
+import argparse
+import asyncio
+import inspect
+import itertools
+import json
+import math
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import chess
+
+import main
+import minimax
+import position_codec
+
+
+class ServerConfig:
+    HOST = "127.0.0.1"
+    PORT = 8765
+    WORKERS = os.cpu_count() or 1
+
+    # Defaults for new games; each game can choose its own
+    AGENT = "MiniMaxComplex"
+    DEPTH = 4
+    TIME_LIMIT = 5.0  # Per move, in seconds. Also checked inside the search, which keeps the last completed depth
+
+    MAX_SESSIONS = 1000
+    MAX_QUEUE = 256  # Searches waiting for a worker; past this, readers stop taking commands until there is room
+    HISTORY = 100  # Moves sent with each search, enough for every repetition the fifty-move rule allows
+    METRICS_INTERVAL = 30.0  # Seconds between metrics lines in the log (0 = off)
+
+
+# Protocol: one JSON object per line each way. Commands are
+#   {"cmd": "new", "fen": ..., "bot": "white" | "black" | "both" | "none", "agent": ..., "depth": ..., "time": ...}
+#   {"cmd": "move", "game": id, "move": uci}
+#   {"cmd": "state", "game": id}
+#   {"cmd": "close", "game": id}
+#   {"cmd": "metrics"}
+# and are answered with {"ok": true, ...} or {"ok": false, "error": ...}, echoing any "id" the command had. Bot moves
+# and game ends arrive later as {"event": "move", "game": id, ...} and {"event": "over", "game": id, ...}
+BOT_COLORS = {"white": {chess.WHITE}, "black": {chess.BLACK}, "both": {chess.WHITE, chess.BLACK}, "none": set()}
+
+
+def init_worker():
+    # Workers only search; they must not print, write index files or keep per-search benchmarks
+    main.Config.INDEX_MODE = False
+    main.Config.DEBUG = False
+    main.Config.INFO = False
+    main.Config.SEARCH_STATS = False
+    main.Config.TRACE = False
+
+
+def search_worker(job) -> dict:
+    """Searches a game's position in a worker process. Recent moves come with it, so repetitions are seen"""
+    position, agent_name, depth, time_limit = job
+    board = position_codec.decode(position)
+
+    start = time.perf_counter()
+    agent = getattr(minimax, agent_name)(board, depth)
+    agent.time_limit = time_limit
+    agent.hard_time_limit = time_limit
+    move = agent.find_move()
+    last = agent.iterations[-1] if agent.iterations else {}
+    move_eval = last.get("eval")
+    if move_eval is not None and math.isinf(move_eval):
+        move_eval = math.copysign(1e9, move_eval)  # JSON has no infinity
+    return {"move": move.uci(), "eval": move_eval, "depth": last.get("depth"), "nodes": agent.nodes,
+            "time": time.perf_counter() - start}
+
+
+class Client:
+    """Where a connection's replies and its games' events are written; stdout when there is no stream writer"""
+
+    def __init__(self, writer: asyncio.StreamWriter = None):
+        self.writer = writer
+        self.games = set()
+        self.closed = False
+
+    async def send(self, message: dict):
+        if self.closed:
+            return
+        line = json.dumps(message) + "\n"
+        if self.writer is None:
+            sys.stdout.write(line)
+            sys.stdout.flush()
+            return
+        try:
+            self.writer.write(line.encode())
+            await self.writer.drain()
+        except ConnectionError:
+            self.closed = True
+
+
+class GameSession:
+    def __init__(self, iden: int, board: chess.Board, agent_name: str, depth: int, time_limit: float, bot_colors,
+                 client: Client):
+        self.iden = iden
+        self.board = board
+        self.agent_name = agent_name
+        self.depth = depth
+        self.time_limit = time_limit
+        self.bot_colors = bot_colors
+        self.client = client
+        self.searching = False
+        self.closed = False
+
+    def bot_to_move(self) -> bool:
+        return not self.closed and not self.board.is_game_over() and self.board.turn in self.bot_colors
+
+    def job(self):
+        return position_codec.encode(self.board, ServerConfig.HISTORY), self.agent_name, self.depth, self.time_limit
+
+    def state(self) -> dict:
+        outcome = self.board.outcome()
+        return {"game": self.iden, "fen": self.board.fen(), "moves": len(self.board.move_stack),
+                "turn": "white" if self.board.turn else "black", "searching": self.searching,
+                "result": None if outcome is None else outcome.result()}
+
+
+class GameServer:
+    """
+    Many games in one event loop. Searches go through a bounded queue to one dispatcher per worker process, so the
+    loop itself only parses commands and moves results around, and a full queue holds up the clients adding to it
+    rather than the games already waiting
+    """
+
+    def __init__(self, workers: int = ServerConfig.WORKERS, max_queue: int = ServerConfig.MAX_QUEUE,
+                 max_sessions: int = ServerConfig.MAX_SESSIONS):
+        self.workers = workers
+        self.max_sessions = max_sessions
+        self.queue = asyncio.Queue(max_queue)
+        self.sessions = {}
+        self.game_ids = itertools.count(1)
+        self.pool: ProcessPoolExecutor = None
+        self.tasks = []
+        self.continuations = set()
+
+        # Metrics
+        self.started = time.perf_counter()
+        self.in_flight = 0
+        self.searches = 0
+        self.search_errors = 0
+        self.wait_time = 0.0
+        self.search_time = 0.0
+        self.max_queue_depth = 0
+
+    async def start(self, metrics_interval: float = ServerConfig.METRICS_INTERVAL):
+        self.pool = self.new_pool()
+        self.tasks = [asyncio.create_task(self.dispatch()) for i in range(self.workers)]
+        if metrics_interval > 0:
+            self.tasks.append(asyncio.create_task(self.log_metrics(metrics_interval)))
+
+    def new_pool(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(self.workers, initializer=init_worker)
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.pool.shutdown(cancel_futures=True)
+
+    def metrics(self) -> dict:
+        return {"sessions": len(self.sessions), "queue_depth": self.queue.qsize(),
+                "max_queue_depth": self.max_queue_depth, "in_flight": self.in_flight, "searches": self.searches,
+                "search_errors": self.search_errors,
+                "mean_wait": self.wait_time / self.searches if self.searches else 0.0,
+                "mean_search": self.search_time / self.searches if self.searches else 0.0,
+                "uptime": time.perf_counter() - self.started}
+
+    async def log_metrics(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            metrics = self.metrics()
+            main.info("{sessions} games, queue {queue_depth} (max {max_queue_depth}), {in_flight} searching, "
+                      "{searches} searches, mean wait {mean_wait:.2f}s, mean search {mean_search:.2f}s"
+                      .format(**metrics))
+
+    async def request_search(self, session: GameSession):
+        # Waits here while the queue is full, which stops the calling client's reader until a worker frees up
+        session.searching = True
+        await self.queue.put((session, time.perf_counter()))
+        self.max_queue_depth = max(self.max_queue_depth, self.queue.qsize())
+
+    async def dispatch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            session, queued = await self.queue.get()
+            if session.closed:
+                continue
+
+            started = time.perf_counter()
+            self.wait_time += started - queued
+            self.in_flight += 1
+            pool = self.pool
+            try:
+                result = await loop.run_in_executor(pool, search_worker, session.job())
+            except Exception as ex:
+                # A worker died, and a broken pool fails every search after it too, so the first to see it replaces it
+                if isinstance(ex, BrokenProcessPool) and pool is self.pool:
+                    main.info("Search worker died, restarting the pool: {}".format(ex))
+                    self.pool = self.new_pool()
+                    pool.shutdown(wait=False)
+                self.search_errors += 1
+                session.searching = False
+                await session.client.send({"event": "error", "game": session.iden, "error": str(ex)})
+                continue
+            finally:
+                self.in_flight -= 1
+
+            self.searches += 1
+            self.search_time += time.perf_counter() - started
+            if session.closed:
+                continue
+
+            session.board.push(chess.Move.from_uci(result["move"]))
+            await session.client.send(dict(result, event="move", game=session.iden, fen=session.board.fen()))
+
+            # A game with a bot to move next stays searching while that search waits for room, so it never looks idle
+            session.searching = session.bot_to_move()
+
+            # A bot's next move may have to wait for room in the queue, which dispatchers must never do themselves
+            continuation = asyncio.create_task(self.after_move(session))
+            self.continuations.add(continuation)
+            continuation.add_done_callback(self.continuations.discard)
+
+    async def after_move(self, session: GameSession):
+        outcome = session.board.outcome(claim_draw=True)
+        if outcome is not None:
+            session.searching = False
+            await session.client.send({"event": "over", "game": session.iden, "result": outcome.result(),
+                                       "termination": outcome.termination.name.lower()})
+        elif session.bot_to_move():
+            await self.request_search(session)
+
+    def close_session(self, session: GameSession):
+        session.closed = True
+        session.client.games.discard(session.iden)
+        self.sessions.pop(session.iden, None)
+
+    async def handle(self, client: Client, line: str):
+        command = None
+        try:
+            command = json.loads(line)
+            reply = dict(await self.execute(client, command), ok=True)
+        except (ValueError, KeyError, TypeError, AttributeError) as ex:
+            reply = {"ok": False, "error": "{}: {}".format(type(ex).__name__, ex)}
+
+        if isinstance(command, dict) and "id" in command:
+            reply["id"] = command["id"]
+        await client.send(reply)
+
+    async def execute(self, client: Client, command: dict) -> dict:
+        name = command["cmd"]
+        if name == "metrics":
+            return self.metrics()
+        if name == "new":
+            return await self.new_game(client, command)
+
+        session = self.sessions.get(command["game"])
+        if session is None or session.client is not client:
+            raise KeyError("no game {}".format(command["game"]))
+
+        if name == "state":
+            return session.state()
+        if name == "close":
+            self.close_session(session)
+            return {"game": session.iden}
+        if name == "move":
+            if session.searching or session.bot_to_move():
+                raise ValueError("not your move")
+            move = session.board.parse_uci(command["move"])
+            session.board.push(move)
+            await self.after_move(session)
+            return session.state()
+        raise ValueError("unknown command {}".format(name))
+
+    async def new_game(self, client: Client, command: dict) -> dict:
+        if len(self.sessions) >= self.max_sessions:
+            raise ValueError("server full")
+
+        agent_name = command.get("agent", ServerConfig.AGENT)
+        agent_cls = getattr(minimax, agent_name, None)
+        if not isinstance(agent_cls, type) or not issubclass(agent_cls, minimax.MiniMaxAbstract) \
+                or inspect.isabstract(agent_cls):
+            raise ValueError("unknown agent {}".format(agent_name))
+        board = chess.Board(command.get("fen", chess.STARTING_FEN))
+        if not board.is_valid():
+            raise ValueError("invalid position")
+
+        session = GameSession(next(self.game_ids), board, agent_name, int(command.get("depth", ServerConfig.DEPTH)),
+                              float(command.get("time", ServerConfig.TIME_LIMIT)),
+                              BOT_COLORS[command.get("bot", "black")], client)
+        self.sessions[session.iden] = session
+        client.games.add(session.iden)
+
+        if session.bot_to_move():
+            await self.request_search(session)
+        return session.state()
+
+    def disconnect(self, client: Client):
+        client.closed = True
+        for iden in list(client.games):
+            self.close_session(self.sessions[iden])
+
+    async def serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        client = Client(writer)
+        try:
+            while not client.closed:
+                line = await reader.readline()
+                if not line:
+                    break
+                if line.strip():
+                    await self.handle(client, line.decode())
+        except ConnectionError:
+            pass
+        finally:
+            self.disconnect(client)
+            writer.close()
+
+    async def serve_stdio(self):
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader()
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+
+        client = Client()
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            if line.strip():
+                await self.handle(client, line.decode())
+
+        # Input is done, but games with bots to move still play on until they are over
+        while any(session.searching for session in self.sessions.values()):
+            await asyncio.sleep(0.1)
+        self.disconnect(client)
+
+
+async def run(args):
+    server = GameServer(args.workers, args.max_queue, args.max_sessions)
+    await server.start(args.metrics_interval)
+    try:
+        if args.stdio:
+            await server.serve_stdio()
+        else:
+            listener = await asyncio.start_server(server.serve_connection, args.host, args.port)
+            main.info("Serving games on {}:{} with {} workers".format(args.host, args.port, args.workers))
+            async with listener:
+                await listener.serve_forever()
+    finally:
+        await server.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve many concurrent games over a JSON lines protocol")
+    parser.add_argument("--host", default=ServerConfig.HOST)
+    parser.add_argument("--port", type=int, default=ServerConfig.PORT)
+    parser.add_argument("--stdio", action="store_true", help="read commands from stdin and write to stdout")
+    parser.add_argument("--workers", type=int, default=ServerConfig.WORKERS)
+    parser.add_argument("--max-queue", type=int, default=ServerConfig.MAX_QUEUE)
+    parser.add_argument("--max-sessions", type=int, default=ServerConfig.MAX_SESSIONS)
+    parser.add_argument("--metrics-interval", type=float, default=ServerConfig.METRICS_INTERVAL)
+    parser.add_argument("--agent", default=ServerConfig.AGENT)
+    parser.add_argument("--depth", type=int, default=ServerConfig.DEPTH)
+    parser.add_argument("--time", type=float, default=ServerConfig.TIME_LIMIT)
+    args = parser.parse_args()
+
+    ServerConfig.AGENT = args.agent
+    ServerConfig.DEPTH = args.depth
+    ServerConfig.TIME_LIMIT = args.time
+    if args.stdio:
+        # Logging would otherwise be mixed into the protocol on stdout
+        main.Config.INFO = False
+        main.Config.DEBUG = False
+
+    asyncio.run(run(args))
@@ -0,0 +1,34 @@
+import os
+import random
+import sys
+
+import chess
+import pytest
+
+# The engine's modules live at the top of the repository rather than in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def play_random_games(games: int, plies: int, seed: int):
+    rng = random.Random(seed)
+    for game in range(games):
+        board = chess.Board()
+        for ply in range(plies):
+            moves = list(board.legal_moves)
+            if not moves:
+                break
+            board.push(rng.choice(moves))
+            yield board.copy()
+
+
+@pytest.fixture(scope="session")
+def terminal_boards() -> [chess.Board]:
+    """A checkmate, with white mated, and a stalemate"""
+    return [chess.Board("rnb1kbnr/pppp1ppp/8/4p3/6Pq/5P2/PPPPP2P/RNBQKBNR w KQkq - 1 3"),
+            chess.Board("7k/5Q2/6K1/8/8/8/8/8 b - - 0 1")]
+
+
+@pytest.fixture(scope="session")
+def random_boards():
+    """random_boards(games, plies, seed) yields a copy of the board, move stack included, after every random move"""
+    return play_random_games
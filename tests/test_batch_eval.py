@@ -0,0 +1,44 @@
+import chess
+import pytest
+
+import batch_eval
+import evaluate
+import pst
+
+@pytest.fixture(scope="module")
+def boards(terminal_boards, random_boards):
+    return terminal_boards + list(random_boards(12, 150, seed=3))
+
+
+@pytest.fixture(scope="module")
+def batch(boards):
+    return batch_eval.PositionBatch(boards)
+
+
+def test_material(boards, batch):
+    assert batch_eval.evaluate_material_batch(batch).tolist() == [evaluate.evaluate_material(b) for b in boards]
+
+
+def test_complex(boards, batch):
+    assert batch_eval.evaluate_complex_batch(batch).tolist() == \
+           pytest.approx([evaluate.evaluate_complex(b) for b in boards])
+
+
+def test_position(boards, batch):
+    expected = []
+    for board in boards:
+        score = evaluate.terminal_score(board)
+        expected.append(pst.evaluate_pst(board) if score is None else score)
+    assert batch_eval.evaluate_position_batch(batch).tolist() == pytest.approx(expected)
+
+
+def test_mated_side_loses(terminal_boards):
+    mated, stalemate = terminal_boards
+    assert evaluate.terminal_score(mated) == -1e9
+    assert evaluate.terminal_score(stalemate) == 0
+
+
+def test_iter_batches_covers_every_board(boards):
+    sizes = [len(chunk) for chunk in batch_eval.iter_batches(iter(boards), size=100)]
+    assert sum(sizes) == len(boards)
+    assert max(sizes) == 100
@@ -0,0 +1,78 @@
+import os
+import random
+
+import chess
+import pytest
+
+import bitbase
+
+WIN_SCORE = bitbase.BitbaseConfig.WIN_SCORE
+
+
+@pytest.fixture(scope="module")
+def bitbases(tmp_path_factory):
+    # KPK needs both of these for promotions and would double the generation time, so only these are tested
+    directory = str(tmp_path_factory.mktemp("bitbases"))
+    for name in ["KQK", "KRK"]:
+        distances = bitbase.generate(bitbase.TABLE_PIECES[name], {})
+        bitbase.write_table(os.path.join(directory, name + ".bb"), distances)
+    tables = bitbase.Bitbases(directory)
+    yield tables
+    tables.close()
+
+
+def random_positions(piece_type: chess.PieceType, count: int, seed: int):
+    """Legal positions of white king and piece against black king, with either side to move"""
+    rng = random.Random(seed)
+    positions = []
+    while len(positions) < count:
+        board = chess.Board(None)
+        squares = rng.sample(chess.SQUARES, 3)
+        board.set_piece_at(squares[0], chess.Piece(chess.KING, chess.WHITE))
+        board.set_piece_at(squares[1], chess.Piece(chess.KING, chess.BLACK))
+        board.set_piece_at(squares[2], chess.Piece(piece_type, chess.WHITE))
+        board.turn = rng.choice(chess.COLORS)
+        if board.is_valid() and not board.is_game_over():
+            positions.append(board)
+    return positions
+
+
+def test_mate_in_one(bitbases):
+    board = chess.Board("6k1/8/6K1/8/8/8/8/R7 w - - 0 1")
+    assert bitbases.probe(board) == 1
+    assert bitbases.score(board) == WIN_SCORE - 1
+
+
+def test_hanging_rook_is_a_draw(bitbases):
+    board = chess.Board("8/8/8/8/8/8/1k6/1R4K1 b - - 0 1")
+    assert bitbases.probe(board) == 0
+    assert bitbases.score(board) == 0
+
+
+def test_colours_mirror(bitbases):
+    for piece_type in [chess.QUEEN, chess.ROOK]:
+        for board in random_positions(piece_type, 200, seed=piece_type):
+            assert bitbases.score(board.mirror()) == bitbases.score(board)
+
+
+@pytest.mark.parametrize("piece_type", [chess.QUEEN, chess.ROOK])
+def test_distances_follow_the_best_moves(bitbases, piece_type):
+    # Every won position's score is one ply better than its best successor's, and drawn positions have a draw move
+    for board in random_positions(piece_type, 300, seed=10 + piece_type):
+        score = bitbases.score(board)
+        successors = []
+        for move in board.legal_moves:
+            board.push(move)
+            if board.is_checkmate():
+                successors.append(-WIN_SCORE)
+            elif chess.popcount(board.occupied) < 3 or board.is_stalemate():
+                successors.append(0)
+            else:
+                successors.append(bitbases.score(board))
+            board.pop()
+
+        best = -min(successors)
+        if best == 0:
+            assert score == 0
+        else:
+            assert score == best - 1 if best > 0 else score == best + 1
@@ -0,0 +1,14 @@
+import chess
+
+import evaluate
+
+def test_count_attacks(random_boards):
+    for board in random_boards(20, 200, seed=8):
+        for color in chess.COLORS:
+            expected = sum(len(board.attacks(square)) for square in chess.scan_forward(board.occupied_co[color]))
+            assert evaluate.count_attacks(board, color) == expected
+
+
+def test_mobility_matches_reference(terminal_boards, random_boards):
+    for board in terminal_boards + list(random_boards(40, 200, seed=9)):
+        assert evaluate.evaluate_mobility(board) == evaluate.evaluate_mobility_reference(board)
@@ -0,0 +1,96 @@
+import math
+
+import chess
+import pytest
+
+import main
+import mate
+import minimax
+
+MATES = [
+    ("6k1/5ppp/8/8/8/8/5PPP/R5K1 w - - 0 1", 1),  # Back rank
+    ("kbK5/pp6/1P6/8/8/8/8/R7 w - - 0 1", 2),  # Quiet rook lift first
+    ("7k/8/5K2/8/8/8/8/R7 w - - 0 1", 2),
+    ("6k1/8/8/6K1/8/8/8/R7 w - - 0 1", 3),
+]
+NO_MATE = "5rk1/5ppp/8/8/8/8/1Q3PPP/6K1 w - - 0 1"
+
+
+def forced_mate(board: chess.Board, moves: int) -> bool:
+    """Whether the side that just moved mates within moves more of its own, by trying every line"""
+    if board.is_checkmate():
+        return True
+    if moves == 0 or board.is_game_over():
+        return False
+    for reply in list(board.legal_moves):
+        board.push(reply)
+        mated = any(attack(board, move, moves) for move in list(board.legal_moves))
+        board.pop()
+        if not mated:
+            return False
+    return True
+
+
+def attack(board: chess.Board, move: chess.Move, moves: int) -> bool:
+    board.push(move)
+    mated = forced_mate(board, moves - 1)
+    board.pop()
+    return mated
+
+
+@pytest.mark.parametrize("fen, moves", MATES)
+def test_finds_quickest_mate(fen, moves):
+    board = chess.Board(fen)
+    move, moves_to_mate, nodes, elapsed = mate.find_mate(board, 3)
+    assert moves_to_mate == moves
+    assert attack(board, move, moves)
+    assert board.fen() == fen
+
+
+def test_checks_only_skips_quiet_mates():
+    assert mate.find_mate(chess.Board(MATES[0][0]), 3, checks_only=True)[1] == 1
+    assert mate.find_mate(chess.Board(MATES[1][0]), 3, checks_only=True)[0] is None
+
+
+@pytest.mark.parametrize("node_limit", [None, 500, 5000])
+def test_no_mate_within_node_limit(node_limit):
+    move, moves_to_mate, nodes, elapsed = mate.find_mate(chess.Board(NO_MATE), 3, node_limit=node_limit)
+    assert move is None and moves_to_mate is None
+    if node_limit is not None:
+        assert nodes <= node_limit
+
+
+def test_node_limit_stops_before_a_mate():
+    fen, moves = MATES[3]
+    assert mate.find_mate(chess.Board(fen), moves, node_limit=50)[0] is None
+
+
+@pytest.fixture
+def plain_search(monkeypatch):
+    monkeypatch.setattr(main.Config, "OPENING_BOOK", False)
+    monkeypatch.setattr(main.Config, "INDEX_MODE", False)
+    monkeypatch.setattr(main.Config, "BITBASES", False)
+    monkeypatch.setattr(main.Config, "SEARCH_STATS", True)
+
+
+def test_agent_solves_mate(plain_search):
+    fen, moves = MATES[3]
+    agent = minimax.MiniMaxMaterial(chess.Board(fen), 4)
+    agent.mate_depth = moves
+    move = agent.find_move()
+
+    assert attack(agent.board, move, moves)
+    assert [(iteration["depth"], iteration["move"]) for iteration in agent.iterations] == [(5, move.uci())]
+    assert agent.stats.mate_nodes == agent.nodes > 0
+
+
+def test_agent_searches_when_there_is_no_mate(plain_search):
+    agent = minimax.MiniMaxMaterial(chess.Board(NO_MATE), 3)
+    agent.time_limit = math.inf
+    agent.node_limit = 20000
+    agent.mate_depth = 3
+    move = agent.find_move()
+
+    assert move in agent.board.legal_moves
+    assert [iteration["depth"] for iteration in agent.iterations] == [1, 2, 3]
+    assert 0 < agent.stats.mate_nodes < agent.nodes
@@ -0,0 +1,106 @@
+import chess
+import pytest
+
+import agent
+from agent import MCTSAgent, MCTSConfig, MCTSTree
+
+
+def walk(node: agent.MCTSNode):
+    yield node
+    for child in node.children:
+        yield from walk(child)
+
+
+def assert_visits_are_playouts(tree: MCTSTree, root_playouts: int = 0):
+    """
+    Every playout visits each node on its path once, and no virtual loss is left behind after a batch. Other than
+    the root, each node also had the playout that added it, and so does a root reused from below an older one
+    """
+    for node in walk(tree.root):
+        below = sum(child.visits for child in node.children)
+        if node is tree.root:
+            assert node.visits == below + root_playouts
+        elif node.terminal is not None:
+            assert not node.children and node.visits >= 1
+        else:
+            assert node.visits == below + 1
+        assert 0 <= node.value_sum <= node.visits
+
+
+@pytest.mark.parametrize("virtual_loss", [1, 3])
+def test_visits_after_batches(monkeypatch, virtual_loss):
+    monkeypatch.setattr(MCTSConfig, "VIRTUAL_LOSS", virtual_loss)
+    tree = MCTSTree()
+    tree.set_root(chess.Board("r1bqkb1r/pppp1ppp/2n2n2/4p3/2B1P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 4 4"))
+    done = tree.search(200, float("inf"))
+    assert done == 200
+    assert tree.root.visits == 200
+    assert tree.evals <= 200
+    assert_visits_are_playouts(tree)
+
+
+def test_rollouts_keep_visits(monkeypatch):
+    monkeypatch.setattr(MCTSConfig, "ROLLOUT_PLIES", 6)
+    tree = MCTSTree()
+    tree.set_root(chess.Board())
+    tree.search(100, float("inf"))
+    assert_visits_are_playouts(tree)
+
+
+def test_playout_budget():
+    board = chess.Board()
+    mcts = MCTSAgent(board, playouts=150, workers=1)
+    mcts.find_move()
+    assert mcts.nodes == 150
+    assert mcts.stats.playouts == 150
+    assert sum(visits for visits, value_sum in mcts.root_stats.values()) == 150
+    assert len(mcts.iterations) == 1 and mcts.iterations[0]["nodes"] == 150
+
+
+def test_time_budget():
+    mcts = MCTSAgent(chess.Board(), playouts=float("inf"), time_limit=0.2, workers=1)
+    mcts.find_move()
+    assert mcts.nodes >= MCTSConfig.BATCH_SIZE
+    assert mcts.stats.elapsed < 1.0
+
+
+def test_tree_reused_after_push():
+    board = chess.Board()
+    mcts = MCTSAgent(board, playouts=400, workers=1)
+    move = mcts.find_move()
+    child = next(child for child in mcts.tree.root.children if child.move == move)
+    reply = max(child.children, key=lambda node: node.visits)
+    kept = reply.visits
+
+    board.push(move)
+    board.push(reply.move)
+    mcts.find_move()
+    assert mcts.tree.root is reply
+    assert mcts.reused == kept > 0
+    assert mcts.tree.root.visits == kept + 400
+    assert_visits_are_playouts(mcts.tree, root_playouts=1)
+
+
+def test_finds_mate_in_one():
+    mcts = MCTSAgent(chess.Board("6k1/5ppp/8/8/8/8/5PPP/R5K1 w - - 0 1"), playouts=400, workers=1)
+    assert mcts.find_move() == chess.Move.from_uci("a1a8")
+
+
+def test_claimable_draw_at_root():
+    board = chess.Board()
+    for i in range(2):
+        for uci in ["g1f3", "g8f6", "f3g1", "f6g8"]:
+            board.push_uci(uci)
+    assert board.can_claim_threefold_repetition() and not board.is_game_over()
+    assert MCTSAgent(board, playouts=100, workers=1).find_move() in board.legal_moves
+
+
+def test_workers_sum_their_trees():
+    mcts = MCTSAgent(chess.Board(), playouts=101, workers=2)
+    try:
+        move = mcts.find_move()
+        assert move in chess.Board().legal_moves
+        assert mcts.nodes == 101
+        assert sum(visits for visits, value_sum in mcts.root_stats.values()) == 101
+    finally:
+        mcts.close()
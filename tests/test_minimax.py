@@ -0,0 +1,99 @@
+import math
+
+import chess
+import pytest
+
+import main
+import minimax
+
+# The hard limits are polled every 1024 nodes, so a search can run this far past them
+POLL_INTERVAL = 1024
+
+
+@pytest.fixture(autouse=True)
+def plain_search(monkeypatch):
+    monkeypatch.setattr(main.Config, "OPENING_BOOK", False)
+    monkeypatch.setattr(main.Config, "INDEX_MODE", False)
+    monkeypatch.setattr(main.Config, "BITBASES", False)
+
+
+def limited_agent(board: chess.Board, node_limit: int) -> minimax.MiniMaxMaterial:
+    # Set up the way analyse.py sets up --nodes
+    agent = minimax.MiniMaxMaterial(board, 64)
+    agent.time_limit = math.inf
+    agent.node_limit = node_limit
+    agent.hard_node_limit = node_limit
+    return agent
+
+
+@pytest.mark.parametrize("mate_probe", [0, 2])
+def test_node_limit_applies_per_search(monkeypatch, mate_probe):
+    monkeypatch.setattr(main.Config, "MATE_PROBE", mate_probe)
+    node_limit = 4000
+    agent = limited_agent(chess.Board("r1bqkb1r/pppp1ppp/2n2n2/4p3/2B1P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 4 4"),
+                          node_limit)
+
+    depths = []
+    for search in range(3):
+        start_nodes = agent.nodes
+        move = agent.find_move()
+        assert move in agent.board.legal_moves
+        assert agent.nodes - start_nodes < node_limit + POLL_INTERVAL
+        depths.append(agent.max_depth)
+
+        agent.board.push(move)
+        agent.board.push(next(iter(agent.board.legal_moves)))
+
+    # Every search gets the whole budget, not what is left of the agent's lifetime total
+    assert min(depths) >= 3
+
+
+@pytest.mark.parametrize("depth", [1, 3])
+def test_position_agent_mates_in_one(depth):
+    # Back rank mate, found as a leaf at depth 1 and inside the tree at depth 3
+    agent = minimax.MiniMaxPosition(chess.Board("6k1/5ppp/8/8/8/8/5PPP/R5K1 w - - 0 1"), depth)
+    agent.time_limit = math.inf
+    assert agent.find_move() == chess.Move.from_uci("a1a8")
+
+
+def multi_pv_agent(depth: int) -> minimax.MiniMaxMaterial:
+    agent = minimax.MiniMaxMaterial(chess.Board("r1bqkb1r/pppp1ppp/2n2n2/4p3/2B1P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 4 4"),
+                                    depth)
+    agent.time_limit = math.inf
+    agent.manage_time = False
+    agent.multi_pv = 3
+    return agent
+
+
+def test_multi_pv():
+    agent = multi_pv_agent(3)
+    move = agent.find_move()
+
+    assert agent.excluded_moves == set()
+    for iteration in agent.iterations:
+        pvs = iteration["pvs"]
+        assert len(pvs) == 3
+        assert len({pv["move"] for pv in pvs}) == 3
+        assert [pv["eval"] for pv in pvs] == sorted((pv["eval"] for pv in pvs), reverse=True)
+        assert pvs[0]["move"] == iteration["move"] and all(pv["pv"][0] == pv["move"] for pv in pvs)
+    assert move.uci() == agent.iterations[-1]["move"]
+
+
+def test_multi_pv_aborted(monkeypatch):
+    agent = multi_pv_agent(3)
+    root_fen = agent.board.fen()
+    negamax = agent.negamax
+
+    # Aborts inside the second principal variation of depth 2, while its first move is excluded
+    def aborting(depth, color, alpha, beta, allow_null_move):
+        if agent.excluded_moves and agent.root_depth == 2 and depth < agent.root_depth:
+            raise minimax.SearchAborted()
+        return negamax(depth, color, alpha, beta, allow_null_move)
+
+    monkeypatch.setattr(agent, "negamax", aborting)
+    move = agent.find_move()
+
+    assert agent.excluded_moves == set()
+    assert agent.board.fen() == root_fen
+    assert agent.max_depth == 1 and [iteration["depth"] for iteration in agent.iterations] == [1]
+    assert move.uci() == agent.iterations[0]["move"]
@@ -0,0 +1,57 @@
+import random
+
+import chess
+import numpy as np
+import pytest
+
+import nnue
+
+# Quantization error of the integer network against the float reference, in evaluation units
+REFERENCE_TOLERANCE = 25
+
+
+@pytest.fixture(scope="module")
+def network(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("nnue") / "random.npz")
+    nnue.random_network(path, seed=69)
+    return nnue.Network(path)
+
+
+def test_incremental_matches_refresh(network):
+    rng = random.Random(1)
+    for game in range(8):
+        board = chess.Board()
+        accumulator = nnue.Accumulator(network, board)
+        for ply in range(120):
+            moves = list(board.legal_moves)
+            if not moves:
+                break
+            move = rng.choice(moves)
+            accumulator.push(board, move)
+            board.push(move)
+
+            accumulator.refresh_stale(board)
+            for perspective in chess.COLORS:
+                assert np.array_equal(accumulator.values[perspective], network.refresh(board, perspective))
+            assert accumulator.evaluate(board) == network.evaluate(board)
+
+
+def test_pop_restores(network):
+    board = chess.Board()
+    accumulator = nnue.Accumulator(network, board)
+    start = [values.copy() for values in accumulator.values]
+    moves = [chess.Move.from_uci(uci) for uci in ["e2e4", "e7e5", "e1e2", "d8h4", "e2e1"]]
+    for move in moves:
+        accumulator.push(board, move)
+        board.push(move)
+    for move in moves:
+        board.pop()
+        accumulator.pop()
+    accumulator.refresh_stale(board)
+    for perspective in chess.COLORS:
+        assert np.array_equal(accumulator.values[perspective], start[perspective])
+
+
+def test_quantized_close_to_reference(network, random_boards):
+    for board in random_boards(4, 80, seed=2):
+        assert network.evaluate(board) == pytest.approx(network.evaluate_reference(board), abs=REFERENCE_TOLERANCE)
@@ -0,0 +1,55 @@
+import chess
+
+import position_codec
+
+
+def assert_same_position(decoded: chess.Board, board: chess.Board):
+    assert decoded.fen() == board.fen()
+    assert decoded.castling_rights == board.castling_rights
+    assert set(decoded.legal_moves) == set(board.legal_moves)
+
+
+def test_round_trip(random_boards):
+    for board in random_boards(20, 200, seed=4):
+        encoded = position_codec.encode(board)
+        assert len(encoded) == position_codec.encoded_size(board)
+        assert_same_position(position_codec.decode(encoded), board)
+
+
+def test_start_position_size():
+    assert len(position_codec.encode(chess.Board())) == 31
+
+
+def test_history_keeps_repetitions():
+    board = chess.Board()
+    for i in range(2):
+        for uci in ["g1f3", "g8f6", "f3g1", "f6g8"]:
+            board.push_uci(uci)
+    decoded = position_codec.decode(position_codec.encode(board, history=100))
+    assert_same_position(decoded, board)
+    assert decoded.is_repetition(3)
+    assert decoded.can_claim_threefold_repetition()
+    assert not position_codec.decode(position_codec.encode(board)).is_repetition(3)
+
+
+def test_history_stops_at_irreversible_moves():
+    board = chess.Board()
+    for uci in ["e2e4", "e7e5", "g1f3", "b8c6"]:
+        board.push_uci(uci)
+    decoded = position_codec.decode(position_codec.encode(board, history=100))
+    assert decoded.move_stack == board.move_stack[-2:]
+
+
+def test_encode_into_packs_positions_back_to_back(random_boards):
+    boards = list(random_boards(2, 30, seed=5))
+    buffer = bytearray(sum(position_codec.encoded_size(board, 10) for board in boards))
+    offset = 0
+    for board in boards:
+        offset = position_codec.encode_into(buffer, offset, board, 10)
+    assert offset == len(buffer)
+
+    offset = 0
+    view = memoryview(buffer)
+    for board in boards:
+        decoded, offset = position_codec.decode_from(view, offset)
+        assert_same_position(decoded, board)
@@ -0,0 +1,74 @@
+import random
+
+import chess
+import pytest
+
+import pst
+
+# Castling both ways, en passant, promotion by capture and an underpromotion, for each colour
+SPECIAL_GAMES = [
+    ("r3k2r/pppq1ppp/2n1bn2/3pp3/3PP3/2N1BN2/PPPQ1PPP/R3K2R w KQkq - 0 1", ["e1g1", "e8c8", "f1e1", "d8e8"]),
+    ("4k3/8/8/3pP3/8/8/8/4K3 w - d6 0 1", ["e5d6", "e8d8", "d6d7", "d8d7"]),
+    ("4k3/8/8/8/3pP3/8/8/4K3 b - e3 0 1", ["d4e3", "e1e2", "e8d7", "e2e3"]),
+    ("1n6/P6k/8/8/8/8/7p/K5N1 w - - 0 1", ["a7b8q", "h2g1n", "b8b5", "g1f3"]),
+    ("4k3/1P6/8/8/8/8/6p1/4K3 b - - 0 1", ["g2g1r", "e1e2", "g1g8", "b7b8n"]),
+]
+
+
+def assert_matches_refresh(accumulator: pst.PSTAccumulator, board: chess.Board):
+    fresh = pst.PSTAccumulator(board)
+    assert (accumulator.middlegame, accumulator.endgame, accumulator.phase) == \
+           (fresh.middlegame, fresh.endgame, fresh.phase)
+    assert accumulator.score() == pytest.approx(pst.evaluate_pst(board))
+
+
+def special_first(board: chess.Board, rng: random.Random) -> chess.Move:
+    # Random games rarely castle, take en passant or promote, so those moves are played whenever there is one
+    moves = list(board.legal_moves)
+    special = [move for move in moves if move.promotion or board.is_castling(move) or board.is_en_passant(move)]
+    return rng.choice(special or moves)
+
+
+@pytest.mark.parametrize("fen, moves", SPECIAL_GAMES)
+def test_special_moves(fen, moves):
+    board = chess.Board(fen)
+    accumulator = pst.PSTAccumulator(board)
+    for uci in moves:
+        move = board.parse_uci(uci)
+        accumulator.push(board, move)
+        board.push(move)
+        assert_matches_refresh(accumulator, board)
+    for uci in moves:
+        board.pop()
+        accumulator.pop()
+        assert_matches_refresh(accumulator, board)
+
+
+def test_incremental_matches_refresh():
+    rng = random.Random(7)
+    kinds = set()
+    for game in range(20):
+        board = chess.Board()
+        accumulator = pst.PSTAccumulator(board)
+        for ply in range(160):
+            if board.is_game_over():
+                break
+            # Now and then take back a few moves, as the search does
+            if board.move_stack and rng.random() < 0.1:
+                for i in range(rng.randint(1, min(4, len(board.move_stack)))):
+                    board.pop()
+                    accumulator.pop()
+                assert_matches_refresh(accumulator, board)
+
+            move = special_first(board, rng)
+            kinds.update(kind for kind, special in [("promotion", move.promotion), ("castling", board.is_castling(move)),
+                                                    ("en passant", board.is_en_passant(move))] if special)
+            accumulator.push(board, move)
+            board.push(move)
+            assert_matches_refresh(accumulator, board)
+
+        while board.move_stack:
+            board.pop()
+            accumulator.pop()
+        assert_matches_refresh(accumulator, board)
+    assert kinds == {"promotion", "castling", "en passant"}
@@ -0,0 +1,82 @@
+import time
+
+import chess
+import pytest
+
+import main
+import minimax
+import search_events
+
+
+@pytest.fixture
+def subscriber():
+    # Port 0 binds a free port, so tests never collide with a dashboard that is already open
+    events = search_events.EventSubscriber("127.0.0.1", 0)
+    yield events
+    events.close()
+
+
+def poll_until(subscriber: search_events.EventSubscriber, kind: str, timeout: float = 2.0) -> [dict]:
+    received = []
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        received.extend(subscriber.poll())
+        if any(event["kind"] == kind for event in received):
+            break
+        time.sleep(0.01)
+    return received
+
+
+def test_publish_reaches_subscriber(subscriber):
+    publisher = search_events.EventPublisher(*subscriber.socket.getsockname(), interval=0.25)
+    publisher.publish("move", "TestAgent", {"move": "e2e4"})
+    events = poll_until(subscriber, "move")
+    assert [event["move"] for event in events] == ["e2e4"]
+    assert events[0]["agent"] == "TestAgent"
+    assert publisher.sent == 1
+
+
+def test_monitor_follows_a_search(subscriber, monkeypatch):
+    host, port = subscriber.socket.getsockname()
+    monkeypatch.setattr(main.Config, "EVENTS", True)
+    monkeypatch.setattr(main.Config, "EVENTS_HOST", host)
+    monkeypatch.setattr(main.Config, "EVENTS_PORT", port)
+    monkeypatch.setattr(main.Config, "OPENING_BOOK", False)
+    monkeypatch.setattr(main.Config, "INDEX_MODE", False)
+
+    agent = minimax.MiniMaxMaterial(chess.Board(), 3)
+    agent.find_move()
+
+    monitor = search_events.SearchMonitor(history=60.0, eval_clamp=2000)
+    for event in poll_until(subscriber, "move"):
+        monitor.add(event)
+
+    assert len(monitor.agents) == 1
+    agent_name = monitor.agents[0]
+    assert agent_name.startswith("MiniMaxMaterial ")
+    assert [value for at, value in monitor.series["depth"][agent_name]] == [1, 2, 3]
+    assert monitor.latest[agent_name]["depth"] == 3
+    assert monitor.pvs[agent_name].startswith("1. ")
+
+
+def iteration(agent: str, at: float, depth: int, score: float) -> dict:
+    return {"kind": "iteration", "agent": agent, "pid": 1, "time": at, "depth": depth, "eval": score,
+            "nps": 1000.0, "tt_hit_rate": None, "fen": chess.STARTING_FEN,
+            "pvs": [{"move": "e2e4", "eval": score, "pv": ["e2e4", "e7e5"]}]}
+
+
+def test_monitor_series():
+    monitor = search_events.SearchMonitor(history=10.0, eval_clamp=500)
+    monitor.add(iteration("A", 100.0, 1, 1e9))
+    monitor.add(iteration("B", 105.0, 1, -20))
+    monitor.add(iteration("A", 108.0, 2, 30))
+
+    assert monitor.agents == ["A 1", "B 1"]
+    assert list(monitor.series["eval"]["A 1"]) == [(100.0, 500), (108.0, 30)]
+    assert "A 1" not in monitor.series["tt_hit_rate"]
+    assert monitor.pvs["B 1"] == "1. e4 e5"
+
+    monitor.prune(112.0)
+    assert list(monitor.series["eval"]["A 1"]) == [(108.0, 30)]
+    assert list(monitor.series["depth"]["B 1"]) == [(105.0, 1)]
+    assert monitor.received == 3
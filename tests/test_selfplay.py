@@ -0,0 +1,101 @@
+import json
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+import selfplay
+
+SHARD_SIZE = 10
+
+
+@pytest.fixture
+def games(random_boards):
+    """Rows of five games, eight positions each, none repeated between them"""
+    boards = list(random_boards(5, 8, seed=6))
+    return [selfplay.encode_records([(board, 0.0) for board in boards[game * 8:game * 8 + 8]], 0.5)
+            for game in range(5)]
+
+
+def all_keys(directory: str) -> [int]:
+    return [key for shard in selfplay.iter_shards(directory) for key in shard["key"].tolist()]
+
+
+def assert_resumed_cleanly(directory: str, games):
+    writer = selfplay.ShardWriter(directory, SHARD_SIZE)
+    assert writer.buffered == 0 and writer.queue == []
+    # The killed game still had positions buffered, so it is played again and its written positions deduped
+    assert [writer.recorded(game_id) for game_id in range(5)] == [True, True, True, False, False]
+
+    writer.add(3, games[3])
+    writer.add(4, games[4])
+    writer.finish()
+    keys = all_keys(directory)
+    assert len(keys) == len(set(keys)) == 40
+    assert writer.manifest["games"] == [0, 1, 2, 3, 4]
+    assert not os.path.exists(os.path.join(directory, selfplay.PENDING))
+
+
+def run_until_killed(directory: str, games):
+    # Three games leave 4 positions pending, which the fourth game's positions fill into the third shard
+    writer = selfplay.ShardWriter(directory, SHARD_SIZE)
+    for game_id in range(3):
+        writer.add(game_id, games[game_id])
+    writer.close()
+    assert writer.manifest["pending"]["positions"] == 4
+
+    # Killed after its shard is written, before close
+    writer = selfplay.ShardWriter(directory, SHARD_SIZE)
+    assert writer.buffered == 4
+    writer.add(3, games[3])
+    assert len(writer.manifest["shards"]) == 3
+
+
+def test_resume_after_kill(tmp_path, games):
+    directory = str(tmp_path)
+    run_until_killed(directory, games)
+    assert selfplay.load_manifest(directory)["pending"] is None
+    assert_resumed_cleanly(directory, games)
+
+
+def test_resume_drops_pending_rows_already_in_a_shard(tmp_path, games):
+    # A run that was killed before write_shard cleared the pending entry left it pointing at rows it had written
+    directory = str(tmp_path)
+    writer = selfplay.ShardWriter(directory, SHARD_SIZE)
+    for game_id in range(3):
+        writer.add(game_id, games[game_id])
+    writer.close()
+    stale = selfplay.load_manifest(directory)["pending"]
+    shutil.copy(os.path.join(directory, selfplay.PENDING), os.path.join(directory, "stale.npz"))
+
+    writer = selfplay.ShardWriter(directory, SHARD_SIZE)
+    writer.add(3, games[3])
+    shutil.move(os.path.join(directory, "stale.npz"), os.path.join(directory, selfplay.PENDING))
+    manifest = selfplay.load_manifest(directory)
+    manifest["pending"] = stale
+    with open(os.path.join(directory, selfplay.MANIFEST), "w") as io:
+        json.dump(manifest, io)
+
+    assert_resumed_cleanly(directory, games)
+
+
+def test_short_shard_only_on_finish(tmp_path, games):
+    directory = str(tmp_path)
+    writer = selfplay.ShardWriter(directory, SHARD_SIZE)
+    writer.add(0, games[0])
+    writer.add(1, games[1])
+    writer.close()
+    assert [shard["positions"] for shard in writer.manifest["shards"]] == [10]
+
+    writer = selfplay.ShardWriter(directory, SHARD_SIZE)
+    writer.finish()
+    assert [shard["positions"] for shard in writer.manifest["shards"]] == [10, 6]
+    assert np.array_equal(np.concatenate([games[0]["key"], games[1]["key"]]), np.array(all_keys(directory)))
+
+
+def test_refuses_other_settings(tmp_path):
+    directory = str(tmp_path)
+    selfplay.generate(directory, "MiniMaxMaterial", 1, 0, 1, SHARD_SIZE, 69)
+    with pytest.raises(ValueError):
+        selfplay.generate(directory, "MiniMaxMaterial", 2, 0, 1, SHARD_SIZE, 69)
@@ -0,0 +1,269 @@
+import argparse
+import csv
+import os
+
+import chess
+import chess.pgn
+import numpy as np
+
+import batch_eval
+import evaluate
+import selfplay
+
+
+class TuneConfig:
+    PUZZLE_FILE = "puzzles/lichess_db_puzzle.csv"
+    PUZZLE_LIMIT = 200000
+    PGN_FILES = []  # Self-play games, e.g. the output of main.py
+    PGN_MIN_PLY = 16  # Skip the opening, which mostly comes from the book
+    SELFPLAY_DIRS = []  # Shard directories written by selfplay.py
+
+    FEATURE_FILE = "tune_features.npz"  # Positions are only encoded once; delete to re-extract
+    CHUNK_SIZE = 1 << 14  # Positions encoded at a time
+
+    EPOCHS = 50
+    BATCH_SIZE = 1 << 12
+    LEARNING_RATE = 0.05
+    SEED = 69
+
+
+# Columns of the feature matrix, all from white's point of view
+TUNED_PIECES = [chess.PAWN, chess.KNIGHT, chess.BISHOP, chess.ROOK, chess.QUEEN]
+MATERIAL = slice(0, 5)  # White minus black piece counts
+LEGAL_MOVES = 5
+KNIGHTS_ON_EDGE = 6  # Black minus white
+CENTRE_PAWNS = 7  # White minus black
+CENTRE_KNIGHTS = 8
+FEATURES = 9
+
+# Parameters, in order: five piece values, mobility, knight edge penalty, centre fraction
+PIECE_PARAMS = slice(0, 5)
+MOBILITY = 5
+KNIGHT_EDGE = 6
+CENTRE = 7
+
+
+def is_quiet(board: chess.Board) -> bool:
+    return not board.is_check() and not board.is_game_over()
+
+
+def puzzle_positions(path: str, limit: int):
+    """Yields (board, result for white) for the final position of each puzzle's solution"""
+    with open(path, "r", newline="") as io:
+        for row_index, row in enumerate(csv.reader(io)):
+            if row_index >= limit:
+                break
+            if row[0] == "PuzzleId":
+                continue
+
+            board = chess.Board(row[1])
+            try:
+                for uci in row[2].split(" "):
+                    board.push_uci(uci)
+            except ValueError:
+                continue
+            if not is_quiet(board):
+                continue
+
+            # The puzzle FEN is before the opponent's first move, so the solver is the side not to move in it
+            solver = not chess.Board(row[1]).turn
+            result = 0.5 if "equality" in row[7] else 1.0
+            yield board, (result if solver == chess.WHITE else 1 - result)
+
+
+def pgn_positions(path: str, min_ply: int):
+    """Yields (board, result for white) for quiet positions of every decided or drawn game"""
+    results = {"1-0": 1.0, "0-1": 0.0, "1/2-1/2": 0.5}
+    with open(path, "r") as io:
+        while True:
+            game = chess.pgn.read_game(io)
+            if game is None:
+                break
+            result = results.get(game.headers.get("Result"))
+            if result is None:
+                continue
+
+            board = game.board()
+            for ply, move in enumerate(game.mainline_moves()):
+                tactical = board.is_capture(move) or move.promotion is not None
+                board.push(move)
+                if ply + 1 >= min_ply and not tactical and is_quiet(board):
+                    yield board.copy(stack=False), result
+
+
+def selfplay_positions(directory: str):
+    """Yields (board, result for white) for every position in a selfplay.py shard directory"""
+    for shard in selfplay.iter_shards(directory):
+        for board, result in zip(selfplay.decode_boards(shard), shard["result"].tolist()):
+            yield board, result
+
+
+def encode_features(batch: batch_eval.PositionBatch) -> np.ndarray:
+    counts = batch.piece_counts()
+    planes = batch.planes
+    white = [batch_eval.PLANES.index((chess.WHITE, piece_type)) for piece_type in TUNED_PIECES]
+    black = [batch_eval.PLANES.index((chess.BLACK, piece_type)) for piece_type in TUNED_PIECES]
+
+    edge = batch_eval.square_weights(evaluate.edge_squares)
+    centre = batch_eval.square_weights(evaluate.centre_squares)
+
+    features = np.empty((len(batch), FEATURES), dtype=np.float32)
+    features[:, MATERIAL] = counts[:, white] - counts[:, black]
+    features[:, LEGAL_MOVES] = batch.legal_move_counts
+    features[:, KNIGHTS_ON_EDGE] = planes[:, black[1]] @ edge - planes[:, white[1]] @ edge
+    features[:, CENTRE_PAWNS] = planes[:, white[0]] @ centre - planes[:, black[0]] @ centre
+    features[:, CENTRE_KNIGHTS] = planes[:, white[1]] @ centre - planes[:, black[1]] @ centre
+    return features
+
+
+def extract(positions, chunk_size: int):
+    """Encodes a stream of (board, result) a chunk at a time, so only the feature rows are ever held in memory"""
+    features = []
+    results = []
+
+    boards = []
+    chunk_results = []
+    for board, result in positions:
+        boards.append(board)
+        chunk_results.append(result)
+        if len(boards) >= chunk_size:
+            features.append(encode_features(batch_eval.PositionBatch(boards)))
+            results.append(np.array(chunk_results, dtype=np.float32))
+            boards = []
+            chunk_results = []
+
+    if boards:
+        features.append(encode_features(batch_eval.PositionBatch(boards)))
+        results.append(np.array(chunk_results, dtype=np.float32))
+
+    if not features:
+        return np.empty((0, FEATURES), dtype=np.float32), np.empty(0, dtype=np.float32)
+    return np.concatenate(features), np.concatenate(results)
+
+
+def initial_params() -> np.ndarray:
+    params = np.empty(8)
+    params[PIECE_PARAMS] = [evaluate.EvalWeights.PIECE_VALUES[piece_type] for piece_type in TUNED_PIECES]
+    params[MOBILITY] = evaluate.EvalWeights.MOBILITY
+    params[KNIGHT_EDGE] = evaluate.EvalWeights.KNIGHT_EDGE_PENALTY
+    params[CENTRE] = evaluate.EvalWeights.CENTRE_FRACTION
+    return params
+
+
+def scores(params: np.ndarray, features: np.ndarray) -> np.ndarray:
+    """evaluate_complex as a function of the parameters, leaving out the rounding of the centre term"""
+    centre_value = params[0] * features[:, CENTRE_PAWNS] + params[1] * features[:, CENTRE_KNIGHTS]
+    return (2 * features[:, MATERIAL] @ params[PIECE_PARAMS] + params[MOBILITY] * features[:, LEGAL_MOVES]
+            + params[KNIGHT_EDGE] * features[:, KNIGHTS_ON_EDGE] + params[CENTRE] * centre_value)
+
+
+def sigmoid(x: np.ndarray) -> np.ndarray:
+    return 1 / (1 + np.exp(-np.clip(x, -500, 500)))
+
+
+def loss(params: np.ndarray, features: np.ndarray, results: np.ndarray, k: float) -> float:
+    p = np.clip(sigmoid(k * scores(params, features)), 1e-7, 1 - 1e-7)
+    return float(-np.mean(results * np.log(p) + (1 - results) * np.log(1 - p)))
+
+
+def gradient(params: np.ndarray, features: np.ndarray, results: np.ndarray, k: float) -> np.ndarray:
+    error = (sigmoid(k * scores(params, features)) - results) * k / len(results)
+
+    grad = np.empty_like(params)
+    grad[PIECE_PARAMS] = 2 * error @ features[:, MATERIAL]
+    grad[0] += params[CENTRE] * (error @ features[:, CENTRE_PAWNS])
+    grad[1] += params[CENTRE] * (error @ features[:, CENTRE_KNIGHTS])
+    grad[MOBILITY] = error @ features[:, LEGAL_MOVES]
+    grad[KNIGHT_EDGE] = error @ features[:, KNIGHTS_ON_EDGE]
+    grad[CENTRE] = error @ (params[0] * features[:, CENTRE_PAWNS] + params[1] * features[:, CENTRE_KNIGHTS])
+    return grad
+
+
+def fit_scale(params: np.ndarray, features: np.ndarray, results: np.ndarray) -> float:
+    """Texel's K: the score to probability scale that best fits the untuned weights"""
+    candidates = np.logspace(-4, 0, 81)
+    losses = [loss(params, features, results, k) for k in candidates]
+    return float(candidates[int(np.argmin(losses))])
+
+
+def tune(features: np.ndarray, results: np.ndarray, epochs: int, batch_size: int, learning_rate: float,
+         seed: int) -> np.ndarray:
+    params = initial_params()
+    k = fit_scale(params, features, results)
+    print("K = {:.5f}, initial loss {:.5f} over {} positions".format(k, loss(params, features, results, k),
+                                                                     len(results)))
+
+    # Adam, over shuffled minibatches; parameters differ in scale by orders of magnitude so steps are relative
+    rng = np.random.default_rng(seed)
+    scale = np.maximum(np.abs(params), 1e-3)
+    m = np.zeros_like(params)
+    v = np.zeros_like(params)
+    step = 0
+    for epoch in range(epochs):
+        order = rng.permutation(len(results))
+        for start in range(0, len(order), batch_size):
+            rows = order[start:start + batch_size]
+            grad = gradient(params, features[rows], results[rows], k) * scale
+
+            step += 1
+            m = 0.9 * m + 0.1 * grad
+            v = 0.999 * v + 0.001 * grad ** 2
+            m_hat = m / (1 - 0.9 ** step)
+            v_hat = v / (1 - 0.999 ** step)
+            params -= learning_rate * scale * m_hat / (np.sqrt(v_hat) + 1e-8)
+
+        if epoch % 10 == 9 or epoch == epochs - 1:
+            print("Epoch {}: loss {:.5f}".format(epoch + 1, loss(params, features, results, k)))
+
+    return params
+
+
+def load_features(args):
+    if os.path.exists(args.features):
+        data = np.load(args.features)
+        return data["features"], data["results"]
+
+    sources = []
+    if os.path.exists(args.puzzles):
+        sources.append(puzzle_positions(args.puzzles, args.puzzle_limit))
+    for pgn in args.pgn:
+        sources.append(pgn_positions(pgn, TuneConfig.PGN_MIN_PLY))
+    for directory in args.selfplay:
+        sources.append(selfplay_positions(directory))
+
+    def all_positions():
+        for source in sources:
+            yield from source
+
+    features, results = extract(all_positions(), args.chunk_size)
+    np.savez_compressed(args.features, features=features, results=results)
+    return features, results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Tune evaluate_complex weights on puzzle and self-play positions")
+    parser.add_argument("--puzzles", default=TuneConfig.PUZZLE_FILE)
+    parser.add_argument("--puzzle-limit", type=int, default=TuneConfig.PUZZLE_LIMIT)
+    parser.add_argument("--pgn", action="append", default=list(TuneConfig.PGN_FILES))
+    parser.add_argument("--selfplay", action="append", default=list(TuneConfig.SELFPLAY_DIRS))
+    parser.add_argument("--features", default=TuneConfig.FEATURE_FILE)
+    parser.add_argument("--chunk-size", type=int, default=TuneConfig.CHUNK_SIZE)
+    parser.add_argument("--epochs", type=int, default=TuneConfig.EPOCHS)
+    parser.add_argument("--batch-size", type=int, default=TuneConfig.BATCH_SIZE)
+    parser.add_argument("--learning-rate", type=float, default=TuneConfig.LEARNING_RATE)
+    parser.add_argument("--output", default=evaluate.EvalWeights.WEIGHTS_FILE)
+    args = parser.parse_args()
+
+    tune_features, tune_results = load_features(args)
+    if len(tune_results) == 0:
+        raise SystemExit("No positions to tune on")
+
+    tuned = tune(tune_features, tune_results, args.epochs, args.batch_size, args.learning_rate, TuneConfig.SEED)
+
+    for i, piece_type in enumerate(TUNED_PIECES):
+        evaluate.EvalWeights.PIECE_VALUES[piece_type] = round(float(tuned[i]), 2)
+    evaluate.EvalWeights.MOBILITY = round(float(tuned[MOBILITY]), 4)
+    evaluate.EvalWeights.KNIGHT_EDGE_PENALTY = round(float(tuned[KNIGHT_EDGE]), 2)
+    evaluate.EvalWeights.CENTRE_FRACTION = round(float(tuned[CENTRE]), 4)
+    evaluate.save_weights(args.output)
+    print("Saved {} to {}".format(evaluate.EvalWeights.PIECE_VALUES, args.output))